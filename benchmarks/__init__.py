@@ -0,0 +1,5 @@
+"""
+Performance benchmarks. They are not collected by the regular test run, execute them explicitly, e.g.:
+
+    pytest -s benchmarks/bench_indexes.py
+"""
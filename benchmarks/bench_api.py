@@ -0,0 +1,173 @@
+"""
+Time the main actions of the task and task group endpoints for users with a growing number of tasks, checking each
+action stays within its budget of queries. BENCH_SCALES sets the tasks per user (comma separated, 1000 and 10000 by
+default, up to 10^6 takes a few minutes to seed) and BENCH_REQUESTS the requests timed per action. Results are saved as
+JSON to BENCH_RESULTS (benchmarks/results/api-<time>.json by default), to compare runs with benchmarks/compare.py.
+"""
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import django
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from benchmarks.loadgen import percentile
+from conftest import create_user
+from taskinator.models import Task, TaskCounter, TaskGroup
+from utils.datetime import utc_now
+from utils.viewsets import ListCacheMixin
+
+
+# Allow db usage for all benchmarks within this module
+pytestmark = pytest.mark.django_db
+
+SCALES = [int(scale) for scale in os.environ.get('BENCH_SCALES', '1000,10000').split(',')]
+REQUESTS = int(os.environ.get('BENCH_REQUESTS', '20'))
+RESULTS = os.environ.get(
+    'BENCH_RESULTS', str(Path(__file__).parent / 'results' / f'api-{time.strftime("%Y%m%d-%H%M%S")}.json')
+)
+GROUPS = 20
+BATCH_SIZE = 5000
+SAVEPOINTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+def seed(user, count):
+    """Bulk insert count tasks for the user spread over GROUPS groups, a fifth of them finished, and their counters."""
+    groups = TaskGroup.objects.bulk_create(TaskGroup(name=f'Group {i}', user=user) for i in range(GROUPS))
+    groups = list(TaskGroup.objects.filter(user=user).order_by('id')) if groups[0].pk is None else groups
+    now = utc_now()
+    today = date.today()
+    for start in range(0, count, BATCH_SIZE):
+        Task.objects.bulk_create(
+            Task(
+                name=f'Task {i}', user=user, group=groups[i % GROUPS] if i % 3 else None,
+                description=f'Description of task {i}' if i % 2 else None, created_at=now - timedelta(minutes=i),
+                due_date=today + timedelta(days=i % 60 - 30) if i % 4 else None,
+                finished_at=now - timedelta(minutes=i // 2) if i % 5 == 0 else None,
+            )
+            for i in range(start, min(start + BATCH_SIZE, count))
+        )
+    # Bulk inserts skip the signals keeping the counters, so count them as the migration creating them does
+    for group in [None, *groups]:
+        tasks = Task.objects.filter(user=user, group=group)
+        TaskCounter.objects.create(
+            user=user, group=group, open_count=tasks.filter(finished_at__isnull=True).count(),
+            done_count=tasks.filter(finished_at__isnull=False).count(),
+        )
+    return groups
+
+
+def actions(user, groups):
+    """
+    (viewset, action, method, url, data, query budget) of the actions timed. Data may be a function getting the
+    request number, for writes. Budgets count every query but authentication, cached after the first request.
+    """
+    task_ids = iter(Task.objects.filter(user=user, finished_at__isnull=True).values_list('id', flat=True))
+    week_ago = (utc_now() - timedelta(days=7)).strftime('%Y-%m-%dT%H:%MZ')
+    yesterday = (utc_now() - timedelta(days=1)).strftime('%Y-%m-%dT%H:%MZ')
+    return [
+        ('TaskViewSet', 'list', 'get', '/api/tasks/', None, 2),
+        ('TaskViewSet', 'list cursor', 'get', '/api/tasks/?pagination=cursor', None, 1),
+        ('TaskViewSet', 'list expanded', 'get', '/api/tasks/?expand=group', None, 2),
+        ('TaskViewSet', 'filter unfinished', 'get', '/api/tasks/?finished=false', None, 2),
+        ('TaskViewSet', 'filter date range', 'get', f'/api/tasks/?date__gte={week_ago}&date__lt={yesterday}', None, 2),
+        ('TaskViewSet', 'search', 'get', '/api/tasks/?search=task 12', None, 2),
+        ('TaskViewSet', 'retrieve', 'get', f'/api/tasks/{next(task_ids)}/', None, 1),
+        ('TaskViewSet', 'create', 'post', '/api/tasks/', lambda i: {'name': f'New task {i}'}, 2),
+        ('TaskViewSet', 'complete', 'post', lambda i: f'/api/tasks/{next(task_ids)}/complete/', None, 4),
+        ('TaskGroupViewSet', 'list', 'get', '/api/task-groups/', None, 2),
+        ('TaskGroupViewSet', 'retrieve', 'get', f'/api/task-groups/{groups[0].pk}/', None, 1),
+        ('TaskGroupViewSet', 'stats', 'get', '/api/task-groups/stats/', None, 3),
+        ('TaskGroupViewSet', 'board', 'get', '/api/task-groups/board/', None, 2),
+        ('TaskGroupViewSet', 'create', 'post', '/api/task-groups/', lambda i: {'name': f'New group {i}'}, 1),
+    ]
+
+
+def request(client, method, url, data, number):
+    """Send a request of an action, building its url and data for the request number if needed."""
+    url = url(number) if callable(url) else url
+    data = data(number) if callable(data) else data
+    response = getattr(client, method)(url, data=data, format='json')
+    assert response.status_code < 300, response.content
+    return response
+
+
+def time_action(client, method, url, data):
+    """Queries of a request once warmed up, and milliseconds taken by each of the next REQUESTS requests."""
+    request(client, method, url, data, 0)
+    with CaptureQueriesContext(connection) as queries:
+        request(client, method, url, data, 1)
+    # Read them now, as the query log is cleared when the next request starts. Savepoints are left out, as they're
+    # only there because each benchmark runs in a transaction
+    statements = [query['sql'] for query in queries.captured_queries if not query['sql'].startswith(SAVEPOINTS)]
+    milliseconds = []
+    for number in range(2, REQUESTS + 2):
+        start = time.perf_counter()
+        request(client, method, url, data, number)
+        milliseconds.append((time.perf_counter() - start) * 1000)
+    return len(statements), sorted(milliseconds)
+
+
+def seeded_client(scale):
+    """Client of a new user seeded with this many tasks, its token already cached. Also gets the user and groups."""
+    user = create_user(f'Bench {scale}')
+    start = time.perf_counter()
+    groups = seed(user, scale)
+    print(f'\n{scale} tasks seeded in {time.perf_counter() - start:.1f}s')
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+    client.get('/api/')
+    return client, user, groups
+
+
+def benchmark_scale(scale):
+    """Seed a user with this many tasks and time every action for them. Get their results."""
+    client, user, groups = seeded_client(scale)
+    results = []
+    for viewset, action, method, url, data, budget in actions(user, groups):
+        queries, milliseconds = time_action(client, method, url, data)
+        median, p95 = statistics.median(milliseconds), percentile(milliseconds, 0.95)
+        results.append({
+            'scale': scale, 'viewset': viewset, 'action': action, 'queries': queries, 'query_budget': budget,
+            'median_ms': round(median, 3), 'p95_ms': round(p95, 3),
+        })
+        print(f'{viewset} {action}: {median:.1f}ms median, {p95:.1f}ms p95, {queries}/{budget} queries')
+    return results
+
+
+def save_results(results):
+    """Write the results with the environment they were measured in."""
+    path = Path(RESULTS)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({
+        'environment': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'python': platform.python_version(),
+            'django': django.get_version(), 'sqlite': sqlite3.sqlite_version, 'machine': platform.machine(),
+            'requests': REQUESTS,
+        },
+        'results': results,
+    }, indent=2), encoding='utf-8')
+    return path
+
+
+def test_api_actions(monkeypatch):
+    """Print the median and 95th percentile milliseconds of every action at every scale, within their query budgets."""
+    # Measure the database path, not the list cache
+    monkeypatch.setattr(ListCacheMixin, 'get_list_cache_scope', lambda self: None)
+    results = [result for scale in SCALES for result in benchmark_scale(scale)]
+    print(f'Results saved to {save_results(results)}')
+    over_budget = [
+        f'{result["viewset"]} {result["action"]} at {result["scale"]} tasks: {result["queries"]} queries, '
+        f'budget {result["query_budget"]}'
+        for result in results if result['queries'] > result['query_budget']
+    ]
+    assert not over_budget
@@ -0,0 +1,83 @@
+"""
+Compare the throughput of the sync API with the async views under concurrent load, through the ASGI application as
+daphne runs it. BENCH_DB_LATENCY adds milliseconds to every query, to model a database across the network.
+"""
+import asyncio
+import os
+import time
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db.backends import utils as backend_utils
+from rest_framework.authtoken.models import Token
+
+from taskinator.models import Task
+from todo_challenge.asgi import application
+from utils.viewsets import ListCacheMixin
+
+
+TASKS = int(os.environ.get('BENCH_TASKS', '200'))
+REQUESTS = int(os.environ.get('BENCH_REQUESTS', '200'))
+CONCURRENCY = int(os.environ.get('BENCH_CONCURRENCY', '20'))
+DB_LATENCY = float(os.environ.get('BENCH_DB_LATENCY', '5')) / 1000
+
+
+async def asgi_get(path, headers):
+    """Send a GET request to the ASGI application and get the response status."""
+    path, _, query_string = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query_string.encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver'), *headers], 'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]['status']
+
+
+async def load(path, headers):
+    """Send REQUESTS requests, CONCURRENCY at a time. Get the requests per second."""
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def limited_get():
+        async with semaphore:
+            return await asgi_get(path, headers)
+
+    start = time.perf_counter()
+    statuses = await asyncio.gather(*(limited_get() for _ in range(REQUESTS)))
+    seconds = time.perf_counter() - start
+    assert set(statuses) == {200}
+    return REQUESTS / seconds
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_views_throughput(user, monkeypatch):
+    """
+    Print requests per second of the sync and async versions of the list and retrieve actions. Async views must be
+    faster, which they aren't if any middleware is sync only and runs them all in a single thread.
+    """
+    Task.objects.bulk_create(Task(name=f'Task {i}', user=user) for i in range(TASKS))
+    task_id = Task.objects.values_list('id', flat=True).first()
+    headers = [(b'authorization', f'Token {Token.objects.create(user=user).key}'.encode())]
+    # Measure the database path, not the list cache
+    monkeypatch.setattr(ListCacheMixin, 'get_list_cache_scope', lambda self: None)
+    execute = backend_utils.CursorWrapper.execute
+
+    def slow_execute(self, sql, params=None):
+        time.sleep(DB_LATENCY)
+        return execute(self, sql, params)
+
+    monkeypatch.setattr(backend_utils.CursorWrapper, 'execute', slow_execute)
+    print(f'\n{REQUESTS} requests, {CONCURRENCY} concurrent, {DB_LATENCY * 1000:.0f}ms per query')
+    for path in ('tasks/', f'tasks/{task_id}/', 'task-groups/'):
+        sync_rate = async_to_sync(load)(f'/api/{path}', headers)
+        async_rate = async_to_sync(load)(f'/api/async/{path}', headers)
+        print(f'{path}: {sync_rate:.0f} req/s sync, {async_rate:.0f} req/s async, {async_rate / sync_rate:.1f}x')
+        assert async_rate > sync_rate
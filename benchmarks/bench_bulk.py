@@ -0,0 +1,56 @@
+"""
+Compare importing tasks one POST at a time with a single request to the bulk endpoints.
+"""
+import os
+import time
+
+import pytest
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from taskinator.models import Task
+
+
+# Allow db usage for all benchmarks within this module
+pytestmark = pytest.mark.django_db
+
+TASKS = int(os.environ.get('BENCH_TASKS', '2000'))
+
+
+def timed(function):
+    """Run the function and get how long it took, in seconds."""
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def test_bulk_import(user):
+    """Print the time it takes to create and complete TASKS tasks through each path."""
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+
+    def create_one_by_one():
+        for i in range(TASKS):
+            client.post('/api/tasks/', data={'name': f'Single {i}'}, format='json')
+
+    def complete_one_by_one():
+        for task_id in Task.objects.filter(name__startswith='Single').values_list('id', flat=True):
+            client.post(f'/api/tasks/{task_id}/complete/')
+
+    def create_in_bulk():
+        response = client.post('/api/tasks/bulk/', data=[{'name': f'Bulk {i}'} for i in range(TASKS)], format='json')
+        assert response.status_code == 201
+
+    def complete_in_bulk():
+        ids = list(Task.objects.filter(name__startswith='Bulk').values_list('id', flat=True))
+        assert client.post('/api/tasks/bulk/complete/', data=ids, format='json').data['count'] == TASKS
+
+    print(f'\n{TASKS} tasks')
+    for label, single, bulk in (
+        ('create', create_one_by_one, create_in_bulk),
+        ('complete', complete_one_by_one, complete_in_bulk),
+    ):
+        single_seconds, bulk_seconds = timed(single), timed(bulk)
+        print(f'{label}: {single_seconds:.2f}s one by one, {bulk_seconds:.2f}s in bulk, '
+              f'{single_seconds / bulk_seconds:.0f}x faster')
+    assert Task.objects.filter(finished_at__isnull=False).count() == 2 * TASKS
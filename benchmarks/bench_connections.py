@@ -0,0 +1,63 @@
+"""
+Compare the database connection overhead per request of connecting every time (the default CONN_MAX_AGE = 0),
+persistent connections and the connection pool. BENCH_CONNECT_LATENCY adds milliseconds to opening each connection,
+to model the network round trips and authentication of a database server.
+"""
+import os
+import time
+
+import pytest
+from django.db.backends.sqlite3 import base
+from django.db.utils import ConnectionHandler
+
+from utils.db.pool import close_pools
+
+
+# Allow db usage for all benchmarks within this module
+pytestmark = pytest.mark.django_db
+
+REQUESTS = int(os.environ.get('BENCH_REQUESTS', '2000'))
+CONNECT_LATENCY = float(os.environ.get('BENCH_CONNECT_LATENCY', '2')) / 1000
+
+
+def request_cycle(database):
+    """What a request does with its connection: connect if needed, run a query and close it if it's due."""
+    database.close_if_unusable_or_obsolete()
+    with database.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    database.close_if_unusable_or_obsolete()
+
+
+def seconds_per_request(settings_dict):
+    """Average seconds a request cycle takes with these database settings."""
+    database = ConnectionHandler({'default': settings_dict})['default']
+    request_cycle(database)
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        request_cycle(database)
+    seconds = time.perf_counter() - start
+    database.close()
+    return seconds / REQUESTS
+
+
+def test_connection_overhead(tmp_path, monkeypatch):
+    """Print the time per request of each way of handling connections."""
+    get_new_connection = base.DatabaseWrapper.get_new_connection
+
+    def slow_get_new_connection(self, conn_params):
+        time.sleep(CONNECT_LATENCY)
+        return get_new_connection(self, conn_params)
+
+    monkeypatch.setattr(base.DatabaseWrapper, 'get_new_connection', slow_get_new_connection)
+    name = str(tmp_path / 'db.sqlite3')
+    timings = {
+        'connect per request': seconds_per_request({'ENGINE': 'django.db.backends.sqlite3', 'NAME': name}),
+        'persistent': seconds_per_request({'ENGINE': 'django.db.backends.sqlite3', 'NAME': name, 'CONN_MAX_AGE': 600}),
+        'pooled': seconds_per_request({
+            'ENGINE': 'utils.db.pooled', 'NAME': name, 'POOL': {'BACKEND': 'django.db.backends.sqlite3'},
+        }),
+    }
+    close_pools()
+    print(f'\n{REQUESTS} requests, {CONNECT_LATENCY * 1000:.0f}ms to connect')
+    for label, seconds in timings.items():
+        print(f'{label}: {seconds * 1e6:.0f}us per request')
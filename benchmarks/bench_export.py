@@ -0,0 +1,60 @@
+"""
+Check the export endpoint streams: peak memory must not grow with the number of tasks and the first bytes must go out
+long before the last ones.
+"""
+import os
+import time
+import tracemalloc
+
+import pytest
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from taskinator.models import Task
+
+
+# Allow db usage for all benchmarks within this module
+pytestmark = pytest.mark.django_db
+
+TASKS = int(os.environ.get('BENCH_TASKS', '10000'))
+
+
+def seed(user, count):
+    """Bulk insert tasks until the user has count of them."""
+    existing = Task.objects.filter(user=user).count()
+    Task.objects.bulk_create(
+        (Task(name=f'Task {i}', description=f'Description {i}', user=user) for i in range(existing, count)),
+        batch_size=1000,
+    )
+
+
+def consume(response):
+    """Read the whole stream, keeping nothing but its size. Get (bytes, seconds to first chunk, seconds in total)."""
+    start = time.perf_counter()
+    first_chunk = None
+    size = 0
+    for chunk in response.streaming_content:
+        if chunk and first_chunk is None:
+            first_chunk = time.perf_counter() - start
+        size += len(chunk)
+    return size, first_chunk, time.perf_counter() - start
+
+
+def test_export_memory(user):
+    """Print the peak memory used streaming TASKS and ten times TASKS tasks, in both formats."""
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+    peaks = {}
+    for count in (TASKS, TASKS * 10):
+        seed(user, count)
+        for export_format in ('ndjson', 'csv'):
+            tracemalloc.start()
+            size, first_chunk, total = consume(client.get('/api/tasks/export/', data={'format': export_format}))
+            peaks[count, export_format] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f'\n{count} tasks as {export_format}: {size / 2 ** 20:.1f}MiB streamed, '
+                  f'peak memory {peaks[count, export_format] / 2 ** 20:.1f}MiB, '
+                  f'first chunk after {first_chunk * 1000:.0f}ms, done after {total:.2f}s', end='')
+    print()
+    for export_format in ('ndjson', 'csv'):
+        assert peaks[TASKS * 10, export_format] < peaks[TASKS, export_format] * 2
@@ -0,0 +1,72 @@
+"""
+Compare the throughput of list endpoints rendered by the serializers with the one of rendering values_list() rows.
+"""
+import os
+import timeit
+from datetime import date, timedelta
+
+import pytest
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from taskinator.models import Task, TaskGroup
+from taskinator.views import TaskGroupViewSet, TaskViewSet
+from utils.datetime import utc_now
+from utils.viewsets import ListCacheMixin
+
+
+# Allow db usage for all benchmarks within this module
+pytestmark = pytest.mark.django_db
+
+TASKS = int(os.environ.get('BENCH_TASKS', '2000'))
+REQUESTS = int(os.environ.get('BENCH_REQUESTS', '50'))
+URLS = (
+    '/api/tasks/',
+    '/api/tasks/?pagination=cursor&finished=false',
+    '/api/tasks/?fields=id,name,finished_at',
+    '/api/tasks/?expand=group',
+    '/api/task-groups/',
+)
+
+
+def seed(user):
+    """Bulk insert TASKS tasks spread over a few groups, with every field filled in for some of them."""
+    groups = [TaskGroup.objects.create(name=f'Group {i}', user=user) for i in range(10)]
+    now = utc_now()
+    Task.objects.bulk_create(
+        (
+            Task(
+                name=f'Task {i}', user=user, group=groups[i % 10] if i % 2 else None,
+                description=f'Description {i}' if i % 3 else None,
+                due_date=date.today() + timedelta(days=i % 30) if i % 4 else None,
+                finished_at=now - timedelta(minutes=i) if i % 5 == 0 else None,
+            )
+            for i in range(TASKS)
+        ),
+        batch_size=1000,
+    )
+
+
+def requests_per_second(client, url):
+    """Best throughput of a few rounds of REQUESTS requests to the url."""
+    seconds = min(timeit.repeat(lambda: client.get(url), number=REQUESTS, repeat=3))
+    return REQUESTS / seconds
+
+
+def test_fast_list_rendering_throughput(user, monkeypatch):
+    """Print requests per second for each url with and without fast_list_rendering, checking they render the same."""
+    # Measure rendering, not the list cache
+    monkeypatch.setattr(ListCacheMixin, 'get_list_cache_scope', lambda self: None)
+    seed(user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+    print(f'\n{TASKS} tasks, {REQUESTS} requests per round')
+    for url in URLS:
+        results = {}
+        for fast in (False, True):
+            monkeypatch.setattr(TaskViewSet, 'fast_list_rendering', fast)
+            monkeypatch.setattr(TaskGroupViewSet, 'fast_list_rendering', fast)
+            results[fast] = (client.get(url).content, requests_per_second(client, url))
+        assert results[True][0] == results[False][0]
+        print(f'{url}: {results[False][1]:.0f} req/s serializers, {results[True][1]:.0f} req/s rows, '
+              f'{results[True][1] / results[False][1]:.1f}x')
@@ -0,0 +1,65 @@
+"""
+Compare the overhead of FilterableViewSetMixin.get_queryset applying each filter in sequence with merging the lookup
+filters into a single compiled Q, with the filters of TaskViewSet and a few query strings. The queryset is built but not
+run, and the other mixins of TaskViewSet are left out so the filtering stage is measured alone.
+"""
+import os
+import timeit
+
+import pytest
+from rest_framework.generics import GenericAPIView
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from taskinator.models import Task
+from taskinator.views import TaskViewSet
+from utils.viewsets import FilterableViewSetMixin
+
+
+# Allow db usage for all benchmarks within this module
+pytestmark = pytest.mark.django_db
+
+ROUNDS = int(os.environ.get('BENCH_ROUNDS', '5000'))
+QUERIES = (
+    {},
+    {'finished': 'false'},
+    {'date__gte': '2021-01-01T00:00Z', 'date__lt': '2021-02-01T00:00Z'},
+    {'date__gte': '2021-01-01T00:00Z', 'date__lt': '2021-02-01T00:00Z', 'finished_at__gt': '2021-01-15T00:00Z',
+     'finished': 'true'},
+)
+
+
+class FilteredTasksView(FilterableViewSetMixin, GenericAPIView):
+    """View filtering tasks like TaskViewSet."""
+    queryset = Task.objects.all()
+    filters = TaskViewSet.filters
+
+
+def sequential_get_queryset(self):
+    """FilterableViewSetMixin.get_queryset calling every filter in turn, each one filtering the queryset on its own."""
+    queryset = super(FilterableViewSetMixin, self).get_queryset()  # pylint: disable=bad-super-call
+    for queryset_filter in self.filters:
+        queryset = queryset_filter(queryset, self.request)
+    return queryset
+
+
+def microseconds_per_call(user, query):
+    """Best average microseconds of a few rounds of building the queryset for a query string. Also gets its SQL."""
+    request = Request(APIRequestFactory().get('/api/tasks/', query))
+    request.user = user
+    view = FilteredTasksView(request=request)
+    seconds = min(timeit.repeat(view.get_queryset, number=ROUNDS, repeat=3))
+    return str(view.get_queryset().query), seconds / ROUNDS * 1e6
+
+
+def test_filters_overhead(user, monkeypatch):
+    """Print microseconds per get_queryset with sequential and compiled filters, checking they build the same SQL."""
+    print(f'\n{ROUNDS} calls per round')
+    for query in QUERIES:
+        compiled_sql, compiled = microseconds_per_call(user, query)
+        with monkeypatch.context() as patch:
+            patch.setattr(FilterableViewSetMixin, 'get_queryset', sequential_get_queryset)
+            sequential_sql, sequential = microseconds_per_call(user, query)
+        assert compiled_sql == sequential_sql
+        print(f'{sorted(query)}: {sequential:.0f}us sequential, {compiled:.0f}us compiled, '
+              f'{sequential / compiled:.2f}x')
@@ -0,0 +1,108 @@
+"""
+Compare query plans and timings of the per-user filter paths with and without the composite Task indexes.
+"""
+import os
+import timeit
+from datetime import date, timedelta
+
+import pytest
+from django.db import connection
+
+from conftest import create_user
+from taskinator.models import Task
+from utils.datetime import utc_now
+
+
+# Allow db usage for all benchmarks within this module
+pytestmark = pytest.mark.django_db
+
+TASKS_PER_USER = int(os.environ.get('BENCH_TASKS', '20000'))
+USERS = int(os.environ.get('BENCH_USERS', '5'))
+REPEAT = 5
+
+
+def seed(users):
+    """Bulk insert tasks for every user, a third of them finished and most of them with a due date."""
+    now = utc_now()
+    today = date.today()
+    for user in users:
+        Task.objects.bulk_create(
+            (
+                Task(
+                    name=f'Task {i}', user=user, created_at=now - timedelta(minutes=i),
+                    due_date=today + timedelta(days=i % 60 - 30) if i % 4 else None,
+                    finished_at=now - timedelta(minutes=i // 2) if i % 3 == 0 else None,
+                )
+                for i in range(TASKS_PER_USER)
+            ),
+            batch_size=1000,
+        )
+
+
+def filter_paths(user):
+    """The querysets TaskViewSet builds for the most common query strings."""
+    now = utc_now()
+    tasks = Task.objects.filter(user=user)
+    return {
+        '?finished=false': tasks.filter(finished_at__isnull=True),
+        '?finished=true': tasks.filter(finished_at__isnull=False),
+        '?date__gte=<1h ago>': tasks.filter(created_at__gte=now - timedelta(hours=1)),
+        '?finished_at__gte=<1h ago>': tasks.filter(finished_at__gte=now - timedelta(hours=1)),
+        'overdue': tasks.filter(finished_at__isnull=True, due_date__lt=date.today()),
+    }
+
+
+def explain(queryset, phase):
+    """
+    Get the query plan as a single line. Built by hand instead of using QuerySet.explain so the phase can be added as
+    a comment: the SQLite driver caches statements by text and would otherwise report the plan from before the DDL.
+    """
+    sql, params = queryset.query.sql_with_params()
+    prefix = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+    with connection.cursor() as cursor:
+        cursor.execute(f'{prefix} {sql} /* {phase} */', params)
+        return ' | '.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+
+def best_time(function):
+    """Best of REPEAT timings, in milliseconds."""
+    return min(timeit.repeat(function, number=1, repeat=REPEAT)) * 1000
+
+
+def measure(paths, phase):
+    """
+    Time the two queries a PageNumberPagination list runs (COUNT and first page) and get the access path of the
+    filter itself, which is what the COUNT query plan uses.
+    """
+    results = {}
+    for label, queryset in paths.items():
+        results[label] = (
+            explain(queryset.order_by(), phase),
+            best_time(queryset.all().count),
+            best_time(lambda queryset=queryset: list(queryset.all()[:50])),
+        )
+    return results
+
+
+def test_composite_indexes_query_plans():
+    """Print plans and timings before and after dropping the composite indexes from the Task table."""
+    users = [create_user(f'Bench user {i}') for i in range(USERS)]
+    seed(users)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE' if connection.vendor != 'postgresql' else 'ANALYZE taskinator_task')
+    paths = filter_paths(users[0])
+    with_indexes = measure(paths, 'with composite indexes')
+    with connection.cursor() as cursor:
+        for index in Task._meta.indexes:  # pylint: disable=protected-access
+            cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+    without_indexes = measure(paths, 'without composite indexes')
+
+    print(f'\n{TASKS_PER_USER} tasks per user, {USERS} users, {connection.vendor}')
+    for label, (plan, count_ms, page_ms) in with_indexes.items():
+        old_plan, old_count_ms, old_page_ms = without_indexes[label]
+        print(f'\n{label}: count {old_count_ms:.2f}ms -> {count_ms:.2f}ms, page {old_page_ms:.2f}ms -> {page_ms:.2f}ms')
+        print(f'  before: {old_plan}')
+        print(f'  after:  {plan}')
+        index_names = [index.name for index in Task._meta.indexes]  # pylint: disable=protected-access
+        assert any(name in plan for name in index_names)
+        assert not any(name in old_plan for name in index_names)
@@ -0,0 +1,58 @@
+"""
+Compare two result files of benchmarks/bench_api.py, printing the change of every action. Exits with 1 if any action got
+slower than the threshold (10% by default) or makes more queries than before, e.g.:
+
+    python benchmarks/compare.py benchmarks/results/api-before.json benchmarks/results/api-after.json
+"""
+import argparse
+import json
+import sys
+
+
+def load_results(path):
+    """Results of a file, by (scale, viewset, action)."""
+    with open(path, encoding='utf-8') as results:
+        return {
+            (result['scale'], result['viewset'], result['action']): result for result in json.load(results)['results']
+        }
+
+
+def compare(baseline, current, threshold):
+    """Lines describing every action measured in both runs, and those of the actions that regressed."""
+    lines = []
+    regressions = []
+    for key in sorted(baseline.keys() & current.keys()):
+        before, after = baseline[key], current[key]
+        change = after['median_ms'] / before['median_ms'] - 1 if before['median_ms'] else 0
+        line = (
+            f'{key[1]} {key[2]} at {key[0]} tasks: {before["median_ms"]:.1f}ms -> {after["median_ms"]:.1f}ms '
+            f'({change:+.0%}), {before["queries"]} -> {after["queries"]} queries'
+        )
+        lines.append(line)
+        if change > threshold or after['queries'] > before['queries']:
+            regressions.append(line)
+    return lines, regressions
+
+
+def parse_args(args):
+    """Command line options."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('baseline', help='Results to compare against.')
+    parser.add_argument('current', help='Results of the change.')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Slowdown of the median tolerated, 0.1 is 10%%.')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    """Print the comparison, and the regressions if any."""
+    options = parse_args(args)
+    lines, regressions = compare(load_results(options.baseline), load_results(options.current), options.threshold)
+    print('\n'.join(lines))
+    if regressions:
+        print('\nRegressions:\n' + '\n'.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+Standalone load generator for the API served by daphne (or any HTTP/1.1 server). Keeps --concurrency keep-alive
+connections busy sending GET requests to the paths given, round robin, and prints throughput, latency percentiles and
+status codes. Needs no dependencies beyond the standard library, e.g.:
+
+    poetry run daphne -b 127.0.0.1 -p 8000 todo_challenge.asgi:application
+    python benchmarks/loadgen.py --token <key> --requests 5000 --concurrency 50 /api/tasks/ /api/task-groups/
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+
+async def read_response(reader):
+    """Read a response, sized by Content-Length or chunked. Get its status and whether the connection is kept alive."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed by the server')
+    version, status = status_line.split()[:2]
+    headers = {}
+    line = await reader.readline()
+    while line not in (b'\r\n', b'\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+        line = await reader.readline()
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        size = int((await reader.readline()).split(b';')[0], 16)
+        while size:
+            await reader.readexactly(size + 2)
+            size = int((await reader.readline()).split(b';')[0], 16)
+        await reader.readline()
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        return int(status), False
+    connection = headers.get('connection', '').lower()
+    return int(status), connection == 'keep-alive' if version == b'HTTP/1.0' else connection != 'close'
+
+
+def percentile(values, fraction):
+    """Nearest rank percentile of sorted values, e.g. fraction 0.99 for the 99th percentile."""
+    return values[max(0, min(len(values) - 1, round(fraction * len(values)) - 1))]
+
+
+class LoadGenerator:
+    """Send requests from many connections at once, recording the latency and status of every response."""
+    def __init__(self, url, headers, paths, requests):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.headers = ''.join(f'{name}: {value}\r\n' for name, value in {'Host': parts.netloc, **headers}.items())
+        self.paths = paths
+        self.remaining = requests
+        self.latencies = []
+        self.statuses = Counter()
+
+    def next_path(self):
+        """Path of the next request to send, or None once they're all sent."""
+        if self.remaining <= 0:
+            return None
+        self.remaining -= 1
+        return self.paths[self.remaining % len(self.paths)]
+
+    async def connection(self):
+        """Send requests one after another over a keep-alive connection, reconnecting if the server closes it."""
+        reader = writer = None
+        path = self.next_path()
+        while path is not None:
+            reused = writer is not None
+            if not reused:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            start = time.perf_counter()
+            writer.write(f'GET {path} HTTP/1.1\r\n{self.headers}\r\n'.encode())
+            try:
+                status, keep_alive = await read_response(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                reader = writer = None
+                if reused:
+                    # The server closed the idle connection before getting the request, send it again
+                    continue
+                status, keep_alive = 'error', False
+            self.latencies.append(time.perf_counter() - start)
+            self.statuses[status] += 1
+            if not keep_alive and writer is not None:
+                writer.close()
+                reader = writer = None
+            path = self.next_path()
+        if writer is not None:
+            writer.close()
+
+    async def run(self, concurrency):
+        """Send every request with this many connections. Get the seconds it took."""
+        start = time.perf_counter()
+        await asyncio.gather(*(self.connection() for _ in range(concurrency)))
+        return time.perf_counter() - start
+
+    def summary(self, seconds, concurrency):
+        """Throughput, latency percentiles in milliseconds and statuses of the run."""
+        milliseconds = sorted(latency * 1000 for latency in self.latencies)
+        return {
+            'requests': len(milliseconds), 'concurrency': concurrency, 'seconds': round(seconds, 3),
+            'requests_per_second': round(len(milliseconds) / seconds, 1),
+            'latency_ms': {
+                'p50': round(percentile(milliseconds, 0.5), 2), 'p90': round(percentile(milliseconds, 0.9), 2),
+                'p99': round(percentile(milliseconds, 0.99), 2), 'max': round(milliseconds[-1], 2),
+            },
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items(), key=str)},
+        }
+
+
+def parse_args(args):
+    """Command line options."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', maxsplit=1)[0])
+    parser.add_argument('paths', nargs='*', default=['/api/tasks/'], help='Paths to request, round robin.')
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='Where the server listens.')
+    parser.add_argument('--token', help='DRF token key to authenticate with.')
+    parser.add_argument('--requests', type=int, default=1000, help='Requests to send in total.')
+    parser.add_argument('--concurrency', type=int, default=20, help='Connections sending requests at once.')
+    parser.add_argument('--json', help='File to save the summary to, as JSON.')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    """Run the load generator and print its summary."""
+    options = parse_args(args)
+    headers = {'Accept': 'application/json'}
+    if options.token:
+        headers['Authorization'] = f'Token {options.token}'
+    generator = LoadGenerator(options.url, headers, options.paths, options.requests)
+    # Not asyncio.run, which needs Python 3.7
+    loop = asyncio.new_event_loop()
+    try:
+        seconds = loop.run_until_complete(generator.run(options.concurrency))
+    finally:
+        loop.close()
+    summary = generator.summary(seconds, options.concurrency)
+    print(json.dumps(summary, indent=2))
+    if options.json:
+        with open(options.json, 'w', encoding='utf-8') as output:
+            json.dump(summary, output, indent=2)
+    return 0 if set(generator.statuses) <= {200, 304} else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
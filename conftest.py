@@ -3,8 +3,9 @@ Useful things stored apart for testing, as pytest encourages.
 """
 import pytest
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 
-from taskinator.models import Task, TaskGroup
+from taskinator.models import Task, TaskGroup, TaskTombstone
 
 
 # Allow db usage for all tests within this module
@@ -48,8 +49,15 @@ def task_group(user):  # pylint:disable=redefined-outer-name
 
 @pytest.fixture(autouse=True, scope='function')
 def clean_db():
-    """Delete both tasks and users after every test."""
+    """Delete tasks, task groups, users and tombstones after every test."""
     yield
     Task.objects.all().delete()
     TaskGroup.objects.all().delete()
     User.objects.all().delete()
+    TaskTombstone.objects.all().delete()
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    """Clear the cache before every test, as it outlives the database records it holds data about."""
+    cache.clear()
@@ -8,3 +8,12 @@ class TaskinatorConfig(AppConfig):
     """Django app configuration."""
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'taskinator'
+
+    def ready(self):
+        """Connect the signal receivers keeping caches up to date."""
+        # Imported here as they need the models to be loaded
+        # pylint: disable=import-outside-toplevel
+        from taskinator.signals import connect_signals
+        from utils.authentication import install_token_cache_invalidation
+        connect_signals()
+        install_token_cache_invalidation()
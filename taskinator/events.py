@@ -0,0 +1,51 @@
+"""
+Real-time feed of the changes to the tasks and task groups of each user.
+"""
+from urllib.parse import parse_qs
+
+from django.db import transaction
+from rest_framework.exceptions import AuthenticationFailed
+
+from utils.asgi import DatabaseSyncToAsync, ServerSentEventsApp
+from utils.authentication import CachedTokenAuthentication
+from utils.pubsub import get_broker
+
+
+def user_channel(user_id):
+    """Broker channel of the changes made to a user's tasks and task groups."""
+    return f'user:{user_id}'
+
+
+def publish_change(model, action, user_id, ids=None):
+    """
+    Publish that objects of a model were created, updated, completed or deleted (action) once the current transaction
+    commits. ids is None when they're not known, e.g. after a bulk_create on databases which don't return them.
+    """
+    data = {'model': model._meta.model_name, 'action': action, 'ids': ids}  # pylint: disable=protected-access
+    transaction.on_commit(lambda: get_broker().publish(user_channel(user_id), data))
+
+
+def authenticate(key):
+    """Get the user of a token, or None if it isn't valid."""
+    try:
+        user, _ = CachedTokenAuthentication().authenticate_credentials(key)
+    except AuthenticationFailed:
+        return None
+    return user
+
+
+async def get_user_channel(scope):
+    """
+    Channel of the user authenticated by the request. The token is taken from the Authorization header, or from
+    the token query param for clients which can't set headers, like browsers' EventSource.
+    """
+    keyword, _, key = dict(scope['headers']).get(b'authorization', b'').decode().partition(' ')
+    if keyword != CachedTokenAuthentication.keyword:
+        key = parse_qs(scope.get('query_string', b'').decode()).get('token', [''])[0]
+    if not key:
+        return None
+    user = await DatabaseSyncToAsync(authenticate)(key)
+    return None if user is None else user_channel(user.pk)
+
+
+change_feed = ServerSentEventsApp(get_user_channel)
@@ -0,0 +1,246 @@
+"""
+Bulk loading of tasks from CSV or NDJSON files, e.g. to onboard a user with the tasks they had somewhere else.
+"""
+import csv
+import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pytz
+from django.db import transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_date, parse_datetime
+
+from taskinator.models import Task, TaskCounter, TaskGroup
+from taskinator.signals import objects_changed
+from utils.datetime import utc_now
+from utils.renderers import chunked
+
+
+FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+CONFLICT_POLICIES = ('error', 'skip', 'update')
+# Written to existing tasks by the update policy
+UPDATED_FIELDS = ('description', 'due_date', 'finished_at', 'updated_at')
+
+
+def read_records(stream, file_format):
+    """
+    (line number, record) of every record of a file: dicts for CSV, lines for NDJSON, which are decoded by parse_chunk
+    along with the rest of the parsing.
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        return ((reader.line_num, record) for record in reader)
+    return ((number, line) for number, line in enumerate(stream, 1) if line.strip())
+
+
+def parse_optional(record, field, parse):
+    """Value of an optional field of a record, None if missing or empty. Raises ValueError if it can't be parsed."""
+    value = record.get(field)
+    if value in (None, ''):
+        return None
+    parsed = parse(str(value))
+    if parsed is None:
+        raise ValueError(f'Invalid {field} {value!r}.')
+    return parsed
+
+
+def parse_aware_datetime(value):
+    """Datetimes without an offset are taken as UTC."""
+    parsed = parse_datetime(value)
+    return pytz.utc.localize(parsed) if parsed is not None and parsed.tzinfo is None else parsed
+
+
+def parse_record(record):
+    """
+    Task fields of a record, with its group as the group's name. Files exported by the API can be loaded as is: their
+    group is an object in NDJSON, and a group.name column in CSV.
+    """
+    if isinstance(record, str):
+        record = json.loads(record)
+    if not isinstance(record, dict):
+        raise ValueError('Expected an object.')
+    name = record.get('name')
+    if not name or len(str(name)) > 255:
+        raise ValueError('A name of at most 255 characters is required.')
+    group = record.get('group.name', record.get('group'))
+    if isinstance(group, dict):
+        group = group.get('name')
+    if group and len(str(group)) > 255:
+        raise ValueError('Group names have at most 255 characters.')
+    fields = {
+        'name': str(name),
+        'description': record.get('description') or None,
+        'due_date': parse_optional(record, 'due_date', parse_date),
+        'finished_at': parse_optional(record, 'finished_at', parse_aware_datetime),
+        'group': str(group) if group else None,
+    }
+    created_at = parse_optional(record, 'created_at', parse_aware_datetime)
+    if created_at is not None:
+        fields['created_at'] = created_at
+    return fields
+
+
+def parse_chunk(chunk):
+    """Parse a chunk of records (see read_records). Runs in worker processes, so it must not touch the database."""
+    tasks = []
+    for line, record in chunk:
+        try:
+            tasks.append((line, parse_record(record)))
+        except ValueError as error:
+            raise ValueError(f'Line {line}: {error}') from error
+    return tasks
+
+
+def parse_chunks(chunks, workers=0):
+    """
+    Parsed chunks, in order. With workers, chunks are parsed by a pool of as many processes, at most two chunks per
+    worker ahead of the one being loaded, so files are still read as they're loaded.
+    """
+    if not workers:
+        yield from map(parse_chunk, chunks)
+        return
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(parse_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class TaskLoader:
+    """
+    Writes parsed tasks of a user a batch at a time (see load), each batch with a few queries in its own transaction:
+    groups are found by name in a map kept in memory, and created when missing, and tasks are inserted with
+    bulk_create. Tasks with the name and group of another task conflict (Task.Meta.unique_together, tasks without a
+    group never do), which on_conflict handles: error stops the load, skip keeps the task there was, update writes the
+    new one over it.
+    """
+
+    def __init__(self, user, on_conflict='error', batch_size=1000):
+        self.user = user
+        self.on_conflict = on_conflict
+        self.batch_size = batch_size
+        self.group_ids = dict(TaskGroup.objects.filter(user=user).values_list('name', 'id'))
+        self.created = self.updated = self.skipped = 0
+
+    def get_group_ids(self, names):
+        """Ids of the user's groups by name, creating the missing ones. Returns the ids of those created."""
+        missing = set(names) - self.group_ids.keys() - {None}
+        if not missing:
+            return []
+        TaskGroup.objects.bulk_create(
+            (TaskGroup(name=name, user=self.user) for name in missing), batch_size=self.batch_size,
+            ignore_conflicts=True
+        )
+        created = dict(TaskGroup.objects.filter(user=self.user, name__in=missing).values_list('name', 'id'))
+        self.group_ids.update(created)
+        return list(created.values())
+
+    def get_existing(self, tasks):
+        """(id, finished) of the grouped tasks of the user with the name and group of any of tasks, by both."""
+        grouped = [task for task in tasks if task.group_id is not None]
+        if not grouped:
+            return {}
+        rows = Task.objects.filter(
+            user=self.user, name__in={task.name for task in grouped}, group_id__in={task.group_id for task in grouped}
+        ).values_list('name', 'group_id', 'id', 'finished_at')
+        return {(name, group_id): (task_id, finished_at is not None) for name, group_id, task_id, finished_at in rows}
+
+    def resolve_conflicts(self, rows, tasks):
+        """
+        Split tasks (of the rows) into the ones to insert and the ones to write over an existing task, by the conflict
+        policy. Also counts their previous (group_id, finished) (see Task.counter_key), to discount them.
+        """
+        existing = self.get_existing(tasks)
+        new, updates, previous, batch = [], {}, [], {}
+        for (line, fields), task in zip(rows, tasks):
+            key = (task.name, task.group_id)
+            if task.group_id is None:
+                new.append(task)
+            elif key not in existing and key not in batch:
+                batch[key] = task
+                new.append(task)
+            elif self.on_conflict == 'error':
+                raise ValueError(f'Line {line}: there already is a task {task.name!r} in group {fields["group"]!r}.')
+            elif self.on_conflict == 'skip':
+                self.skipped += 1
+            elif key in batch:
+                # Repeated in the batch: the last one wins
+                for field in UPDATED_FIELDS:
+                    setattr(batch[key], field, getattr(task, field))
+                self.updated += 1
+            else:
+                task.pk, finished = existing[key]
+                if task.pk not in updates:
+                    previous.append((task.group_id, finished))
+                updates[task.pk] = task
+        return new, list(updates.values()), previous
+
+    def insert_skipping_conflicts(self, tasks):
+        """
+        Insert tasks with policy skip, which also skips grouped tasks conflicting with one written after
+        resolve_conflicts looked (e.g. by a concurrent load). bulk_create doesn't tell which rows it skipped, so
+        grouped tasks inserted are found again among the rows above the highest id there was. Returns the tasks
+        inserted, the grouped ones with their id.
+        """
+        last_id = Task.objects.aggregate(last_id=Max('pk'))['last_id'] or 0
+        Task.objects.bulk_create(tasks, batch_size=self.batch_size, ignore_conflicts=True)
+        grouped = [task for task in tasks if task.group_id is not None]
+        if not grouped:
+            return tasks
+        ids = {
+            (name, group_id): task_id
+            for name, group_id, task_id in Task.objects.filter(
+                user=self.user, pk__gt=last_id, name__in={task.name for task in grouped},
+                group_id__in={task.group_id for task in grouped}
+            ).values_list('name', 'group_id', 'id')
+        }
+        for task in grouped:
+            task.pk = ids.get((task.name, task.group_id))
+        inserted = [task for task in tasks if task.group_id is None or task.pk is not None]
+        self.skipped += len(tasks) - len(inserted)
+        return inserted
+
+    def load(self, rows):
+        """Write a batch of (line, fields) parsed by parse_chunk. Raises ValueError on conflicts with policy error."""
+        with transaction.atomic():
+            created_groups = self.get_group_ids(fields['group'] for _, fields in rows)
+            tasks = [
+                Task(user=self.user, group_id=self.group_ids.get(fields['group']), **{
+                    field: value for field, value in fields.items() if field != 'group'
+                })
+                for _, fields in rows
+            ]
+            new, updates, previous = self.resolve_conflicts(rows, tasks)
+            if self.on_conflict == 'skip':
+                new = self.insert_skipping_conflicts(new)
+            else:
+                Task.objects.bulk_create(new, batch_size=self.batch_size)
+            if updates:
+                # bulk_update() doesn't go through save(), which sets auto_now fields such as updated_at
+                now = utc_now()
+                for task in updates:
+                    task.updated_at = now
+                Task.objects.bulk_update(updates, UPDATED_FIELDS, batch_size=self.batch_size)
+            # bulk_create and bulk_update don't send the signals counting tasks (see taskinator.signals)
+            TaskCounter.apply(self.user.pk, removed=previous, added=[task.counter_key for task in new + updates])
+        if created_groups:
+            objects_changed(TaskGroup, 'created', self.user.pk, created_groups)
+        if new:
+            ids = [task.pk for task in new]
+            objects_changed(Task, 'created', self.user.pk, None if None in ids else ids)
+        if updates:
+            objects_changed(Task, 'updated', self.user.pk, [task.pk for task in updates])
+        self.created += len(new)
+        self.updated += len(updates)
+
+    def load_file(self, stream, file_format, workers=0):
+        """Load every task of a file. Yields how many rows were loaded so far after every batch."""
+        loaded = 0
+        for rows in parse_chunks(chunked(read_records(stream, file_format), self.batch_size), workers):
+            self.load(rows)
+            loaded += len(rows)
+            yield loaded
@@ -0,0 +1,33 @@
+"""
+Move the tasks finished more than ARCHIVE_AFTER_DAYS ago to the archive, in batches. Meant to be run periodically, e.g.
+daily, so the task table only holds active work.
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from taskinator.models import ArchivedTask
+from utils.datetime import utc_now
+from utils.viewsets import list_cache
+
+
+class Command(BaseCommand):
+    """Archive old finished tasks."""
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, help='Archive tasks finished more than these days ago. ARCHIVE_AFTER_DAYS by default.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Tasks moved per transaction.')
+
+    def handle(self, *args, **options):
+        before = utc_now() - timedelta(days=options['days']) if options['days'] is not None else None
+        start = time.perf_counter()
+        moved = ArchivedTask.archive(before, options['batch_size'])
+        # Cached lists of tasks show the archived ones
+        for user_id in moved:
+            list_cache.bump(user_id)
+        count = sum(len(ids) for ids in moved.values())
+        self.stdout.write(f'Archived {count} tasks of {len(moved)} users in {time.perf_counter() - start:.1f}s.')
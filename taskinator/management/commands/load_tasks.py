@@ -0,0 +1,53 @@
+"""
+Load the tasks of a user from a CSV or NDJSON file, e.g. exported by /api/tasks/export/, in batches. Groups are
+created by name as they're found. Tasks with the name and group of another task conflict: --on-conflict error stops
+the load (batches already loaded are kept), skip keeps the task there was, update writes the new one over it.
+"""
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from taskinator.loader import CONFLICT_POLICIES, FORMATS, TaskLoader
+
+
+class Command(BaseCommand):
+    """Bulk load tasks."""
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to load.')
+        parser.add_argument('--user', required=True, help='Username of the owner of the tasks.')
+        parser.add_argument(
+            '--format', choices=sorted(set(FORMATS.values())), help='Format of the file. Guessed from its extension.'
+        )
+        parser.add_argument('--on-conflict', choices=CONFLICT_POLICIES, default='error', help='Conflict policy.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Tasks written per transaction.')
+        parser.add_argument(
+            '--workers', type=int, default=0, help='Processes parsing the file, which is parsed by this one by default.'
+        )
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or FORMATS.get(os.path.splitext(options['path'])[1].lower())
+        if file_format is None:
+            raise CommandError('Unknown file extension, pass --format.')
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist as error:
+            raise CommandError(f'User {options["user"]!r} not found.') from error
+        loader = TaskLoader(user, options['on_conflict'], options['batch_size'])
+        start = time.perf_counter()
+        loaded = 0
+        try:
+            with open(options['path'], newline='', encoding='utf-8') as stream:
+                for loaded in loader.load_file(stream, file_format, options['workers']):
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'{loaded} tasks read in {time.perf_counter() - start:.1f}s.')
+        except (OSError, ValueError) as error:
+            raise CommandError(f'{error} {loaded} tasks were loaded before.') from error
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'Read {loaded} tasks in {elapsed:.1f}s ({loaded / max(elapsed, 1e-6):.0f} tasks/s): '
+            f'{loader.created} created, {loader.updated} updated, {loader.skipped} skipped.'
+        )
@@ -0,0 +1,14 @@
+"""
+Delete the tombstones of deleted tasks older than TOMBSTONE_RETENTION_DAYS. Meant to be run periodically, e.g. daily.
+"""
+from django.core.management.base import BaseCommand
+
+from taskinator.models import TaskTombstone
+
+
+class Command(BaseCommand):
+    """Prune old task tombstones."""
+    help = __doc__
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Deleted {TaskTombstone.prune()} tombstones.')
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.25 on 2026-10-17 06:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskinator', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='task',
+            options={'ordering': ('-id', '-due_date', '-created_at', 'name', 'user')},
+        ),
+        migrations.AlterModelOptions(
+            name='taskgroup',
+            options={'ordering': ('-id', 'name', 'user')},
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'finished_at'], name='task_user_finished_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'created_at'], name='task_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'due_date'], name='task_user_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['user', 'group'], name='task_user_group_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('finished_at__isnull', True)), fields=['user', '-id'], name='task_open_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('finished_at__isnull', True)), fields=['user', 'due_date'], name='task_open_user_due_idx'),
+        ),
+    ]
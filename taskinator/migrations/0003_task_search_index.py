@@ -0,0 +1,34 @@
+from django.db import migrations
+
+from utils.search import PostgresSearchBackend, install_sqlite_fts, uninstall_sqlite_fts
+
+
+SEARCH_FIELDS = ('name', 'description')
+POSTGRES_INDEX_NAME = 'task_search_idx'
+
+
+def create_search_index(apps, schema_editor):
+    Task = apps.get_model('taskinator', 'Task')
+    if schema_editor.connection.vendor == 'sqlite':
+        install_sqlite_fts(schema_editor, Task, SEARCH_FIELDS)
+    elif schema_editor.connection.vendor == 'postgresql':
+        schema_editor.add_index(Task, PostgresSearchBackend().document_index(SEARCH_FIELDS, POSTGRES_INDEX_NAME))
+
+
+def drop_search_index(apps, schema_editor):
+    Task = apps.get_model('taskinator', 'Task')
+    if schema_editor.connection.vendor == 'sqlite':
+        uninstall_sqlite_fts(schema_editor, Task)
+    elif schema_editor.connection.vendor == 'postgresql':
+        schema_editor.remove_index(Task, PostgresSearchBackend().document_index(SEARCH_FIELDS, POSTGRES_INDEX_NAME))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taskinator', '0002_task_user_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.25 on 2026-10-17 06:43
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+import django.db.models.deletion
+
+
+def count_tasks(apps, schema_editor):
+    Task = apps.get_model('taskinator', 'Task')
+    TaskCounter = apps.get_model('taskinator', 'TaskCounter')
+    counts = Task.objects.using(schema_editor.connection.alias).order_by().values('user_id', 'group_id').annotate(
+        open_count=Count('pk', filter=Q(finished_at__isnull=True)),
+        done_count=Count('pk', filter=Q(finished_at__isnull=False)),
+    )
+    TaskCounter.objects.using(schema_editor.connection.alias).bulk_create(
+        (TaskCounter(**count) for count in counts), batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('taskinator', '0004_task_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('open_count', models.PositiveIntegerField(default=0)),
+                ('done_count', models.PositiveIntegerField(default=0)),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='taskinator.taskgroup')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='taskcounter',
+            constraint=models.UniqueConstraint(fields=('user', 'group'), name='task_counter_user_group_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='taskcounter',
+            constraint=models.UniqueConstraint(condition=models.Q(('group__isnull', True)), fields=('user',), name='task_counter_user_no_group_unique'),
+        ),
+        migrations.RunPython(count_tasks, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,24 @@
 """
 Models representing tasks in a TODO list.
 """
+from datetime import timedelta
+
+from collections import Counter
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.db.models.sql import DeleteQuery
+from django.dispatch import Signal
 
 from utils.datetime import utc_now
 
 
 User = get_user_model()
+# Sent by TaskQuerySet.delete with the user_id and ids of the tasks deleted, instead of post_delete for each of them
+tasks_deleted = Signal()
 
 
 class TaskGroup(models.Model):  # pylint: disable=too-few-public-methods
@@ -18,12 +29,45 @@ class TaskGroup(models.Model):  # pylint: disable=too-few-public-methods
     def __str__(self):
         return f'Task group {self.name} of {self.user.username}'
 
+    def delete(self, using=None, keep_parents=False):
+        # Its tasks first, in bulk (see TaskQuerySet.delete), so the cascade finds none left to delete one by one
+        with transaction.atomic(using=using or router.db_for_write(TaskGroup, instance=self)):
+            Task.objects.using(using).filter(group=self).delete()
+            return super().delete(using, keep_parents)
+
     class Meta:  # pylint: disable=too-few-public-methods
         """Options for the TaskGroup model"""
         unique_together = ('name', 'user')
         ordering = ('-id', 'name', 'user')
 
 
+class TaskQuerySet(models.QuerySet):
+    """Tasks, deleted in bulk."""
+
+    def delete(self):
+        """
+        Delete the tasks with the same few queries whatever their number: they're discounted from their counters with a
+        TaskCounter.apply per user and their tombstones are inserted with a single bulk_create, instead of one by one by
+        the post_delete receivers of each task, which isn't sent. tasks_deleted is sent once per user instead. Returns
+        what QuerySet.delete does.
+        """
+        using = self._db or router.db_for_write(self.model)
+        with transaction.atomic(using=using):
+            rows = list(self.using(using).select_for_update().values_list('id', 'user_id', 'group_id', 'finished_at'))
+            deleted = DeleteQuery(self.model).delete_batch([task_id for task_id, *_ in rows], using)
+            by_user = {}
+            for task_id, user_id, group_id, finished_at in rows:
+                by_user.setdefault(user_id, []).append((task_id, (group_id, finished_at is not None)))
+            for user_id, tasks in by_user.items():
+                TaskCounter.apply(user_id, removed=[counter_key for _, counter_key in tasks])
+            TaskTombstone.objects.using(using).bulk_create(
+                TaskTombstone(task_id=task_id, user_id=user_id) for task_id, user_id, *_ in rows
+            )
+        for user_id, tasks in by_user.items():
+            tasks_deleted.send(sender=self.model, user_id=user_id, ids=[task_id for task_id, _ in tasks])
+        return deleted, {self.model._meta.label: deleted}  # pylint: disable=protected-access
+
+
 class Task(models.Model):  # pylint: disable=too-few-public-methods
     """Represents a single task. If finished_at is not none, then the task is completed."""
     name = models.CharField(max_length=255)
@@ -31,13 +75,205 @@ class Task(models.Model):  # pylint: disable=too-few-public-methods
     due_date = models.DateField(null=True, blank=True)
     created_at = models.DateTimeField(default=utc_now)
     finished_at = models.DateTimeField(null=True, blank=True)
+    # Set on every save. Writes which skip save() (QuerySet.update) must set it themselves.
+    updated_at = models.DateTimeField(auto_now=True)
     group = models.ForeignKey('TaskGroup', on_delete=models.CASCADE, null=True, blank=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    objects = TaskQuerySet.as_manager()
+
     def __str__(self):
         return f'{self.name}'
 
+    @property
+    def counter_key(self):
+        """How the task is counted in TaskCounter: (group_id, finished)."""
+        return self.group_id, self.finished_at is not None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # How it's counted as loaded, so saves move it between counters without reading it again (taskinator.signals)
+        if {'group_id', 'finished_at'} <= set(field_names):
+            instance.previous_counter_key = instance.counter_key
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        if fields is None:
+            self.previous_counter_key = self.counter_key  # pylint: disable=attribute-defined-outside-init
+        else:
+            vars(self).pop('previous_counter_key', None)
+
+    def save(self, *args, **kwargs):  # pylint: disable=signature-differs
+        # Atomic, so what signal receivers derive from the task (e.g. TaskCounter) is written along with it
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(Task, instance=self)):
+            super().save(*args, **kwargs)
+
     class Meta:  # pylint: disable=too-few-public-methods
         """Options for the task model"""
         unique_together = ('name', 'user', 'group')
         ordering = ('-id', '-due_date', '-created_at', 'name', 'user')
+        # Every query is scoped by user (OwnedObjectMixin), so lead every index with it.
+        indexes = (
+            models.Index(fields=('user', 'finished_at'), name='task_user_finished_idx'),
+            models.Index(fields=('user', 'created_at'), name='task_user_created_idx'),
+            models.Index(fields=('user', 'due_date'), name='task_user_due_idx'),
+            models.Index(fields=('user', 'group'), name='task_user_group_idx'),
+            models.Index(fields=('user', 'updated_at'), name='task_user_updated_idx'),
+            # Partial indexes are skipped by backends which don't support them.
+            models.Index(fields=('user', '-id'), name='task_open_user_idx', condition=Q(finished_at__isnull=True)),
+            models.Index(
+                fields=('user', 'due_date'), name='task_open_user_due_idx', condition=Q(finished_at__isnull=True)
+            ),
+            # Finds the tasks to archive (see ArchivedTask.archive) across users.
+            models.Index(fields=('finished_at', ), name='task_done_idx', condition=Q(finished_at__isnull=False)),
+        )
+
+
+class ArchivedTask(models.Model):  # pylint: disable=too-few-public-methods
+    """
+    Task finished more than ARCHIVE_AFTER_DAYS ago, moved out of the task table (see archive) so it only holds active
+    work. Its columns are the same as the task's, in the same order, so both tables can be read as one with
+    QuerySet.union, which builds Task instances.
+    """
+    # The id it had as a task
+    id = models.BigIntegerField(primary_key=True)
+    name = models.CharField(max_length=255)
+    description = models.TextField(null=True, blank=True)
+    due_date = models.DateField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    finished_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    group = models.ForeignKey('TaskGroup', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+
+    def __str__(self):
+        return f'{self.name}'
+
+    @staticmethod
+    def archive_after():
+        """How long tasks stay in the task table once finished."""
+        return timedelta(days=getattr(settings, 'ARCHIVE_AFTER_DAYS', 90))
+
+    @classmethod
+    def archive(cls, before=None, batch_size=1000):
+        """
+        Move the tasks finished before a datetime (ARCHIVE_AFTER_DAYS ago by default) to the archive, batch_size at a
+        time, each batch in its own transaction so locks are held briefly. They're still counted as done, see
+        TaskCounter.archived_count. Returns the ids of the tasks moved, by user id.
+        """
+        before = before if before is not None else utc_now() - cls.archive_after()
+        fields = [field.attname for field in cls._meta.concrete_fields]  # pylint: disable=protected-access
+        using = router.db_for_write(Task)
+        moved = {}
+        while True:
+            with transaction.atomic(using=using):
+                tasks = Task.objects.using(using).filter(finished_at__lt=before).order_by('finished_at')
+                rows = [dict(zip(fields, row)) for row in tasks.values_list(*fields)[:batch_size]]
+                if not rows:
+                    return moved
+                cls.objects.using(using).bulk_create(cls(**row) for row in rows)
+                TaskCounter.count_archived(Counter((row['user_id'], row['group_id']) for row in rows))
+                # Without the signals of a delete: archived tasks are neither deleted for syncing clients nor discounted
+                archived = Task.objects.using(using).filter(pk__in=[row['id'] for row in rows])
+                archived._raw_delete(using)  # pylint: disable=protected-access
+            for row in rows:
+                moved.setdefault(row['user_id'], []).append(row['id'])
+
+    class Meta:  # pylint: disable=too-few-public-methods
+        """Options for the ArchivedTask model"""
+        # Read along with tasks, scoped by user as well.
+        indexes = (
+            models.Index(fields=('user', 'finished_at'), name='archived_user_finished_idx'),
+            models.Index(fields=('user', 'created_at'), name='archived_user_created_idx'),
+        )
+
+
+class TaskTombstone(models.Model):  # pylint: disable=too-few-public-methods
+    """
+    Records that a task was deleted, so clients syncing their tasks (see TaskViewSet.sync) learn about it. Kept for
+    TOMBSTONE_RETENTION_DAYS, clients which haven't synced for longer have to sync everything again.
+    """
+    task_id = models.BigIntegerField()
+    # Without a constraint, as tombstones are written while the user's tasks are deleted along with the user.
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    deleted_at = models.DateTimeField(default=utc_now)
+
+    def __str__(self):
+        return f'Task {self.task_id} deleted at {self.deleted_at}'
+
+    @staticmethod
+    def retention():
+        """How long tombstones are kept."""
+        return timedelta(days=getattr(settings, 'TOMBSTONE_RETENTION_DAYS', 30))
+
+    @classmethod
+    def prune(cls):
+        """Delete the tombstones older than the retention. Returns how many were deleted."""
+        deleted, _ = cls.objects.filter(deleted_at__lt=utc_now() - cls.retention()).delete()
+        return deleted
+
+    class Meta:  # pylint: disable=too-few-public-methods
+        """Options for the TaskTombstone model"""
+        indexes = (
+            models.Index(fields=('user', 'deleted_at'), name='tombstone_user_deleted_idx'),
+        )
+
+
+class TaskCounter(models.Model):  # pylint: disable=too-few-public-methods
+    """
+    Denormalized number of open and done tasks of each group of a user (group is None for tasks without one), so stats
+    don't have to count tasks. Kept up to date in the same transaction as every write to tasks, see apply.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    group = models.ForeignKey(TaskGroup, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    open_count = models.PositiveIntegerField(default=0)
+    # Archived tasks (see ArchivedTask) included
+    done_count = models.PositiveIntegerField(default=0)
+    archived_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.open_count} open and {self.done_count} done tasks of {self.group_id or "no group"}'
+
+    @classmethod
+    def apply(cls, user_id, removed=(), added=()):
+        """
+        Count tasks removed from and added to the user's counters, as (group_id, finished) pairs (see
+        Task.counter_key). A task moved or completed is removed as it was and added as it is. Each counter is changed
+        with a single UPDATE, adding to its current value, so concurrent writes don't overwrite each other.
+        """
+        deltas = Counter()
+        for sign, tasks in ((-1, removed), (1, added)):
+            for group_id, finished in tasks:
+                deltas[group_id, finished] += sign
+        for group_id in {group_id for group_id, _ in deltas}:
+            open_delta, done_delta = deltas[group_id, False], deltas[group_id, True]
+            if not open_delta and not done_delta:
+                continue
+            counters = cls.objects.filter(user_id=user_id, group_id=group_id)
+            # Never below zero: a counter gone wrong must not make task writes fail
+            values = {
+                'open_count': Greatest(F('open_count') + open_delta, 0),
+                'done_count': Greatest(F('done_count') + done_delta, 0),
+            }
+            # Missing counters are created by the first task added; removals find none when the group is being deleted
+            if not counters.update(**values) and (open_delta > 0 or done_delta > 0):
+                cls.objects.get_or_create(user_id=user_id, group_id=group_id)
+                counters.update(**values)
+
+    @classmethod
+    def count_archived(cls, archived):
+        """Count tasks archived, a Counter of tasks by (user_id, group_id)."""
+        for (user_id, group_id), count in archived.items():
+            cls.objects.filter(user_id=user_id, group_id=group_id).update(archived_count=F('archived_count') + count)
+
+    class Meta:  # pylint: disable=too-few-public-methods
+        """Options for the TaskCounter model"""
+        constraints = (
+            models.UniqueConstraint(fields=('user', 'group'), name='task_counter_user_group_unique'),
+            # NULLs are distinct in unique constraints, so the counter of tasks without a group needs its own
+            models.UniqueConstraint(
+                fields=('user',), condition=Q(group__isnull=True), name='task_counter_user_no_group_unique'
+            ),
+        )
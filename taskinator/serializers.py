@@ -4,23 +4,27 @@ Serializers for Taskinator views. They handle how models are represented in the
 from rest_framework import serializers
 
 from taskinator.models import Task, TaskGroup
+from utils.serializers import SparseFieldsetsMixin
 
 
-class TaskSerializer(serializers.HyperlinkedModelSerializer):  # pylint: disable=too-few-public-methods
-    """Represents each Task. Show all fields except User (CONFIDENTIAL DATA) for which just id is displayed."""
+class TaskGroupSerializer(SparseFieldsetsMixin, serializers.HyperlinkedModelSerializer):
+    # pylint: disable=too-few-public-methods
+    """Represents each TaskGroup. Show all fields except User (CONFIDENTIAL DATA) for which just id is displayed."""
     user_id = serializers.IntegerField()
 
     class Meta:
-        model = Task
+        model = TaskGroup
         exclude = ('user', )
-        depth = 2
+        depth = 1
 
 
-class TaskGroupSerializer(serializers.HyperlinkedModelSerializer):  # pylint: disable=too-few-public-methods
-    """Represents each TaskGroup. Show all fields except User (CONFIDENTIAL DATA) for which just id is displayed."""
+class TaskSerializer(SparseFieldsetsMixin, serializers.HyperlinkedModelSerializer):
+    # pylint: disable=too-few-public-methods
+    """Represents each Task. Show all fields except User (CONFIDENTIAL DATA) for which just id is displayed."""
     user_id = serializers.IntegerField()
+    group = TaskGroupSerializer(read_only=True)
 
     class Meta:
-        model = TaskGroup
+        model = Task
         exclude = ('user', )
-        depth = 1
+        depth = 2
@@ -0,0 +1,85 @@
+"""
+Signal receivers keeping what's derived from tasks and task groups up to date.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from taskinator.events import publish_change
+from taskinator.models import Task, TaskCounter, TaskGroup, TaskTombstone, tasks_deleted
+from utils.datetime import utc_now
+from utils.viewsets import list_cache
+
+
+def objects_changed(model, action, user_id, ids=None):
+    """
+    Hook for every write to tasks or task groups of a user: invalidates the user's cached lists and publishes the
+    change to the user's feed, both once the current transaction commits. Called by the receivers below for saves and
+    deletes (cascades and TaskQuerySet.delete included), so writes which don't send signals (QuerySet.update,
+    bulk_create, bulk_update) must call it themselves.
+    """
+    # Once committed, or lists read meanwhile (without the write) could be cached under the new generation
+    transaction.on_commit(lambda: list_cache.bump(user_id))
+    publish_change(model, action, user_id, ids)
+
+
+def object_saved(sender, instance, created, **kwargs):  # pylint: disable=unused-argument
+    """Signal receiver for saves."""
+    objects_changed(sender, 'created' if created else 'updated', instance.user_id, [instance.pk])
+
+
+def object_deleted(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """Signal receiver for deletes, including the ones cascaded from deleting a user or a task group."""
+    objects_changed(sender, 'deleted', instance.user_id, [instance.pk])
+
+
+def tasks_deleted_in_bulk(sender, user_id, ids, **kwargs):  # pylint: disable=unused-argument
+    """Signal receiver for tasks deleted by TaskQuerySet.delete, which discounts them and leaves their tombstones."""
+    objects_changed(sender, 'deleted', user_id, ids)
+
+
+def task_deleted(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """Signal receiver leaving a tombstone for a task deleted by itself, for clients syncing their tasks."""
+    TaskTombstone.objects.create(task_id=instance.pk, user_id=instance.user_id)
+
+
+def count_task_before_save(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Signal receiver remembering how a task was counted in TaskCounter before it's saved (see Task.save). Tasks loaded
+    from the database know it already (see Task.from_db), others are read.
+    """
+    if instance._state.adding:  # pylint: disable=protected-access
+        instance.previous_counter_key = None
+    elif not hasattr(instance, 'previous_counter_key'):
+        previous = sender.objects.filter(pk=instance.pk).values_list('group_id', 'finished_at').first()
+        instance.previous_counter_key = None if previous is None else (previous[0], previous[1] is not None)
+
+
+def count_task_saved(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """Signal receiver counting a task created, completed or moved to another group."""
+    previous = getattr(instance, 'previous_counter_key', None)
+    TaskCounter.apply(instance.user_id, removed=[] if previous is None else [previous], added=[instance.counter_key])
+    instance.previous_counter_key = instance.counter_key
+
+
+def count_task_deleted(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """Signal receiver discounting a task deleted by itself. Runs in the transaction of the delete."""
+    TaskCounter.apply(instance.user_id, removed=[instance.counter_key])
+
+
+def task_group_saved(sender, instance, created, **kwargs):  # pylint: disable=unused-argument
+    """Signal receiver marking the tasks of a renamed group as updated, as tasks are represented with their group."""
+    if not created:
+        Task.objects.filter(user_id=instance.user_id, group=instance).update(updated_at=utc_now())
+
+
+def connect_signals():
+    """Connect the receivers. Meant to be called from the AppConfig.ready."""
+    for model in (Task, TaskGroup):
+        post_save.connect(object_saved, sender=model, dispatch_uid=f'{model.__name__}_saved')
+        post_delete.connect(object_deleted, sender=model, dispatch_uid=f'{model.__name__}_deleted')
+    post_delete.connect(task_deleted, sender=Task, dispatch_uid='Task_tombstone')
+    tasks_deleted.connect(tasks_deleted_in_bulk, sender=Task, dispatch_uid='Task_deleted_in_bulk')
+    pre_save.connect(count_task_before_save, sender=Task, dispatch_uid='Task_count_before_save')
+    post_save.connect(count_task_saved, sender=Task, dispatch_uid='Task_count_saved')
+    post_delete.connect(count_task_deleted, sender=Task, dispatch_uid='Task_count_deleted')
+    post_save.connect(task_group_saved, sender=TaskGroup, dispatch_uid='TaskGroup_touch_tasks')
@@ -1,15 +1,35 @@
 """
 Test Taskinator Django app.
 """
+# pylint: disable=too-many-lines
+import csv
+import io
+import json
+import sqlite3
+import time
+from datetime import date, timedelta
+
 import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from rest_framework.authtoken.models import Token
 
 from conftest import create_task, create_task_group, create_user
-from taskinator.models import Task, TaskGroup
-from taskinator.views import TaskViewSet
+from taskinator.loader import TaskLoader
+from taskinator.models import ArchivedTask, Task, TaskCounter, TaskGroup, TaskTombstone
+from taskinator.views import TaskGroupViewSet, TaskViewSet
+from todo_challenge.asgi import application
 from utils.datetime import utc_now
+from utils.idempotency import IN_PROGRESS, get_response_store
+from utils.metrics import get_bucketed_registry
+from utils.viewsets import ListCacheMixin, SyncMixin
 
 
 # Allow db usage for all tests within this module
@@ -40,6 +60,21 @@ def token(user):  # noqa: F811, pylint: disable=redefined-outer-name
     example_token.delete()
 
 
+@pytest.fixture
+def no_list_cache(monkeypatch):
+    """Disable the list cache, to check what happens on cache misses."""
+    monkeypatch.setattr(ListCacheMixin, 'get_list_cache_scope', lambda self: None)
+
+
+def count_list_queries(client, url):  # pylint: disable=redefined-outer-name
+    """Get how many queries listing the url takes, and the number of results listed. The token is cached first."""
+    client.get('/api/')
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(queries.captured_queries), len(response.data['results'])
+
+
 def is_object_in_response(obj, response):
     """Check if a given object was returned by the API."""
     response_task_names = [o['name'] for o in response.data['results']]
@@ -159,13 +194,18 @@ def test_date_filtered_task(authenticated_client, task):  # pylint: disable=rede
     assert is_object_in_response(second_task, response)
 
 
-def test_finished_filtered_task(authenticated_client, task):  # pylint: disable=redefined-outer-name
+def test_finished_filtered_task(authenticated_client, task, django_capture_on_commit_callbacks):
+    # pylint: disable=redefined-outer-name
     """Test that the finished filter is enabled for the tasks endpoint."""
     second_task = create_task(task.user, task_name='Other task')
     response = authenticated_client.get('/api/tasks/', data={'finished': True})
     assert response.data['count'] == 0
     task.finished_at = utc_now()
-    task.save()
+    # Cached lists are invalidated once the write commits
+    with django_capture_on_commit_callbacks(execute=True):
+        task.save()
+        cached = authenticated_client.get('/api/tasks/', data={'finished': True})
+        assert json.loads(cached.content)['count'] == 0
     response = authenticated_client.get('/api/tasks/', data={'finished': True})
     assert is_object_in_response(task, response)
     assert not is_object_in_response(second_task, response)
@@ -182,6 +222,10 @@ def test_search_filtered_task(authenticated_client, task):  # pylint: disable=re
     assert is_object_in_response(task, response)
     assert is_object_in_response(second_task, response)
     assert not is_object_in_response(third_task, response)
+    third_task.description = 'A task hidden in the description'
+    third_task.save()
+    response = authenticated_client.get('/api/tasks/', data={'search': 'task', 'search__rank': 'true'})
+    assert response.data['count'] == 3
 
 
 def test_task_mark_as_completed(authenticated_client, task):  # pylint: disable=redefined-outer-name
@@ -190,6 +234,47 @@ def test_task_mark_as_completed(authenticated_client, task):  # pylint: disable=
     response = authenticated_client.post(f'/api/tasks/{task.id}/complete/')
     assert response.status_code == 200
     assert Task.objects.get(id=task.id).finished_at is not None
+    assert response.data['finished_at'] is not None
+
+
+def test_task_mark_as_completed_once(authenticated_client, task):  # pylint: disable=redefined-outer-name
+    """Completing a task twice keeps the first finished_at, and only the task's owner can complete it."""
+    authenticated_client.post(f'/api/tasks/{task.id}/complete/')
+    finished_at = Task.objects.get(id=task.id).finished_at
+    response = authenticated_client.patch(f'/api/tasks/{task.id}/complete/')
+    assert response.status_code == 200
+    assert Task.objects.get(id=task.id).finished_at == finished_at
+    other_task = create_task(create_user('Someone else'))
+    response = authenticated_client.post(f'/api/tasks/{other_task.id}/complete/')
+    assert response.status_code == 404
+    assert Task.objects.get(id=other_task.id).finished_at is None
+
+
+def test_task_mark_as_completed_minimal(authenticated_client, task):  # pylint: disable=redefined-outer-name
+    """
+    With return=minimal the task is completed with a single UPDATE of finished_at and nothing is returned, after a
+    SELECT of its group. Its counter is updated with a single UPDATE too. Completing it again doesn't write at all.
+    """
+    # Authenticate once, so the token is cached
+    authenticated_client.get('/api/task-groups/')
+    with CaptureQueriesContext(connection) as queries:
+        response = authenticated_client.post(f'/api/tasks/{task.id}/complete/?return=minimal')
+    assert response.status_code == 204
+    assert not response.content
+    # The transaction of the test turns the view's into a savepoint
+    statements = [query['sql'] for query in queries.captured_queries if 'SAVEPOINT' not in query['sql']]
+    assert len(statements) == 3
+    assert statements[0].startswith('SELECT "taskinator_task"."group_id" FROM "taskinator_task"')
+    assert statements[1].startswith('UPDATE "taskinator_task" SET "finished_at" = ')
+    assert statements[2].startswith('UPDATE "taskinator_taskcounter" SET ')
+    with CaptureQueriesContext(connection) as queries:
+        response = authenticated_client.post(f'/api/tasks/{task.id}/complete/?return=minimal')
+    assert response.status_code == 204
+    statements = [query['sql'] for query in queries.captured_queries if 'SAVEPOINT' not in query['sql']]
+    assert len(statements) == 2
+    assert all(statement.startswith('SELECT ') for statement in statements)
+    response = authenticated_client.post(f'/api/tasks/{task.id + 1}/complete/?return=minimal')
+    assert response.status_code == 404
 
 
 def test_create_task(authenticated_client):  # pylint: disable=redefined-outer-name
@@ -200,9 +285,934 @@ def test_create_task(authenticated_client):  # pylint: disable=redefined-outer-n
     assert Task.objects.filter(name='Some task').exists()
 
 
+def test_tasks_idempotency_key(authenticated_client, task, monkeypatch):  # pylint: disable=redefined-outer-name
+    """
+    Creating or completing a task again with the same Idempotency-Key header replays the first response without
+    queries. Failed requests aren't replayed, and the key can't be reused for other requests meanwhile, until the
+    marker of the request being handled expires.
+    """
+    headers = {'HTTP_IDEMPOTENCY_KEY': 'create-1'}
+    assert authenticated_client.post('/api/tasks/', data={'description': 'No name'}, **headers).status_code == 400
+    response = authenticated_client.post('/api/tasks/', data={'name': 'Some task'}, **headers)
+    assert response.status_code == 201
+    with CaptureQueriesContext(connection) as queries:
+        retry = authenticated_client.post('/api/tasks/', data={'name': 'Some task'}, **headers)
+    assert not queries.captured_queries
+    assert (retry.status_code, retry.data, retry['Idempotent-Replayed']) == (201, response.data, 'true')
+    assert Task.objects.filter(name='Some task').count() == 1
+    assert authenticated_client.post('/api/tasks/', data={'name': 'Other task'}, **headers).status_code == 422
+    for path in (f'/api/tasks/{task.id}/complete/', f'/api/tasks/{task.id}/complete/?return=minimal'):
+        headers = {'HTTP_IDEMPOTENCY_KEY': path}
+        response = authenticated_client.post(path, **headers)
+        with CaptureQueriesContext(connection) as queries:
+            assert authenticated_client.post(path, **headers).status_code == response.status_code
+        assert not queries.captured_queries
+    get_response_store().add(TaskViewSet().get_idempotency_store_key(response.wsgi_request, 'pending'), IN_PROGRESS)
+    response = authenticated_client.post(path, HTTP_IDEMPOTENCY_KEY='pending')
+    assert response.status_code == 409
+    monkeypatch.setattr(get_response_store().local, 'timer', lambda: time.monotonic() + 60)
+    assert authenticated_client.post(path, HTTP_IDEMPOTENCY_KEY='pending').status_code == 204
+    assert authenticated_client.post(path, HTTP_IDEMPOTENCY_KEY='k' * 256).status_code == 400
+    assert authenticated_client.post('/api/tasks/', data={'name': 'Keyless'}).status_code == 201
+
+
 def test_delete_task(authenticated_client, task):  # pylint: disable=redefined-outer-name
     """Makes sure the task deletion endpoint is working."""
     assert Task.objects.filter(id=task.id).exists()
     response = authenticated_client.delete(f'/api/tasks/{task.id}/')
     assert response.status_code == 204
     assert not Task.objects.filter(id=task.id).exists()
+
+
+def test_tasks_cursor_pagination(authenticated_client, user):  # pylint: disable=redefined-outer-name
+    """Keyset pagination walks every task exactly once, newest first, without running a COUNT query."""
+    Task.objects.bulk_create(Task(name=f'Task {i}', user=user) for i in range(51))
+    with CaptureQueriesContext(connection) as queries:
+        response = authenticated_client.get('/api/tasks/', data={'pagination': 'cursor'})
+    assert response.status_code == 200
+    assert 'count' not in response.data
+    assert not any('COUNT(' in query['sql'] for query in queries.captured_queries)
+    first_page = [task['name'] for task in response.data['results']]
+    assert len(first_page) == 50
+    assert response.data['next']
+    response = authenticated_client.get(response.data['next'])
+    assert response.status_code == 200
+    second_page = [task['name'] for task in response.data['results']]
+    assert len(second_page) == 1
+    assert response.data['next'] is None
+    expected = list(Task.objects.filter(user=user).order_by('-id').values_list('name', flat=True))
+    assert first_page + second_page == expected
+
+
+@pytest.mark.usefixtures('no_list_cache')
+def test_tasks_estimated_count(authenticated_client, user):  # pylint: disable=redefined-outer-name
+    """
+    Pages count the tasks exactly, unless an estimate is asked for: then the count is estimated from the counters,
+    still exact on the last page, and unknown for filters nothing can estimate on SQLite, which aren't counted.
+    """
+    Task.objects.bulk_create(
+        Task(name=f'Task {i}', user=user, finished_at=utc_now() if i % 2 else None) for i in range(120)
+    )
+    # Bulk inserts skip the counters, which are set a bit off to tell the estimate from an exact count
+    TaskCounter.objects.create(user=user, open_count=60, done_count=70)
+    response = authenticated_client.get('/api/tasks/')
+    assert (response.data['count'], response.data['count_exact'], len(response.data['results'])) == (120, True, 50)
+    assert response.data['next'].endswith('page=2')
+    with CaptureQueriesContext(connection) as queries:
+        response = authenticated_client.get('/api/tasks/', data={'count': 'estimate'})
+    assert not any('COUNT(' in query['sql'] for query in queries.captured_queries)
+    assert (response.data['count'], response.data['count_exact'], len(response.data['results'])) == (130, False, 50)
+    response = authenticated_client.get('/api/tasks/', data={'count': 'estimate', 'page': 3})
+    assert (response.data['count'], response.data['count_exact'], len(response.data['results'])) == (120, True, 20)
+    assert response.data['next'] is None
+    response = authenticated_client.get('/api/tasks/', data={'count': 'estimate', 'finished': 'true'})
+    assert (response.data['count'], response.data['count_exact']) == (70, False)
+    response = authenticated_client.get('/api/tasks/', data={'count': 'estimate', 'finished': 'maybe', 'page': 2})
+    assert (response.data['count'], response.data['count_exact']) == (130, False)
+    with CaptureQueriesContext(connection) as queries:
+        response = authenticated_client.get('/api/tasks/', data={'count': 'estimate', 'search': 'task'})
+    assert not any('COUNT(' in query['sql'] for query in queries.captured_queries)
+    assert (response.data['count'], response.data['count_exact'], len(response.data['results'])) == (None, False, 50)
+    assert response.data['next']
+    response = authenticated_client.get('/api/tasks/', data={'search': 'task', 'page': 'last'})
+    assert (response.data['count'], response.data['count_exact'], len(response.data['results'])) == (120, True, 20)
+    for page in (4, 0, 'first'):
+        assert authenticated_client.get('/api/tasks/', data={'page': page}).status_code == 404
+
+
+def test_task_groups_cursor_pagination(authenticated_client, task_group):  # pylint: disable=redefined-outer-name
+    """Task groups can be paginated by cursor as well."""
+    response = authenticated_client.get('/api/task-groups/', data={'pagination': 'cursor'})
+    assert response.status_code == 200
+    assert 'count' not in response.data
+    assert is_object_in_response(task_group, response)
+
+
+def test_pagination_browsable_api(authenticated_client, user):  # pylint: disable=redefined-outer-name
+    """Both pagination styles render their controls in the browsable API."""
+    Task.objects.bulk_create(Task(name=f'Task {i}', user=user) for i in range(51))
+    response = authenticated_client.get('/api/tasks/', HTTP_ACCEPT='text/html')
+    assert response.status_code == 200
+    assert 'page=2' in response.content.decode()
+    response = authenticated_client.get('/api/tasks/', data={'pagination': 'cursor'}, HTTP_ACCEPT='text/html')
+    assert response.status_code == 200
+    assert 'cursor=' in response.content.decode()
+
+
+def test_task_filters_use_composite_indexes(user):  # pylint: disable=redefined-outer-name
+    """The per-user filter paths are served by the composite (user, ...) indexes."""
+    tasks = Task.objects.filter(user=user).order_by()
+    assert 'task_user_finished_idx' in tasks.filter(finished_at__isnull=True).explain()
+    assert 'task_user_created_idx' in tasks.filter(created_at__gte=utc_now()).explain()
+    overdue = tasks.filter(finished_at__isnull=True, due_date__lt=utc_now().date())
+    overdue = overdue.values('group').annotate(Count('pk'))
+    assert 'task_open_user_due_idx' in overdue.explain()
+
+
+def test_bulk_create_tasks(authenticated_client, user):  # pylint: disable=redefined-outer-name
+    """Many tasks are created with a single request, or none of them if any is invalid."""
+    tasks = [{'name': 'First'}, {'name': 'Second'}]
+    response = authenticated_client.post('/api/tasks/bulk/', data=tasks, format='json')
+    assert response.status_code == 201
+    assert response.data == {'count': 2}
+    assert set(Task.objects.filter(user=user).values_list('name', flat=True)) == {'First', 'Second'}
+    response = authenticated_client.post('/api/tasks/bulk/', data=[{'name': 'Third'}, {}, 'x'], format='json')
+    assert response.status_code == 400
+    assert response.data[0] == {}
+    assert 'name' in response.data[1]
+    assert 'non_field_errors' in response.data[2]
+    assert not Task.objects.filter(name='Third').exists()
+    response = authenticated_client.post('/api/tasks/bulk/', data={'name': 'Not a list'}, format='json')
+    assert response.status_code == 400
+
+
+def test_bulk_create_tasks_limit(authenticated_client, monkeypatch):  # pylint: disable=redefined-outer-name
+    """Requests with too many items are rejected."""
+    monkeypatch.setattr(TaskViewSet, 'bulk_max_items', 1)
+    response = authenticated_client.post('/api/tasks/bulk/', data=[{'name': 'A'}, {'name': 'B'}], format='json')
+    assert response.status_code == 400
+    assert not Task.objects.exists()
+
+
+def test_bulk_update_tasks(authenticated_client, task, task_group):  # pylint: disable=redefined-outer-name
+    """Many tasks are partially updated with a single request, with errors reported per item."""
+    second_task = create_task(task.user, task_name='Other task')
+    response = authenticated_client.patch('/api/tasks/bulk/', data=[
+        {'id': task.id, 'name': 'Renamed'}, {'id': second_task.id, 'description': 'Described', 'user_id': 0},
+    ], format='json')
+    assert response.status_code == 200
+    assert response.data == {'count': 2}
+    assert Task.objects.get(id=task.id).name == 'Renamed'
+    assert Task.objects.get(id=second_task.id).description == 'Described'
+    assert Task.objects.get(id=second_task.id).user_id == task.user.id
+    response = authenticated_client.patch('/api/tasks/bulk/', data=[{'id': task.id, 'name': 'Renamed'}], format='json')
+    assert response.status_code == 200
+    other_task = create_task(create_user('Someone else'))
+    response = authenticated_client.patch('/api/tasks/bulk/', data=[
+        {'id': task.id, 'name': 'Not saved'}, {'id': other_task.id, 'name': 'Stolen'}, {'id': task.id, 'due_date': 'x'},
+    ], format='json')
+    assert response.status_code == 400
+    assert response.data[0] == {}
+    assert 'id' in response.data[1]
+    assert 'due_date' in response.data[2]
+    assert Task.objects.get(id=task.id).name == 'Renamed'
+    response = authenticated_client.patch('/api/tasks/bulk/', data=[{'name': 'No id'}], format='json')
+    assert response.status_code == 400
+    assert 'id' in response.data[0]
+    Task.objects.filter(id__in=(task.id, second_task.id)).update(group=task_group)
+    duplicated_name = [{'id': task.id, 'name': 'Other task'}]
+    response = authenticated_client.patch('/api/tasks/bulk/', data=duplicated_name, format='json')
+    assert response.status_code == 400
+    # Worded the same way by every database, without SQL
+    assert response.data == {'non_field_errors': ['The fields name, user, group must make a unique set.']}
+
+
+def test_bulk_delete_tasks(authenticated_client, task):  # pylint: disable=redefined-outer-name
+    """Many tasks are deleted with a single request, only if they belong to the user."""
+    second_task = create_task(task.user, task_name='Other task')
+    other_task = create_task(create_user('Someone else'))
+    response = authenticated_client.delete(
+        '/api/tasks/bulk/', data=[task.id, second_task.id, other_task.id], format='json'
+    )
+    assert response.status_code == 200
+    assert response.data == {'count': 2}
+    assert list(Task.objects.all()) == [other_task]
+    response = authenticated_client.delete('/api/tasks/bulk/', data=['x'], format='json')
+    assert response.status_code == 400
+
+
+def test_bulk_delete_tasks_queries(authenticated_client, user, task_group):  # pylint: disable=redefined-outer-name
+    """
+    Deleting tasks in bulk takes the same queries however many tasks there are: an UPDATE per counter and a single
+    INSERT of their tombstones.
+    """
+    def delete_tasks(count):
+        Task.objects.bulk_create(
+            Task(name=f'Task {i}', user=user, group=(task_group, None)[i % 2]) for i in range(count)
+        )
+        ids = list(Task.objects.filter(user=user).values_list('id', flat=True))
+        authenticated_client.get('/api/')
+        with CaptureQueriesContext(connection) as queries:
+            response = authenticated_client.delete('/api/tasks/bulk/', data=ids, format='json')
+        assert response.data == {'count': count}
+        return [query['sql'] for query in queries.captured_queries if 'SAVEPOINT' not in query['sql']]
+
+    queries = delete_tasks(10)
+    assert len([sql for sql in queries if sql.startswith('UPDATE "taskinator_taskcounter"')]) == 2
+    assert len([sql for sql in queries if sql.startswith('INSERT INTO "taskinator_tasktombstone"')]) == 1
+    assert len(delete_tasks(90)) == len(queries)
+    assert not Task.objects.exists()
+    assert TaskTombstone.objects.count() == 100
+
+
+def test_bulk_complete_tasks(authenticated_client, task):  # pylint: disable=redefined-outer-name
+    """Many tasks are marked as done with a single request. Tasks already done are not updated again."""
+    second_task = create_task(task.user, task_name='Other task')
+    response = authenticated_client.post('/api/tasks/bulk/complete/', data=[task.id], format='json')
+    assert response.status_code == 200
+    assert response.data == {'count': 1}
+    finished_at = Task.objects.get(id=task.id).finished_at
+    assert finished_at is not None
+    response = authenticated_client.post('/api/tasks/bulk/complete/', data=[task.id, second_task.id], format='json')
+    assert response.data == {'count': 1}
+    assert Task.objects.get(id=task.id).finished_at == finished_at
+    assert Task.objects.get(id=second_task.id).finished_at is not None
+
+
+def sync(api_client, since=None):
+    """Sync tasks from a token, following every page. Get (changed ids, deleted ids, new token, reset)."""
+    changed, deleted, reset, more = [], [], None, True
+    while more:
+        response = api_client.get('/api/tasks/sync/', {'since': since} if since else {})
+        assert response.status_code == 200
+        changed += [int(item['url'].split('/')[-2]) for item in response.data['changed']]
+        deleted += response.data['deleted']
+        since, more = response.data['since'], response.data['more']
+        reset = response.data['reset'] if reset is None else reset
+    return changed, deleted, since, reset
+
+
+def test_sync_tasks(authenticated_client, task, task_group, monkeypatch):  # pylint: disable=redefined-outer-name
+    """Syncing gets every task first, then the ones changed and deleted since the previous sync."""
+    monkeypatch.setattr(TaskViewSet, 'sync_margin', timedelta(0))
+    monkeypatch.setattr(TaskViewSet, 'sync_page_size', 2)
+    other_tasks = [create_task(task.user, f'Task {i}') for i in range(3)]
+    create_task(create_user('Someone else'))
+    changed, deleted, since, reset = sync(authenticated_client)
+    assert (changed, deleted, reset) == ([task.id] + [other.id for other in other_tasks], [], True)
+    assert sync(authenticated_client, since)[:2] == ([], [])
+    other_tasks[1].group = task_group
+    other_tasks[1].save()
+    authenticated_client.post(f'/api/tasks/{task.id}/complete/')
+    authenticated_client.delete(f'/api/tasks/{other_tasks[0].id}/')
+    changed, deleted, since, reset = sync(authenticated_client, since)
+    assert (changed, deleted, reset) == ([other_tasks[1].id, task.id], [other_tasks[0].id], False)
+    authenticated_client.patch(f'/api/task-groups/{task_group.id}/', data={'name': 'Renamed'}, format='json')
+    authenticated_client.patch('/api/tasks/bulk/', data=[{'id': other_tasks[2].id, 'name': 'Renamed'}], format='json')
+    changed, deleted, since, _ = sync(authenticated_client, since)
+    assert (changed, deleted) == ([other_tasks[1].id, other_tasks[2].id], [])
+
+
+def test_sync_tasks_tokens(authenticated_client, task):  # pylint: disable=redefined-outer-name
+    """The last margin is sent again, invalid tokens are rejected and old ones get everything again."""
+    _, _, since, _ = sync(authenticated_client)
+    assert sync(authenticated_client, since)[0] == [task.id]
+    response = authenticated_client.get('/api/tasks/sync/', {'since': 'not a token'})
+    assert response.status_code == 400
+    assert 'since' in response.data
+    old_token = SyncMixin.encode_sync_token(None, utc_now() - TaskTombstone.retention() - timedelta(days=1))
+    assert sync(authenticated_client, old_token)[0::3] == ([task.id], True)
+
+
+def test_prune_tombstones(task, settings):  # pylint: disable=redefined-outer-name
+    """Tombstones older than the retention are deleted."""
+    task_id = task.id
+    task.delete()
+    call_command('prune_tombstones', stdout=io.StringIO())
+    assert str(TaskTombstone.objects.get()).startswith(f'Task {task_id} deleted at ')
+    settings.TOMBSTONE_RETENTION_DAYS = -1
+    call_command('prune_tombstones', stdout=io.StringIO())
+    assert not TaskTombstone.objects.exists()
+
+
+@pytest.mark.usefixtures('no_list_cache')
+def test_archive_tasks(authenticated_client, task, task_group):  # pylint: disable=redefined-outer-name
+    """
+    Tasks finished long ago are moved to the archive in batches, without tombstones and still counted as done. They're
+    listed and exported along with the others when asked for, and can still be retrieved.
+    """
+    old = [create_task(task.user, task_name=f'Old {i}') for i in range(2)]
+    for old_task in old:
+        old_task.group, old_task.finished_at = task_group, utc_now() - timedelta(days=200)
+        old_task.save()
+    recent = create_task(task.user, task_name='Recent')
+    recent.finished_at = utc_now()
+    recent.save()
+    output = io.StringIO()
+    call_command('archive_tasks', '--batch-size', '1', stdout=output)
+    assert output.getvalue().startswith('Archived 2 tasks of 1 users in ')
+    assert sorted(Task.objects.values_list('name', flat=True)) == ['Recent', task.name]
+    assert str(ArchivedTask.objects.get(pk=old[0].pk)) == 'Old 0'
+    assert not TaskTombstone.objects.exists()
+    assert TaskCounter.objects.get(group=task_group).archived_count == 2
+    stats = authenticated_client.get('/api/task-groups/stats/').data
+    assert stats['total'] == {'open': 1, 'done': 3, 'overdue': 0}
+    names = [result['name'] for result in authenticated_client.get('/api/tasks/').data['results']]
+    assert names == ['Recent', task.name]
+    response = authenticated_client.get('/api/tasks/', {'include_archived': 'true'})
+    assert [result['name'] for result in response.data['results']] == ['Recent', 'Old 1', 'Old 0', task.name]
+    assert response.data['results'][1]['group']['name'] == task_group.name
+    response = authenticated_client.get('/api/tasks/', {'include_archived': 'true', 'group': task_group.pk})
+    assert [result['name'] for result in response.data['results']] == ['Old 1', 'Old 0']
+    export = authenticated_client.get('/api/tasks/export/', {'include_archived': 'true'})
+    assert len(b''.join(export.streaming_content).splitlines()) == 4
+    response = authenticated_client.get(f'/api/tasks/{old[0].pk}/')
+    assert (response.status_code, response.data['name']) == (200, 'Old 0')
+    assert authenticated_client.patch(f'/api/tasks/{old[0].pk}/', {'name': 'Renamed'}).status_code == 404
+    for query in ({'pagination': 'cursor'}, {'search': 'old', 'search__rank': 'true'}):
+        response = authenticated_client.get('/api/tasks/', {'include_archived': 'true', **query})
+        assert response.status_code == 400
+        assert 'include_archived' in response.data
+    call_command('archive_tasks', '--days', '0', stdout=output)
+    assert list(Task.objects.values_list('name', flat=True)) == [task.name]
+    ArchivedTask.objects.bulk_create(
+        ArchivedTask(id=1000 + i, name=f'Bulk {i}', user=task.user, created_at=recent.created_at,
+                     finished_at=recent.finished_at, updated_at=recent.updated_at) for i in range(60)
+    )
+    response = authenticated_client.get('/api/tasks/', {'include_archived': 'true', 'count': 'estimate'})
+    # The counters don't know about the bulk inserted ones, so it's the rows seen
+    assert (response.data['count'], response.data['count_exact']) == (51, False)
+    response = authenticated_client.get('/api/tasks/', {'include_archived': 'true'})
+    assert (response.data['count'], response.data['count_exact']) == (64, True)
+    response = authenticated_client.get('/api/tasks/', {'finished': 'false'})
+    assert (response.data['count'], response.data['count_exact']) == (1, True)
+
+
+def assert_counters_match(user):  # pylint: disable=redefined-outer-name
+    """The counters of the user hold the number of open and done tasks of each group."""
+    expected = {}
+    for group_id, finished_at in Task.objects.filter(user=user).values_list('group_id', 'finished_at'):
+        open_count, done_count = expected.get(group_id, (0, 0))
+        expected[group_id] = (open_count + (finished_at is None), done_count + (finished_at is not None))
+    counters = TaskCounter.objects.filter(user=user).exclude(open_count=0, done_count=0)
+    assert {counter.group_id: (counter.open_count, counter.done_count) for counter in counters} == expected
+
+
+def test_task_counters(authenticated_client, task, task_group):  # pylint: disable=redefined-outer-name
+    """Counters follow tasks created, completed, reopened, moved and deleted, one by one or in bulk."""
+    assert_counters_match(task.user)
+    authenticated_client.post('/api/tasks/', data={'name': 'Created'})
+    authenticated_client.post('/api/tasks/bulk/', data=[
+        {'name': 'First'}, {'name': 'Second', 'finished_at': '2021-01-01T00:00:00Z'},
+    ], format='json')
+    assert_counters_match(task.user)
+    authenticated_client.post(f'/api/tasks/{task.id}/complete/')
+    task.refresh_from_db()
+    task.group = task_group
+    with CaptureQueriesContext(connection) as queries:
+        task.save()
+    # Saves of tasks loaded know how they were counted without reading them again
+    assert not [query for query in queries.captured_queries if 'FROM "taskinator_task" ' in query['sql']]
+    assert_counters_match(task.user)
+    task.refresh_from_db(fields=['name'])
+    task.group = None
+    task.save()
+    assert_counters_match(task.user)
+    task.group = task_group
+    task.save()
+    ids = list(Task.objects.filter(user=task.user).values_list('id', flat=True))
+    authenticated_client.post('/api/tasks/bulk/complete/', data=ids, format='json')
+    assert_counters_match(task.user)
+    response = authenticated_client.patch('/api/tasks/bulk/', data=[
+        {'id': ids[1], 'finished_at': None}, {'id': ids[2], 'name': 'Renamed'},
+    ], format='json')
+    assert response.status_code == 200
+    assert Task.objects.get(id=ids[1]).finished_at is None
+    authenticated_client.patch('/api/tasks/bulk/', data=[{'id': ids[2], 'name': 'Renamed again'}], format='json')
+    assert_counters_match(task.user)
+    authenticated_client.delete(f'/api/tasks/{ids[1]}/')
+    authenticated_client.delete('/api/tasks/bulk/', data=[ids[2]], format='json')
+    assert_counters_match(task.user)
+    authenticated_client.delete(f'/api/task-groups/{task_group.id}/')
+    assert_counters_match(task.user)
+    assert str(TaskCounter.objects.get()) == '0 open and 1 done tasks of no group'
+
+
+def test_load_tasks(tmp_path, task_group):  # pylint: disable=redefined-outer-name
+    """
+    Tasks are loaded in batches, creating the groups they name and counting them. Tasks of a group conflict with the
+    ones of the same name, which are skipped or updated if asked to.
+    """
+    user = task_group.user
+    path = tmp_path / 'tasks.csv'
+    with open(path, 'w', newline='', encoding='utf-8') as tasks:
+        writer = csv.writer(tasks)
+        writer.writerow(['name', 'description', 'due_date', 'finished_at', 'group.name'])
+        writer.writerows([
+            ['Write', 'The report', '2021-03-01', '', task_group.name], ['Send', '', '', '2021-03-02T10:00:00', 'Mail'],
+            ['Rest', '', '', '', ''], ['Send', '', '', '', 'Mail'],
+        ])
+    output = io.StringIO()
+    call_command('load_tasks', str(path), '--user', user.username, '--batch-size', '2', '--on-conflict', 'skip',
+                 '--verbosity', '2', stdout=output)
+    assert output.getvalue().splitlines()[0].startswith('2 tasks read in ')
+    assert ': 3 created, 0 updated, 1 skipped.' in output.getvalue()
+    send = Task.objects.get(name='Send')
+    assert (send.group.name, send.finished_at) == ('Mail', utc_now().replace(2021, 3, 2, 10, 0, 0, 0))
+    assert Task.objects.get(name='Write').due_date == date(2021, 3, 1)
+    assert_counters_match(user)
+    call_command('load_tasks', str(path), '--user', user.username, '--on-conflict', 'update', stdout=output)
+    assert ': 1 created, 2 updated, 0 skipped.' in output.getvalue()
+    assert Task.objects.get(name='Send').finished_at is None
+    assert Task.objects.filter(name='Rest').count() == 2
+    assert_counters_match(user)
+    ndjson = tmp_path / 'tasks.ndjson'
+    ndjson.write_text('\n'.join(json.dumps(task) for task in [
+        {'name': 'Read', 'group': {'name': 'Books'}, 'created_at': '2021-01-01T00:00:00Z'}, {'name': 'Write'},
+        {'name': 'Read', 'group': 'Books', 'finished_at': '2021-01-02T00:00:00+03:00'},
+    ]) + '\n\n', encoding='utf-8')
+    call_command('load_tasks', str(ndjson), '--user', user.username, '--on-conflict', 'update', stdout=output)
+    assert ': 2 created, 1 updated, 0 skipped.' in output.getvalue()
+    read = Task.objects.get(name='Read')
+    assert (read.created_at.year, read.finished_at.hour) == (2021, 21)
+    assert_counters_match(user)
+    # Parsed by another process, a batch at a time
+    call_command('load_tasks', str(ndjson), '--user', user.username, '--on-conflict', 'update', '--batch-size', '1',
+                 '--workers', '1', stdout=output)
+    assert ': 1 created, 2 updated, 0 skipped.' in output.getvalue()
+    assert_counters_match(user)
+
+
+def test_load_tasks_skipped(tmp_path, task_group, monkeypatch):  # pylint: disable=redefined-outer-name
+    """
+    Loading a file again with policy skip creates only its ungrouped tasks, and so do tasks written by someone else
+    after the loader looked for conflicts: rows the database skips aren't counted as created.
+    """
+    user = task_group.user
+    path = tmp_path / 'tasks.csv'
+    path.write_text(f'name,group\nWrite,{task_group.name}\nSend,Mail\nRest,\n', encoding='utf-8')
+    output = io.StringIO()
+    call_command('load_tasks', str(path), '--user', user.username, '--on-conflict', 'skip', stdout=output)
+    assert ': 3 created, 0 updated, 0 skipped.' in output.getvalue()
+    call_command('load_tasks', str(path), '--user', user.username, '--on-conflict', 'skip', stdout=output)
+    assert ': 1 created, 0 updated, 2 skipped.' in output.getvalue()
+    assert Task.objects.count() == 4
+    assert_counters_match(user)
+    # As if the tasks were written between the loader's check and its insert
+    monkeypatch.setattr(TaskLoader, 'get_existing', lambda self, tasks: {})
+    call_command('load_tasks', str(path), '--user', user.username, '--on-conflict', 'skip', stdout=output)
+    assert ': 1 created, 0 updated, 2 skipped.' in output.getvalue()
+    assert Task.objects.count() == 5
+    assert_counters_match(user)
+
+
+@pytest.mark.parametrize('content, arguments, message', (
+    ('name,group\nWrite,Work\nWrite,Work\n', [], 'Line 3: there already is a task \'Write\' in group \'Work\'.'),
+    ('name,due_date\nWrite,tomorrow\n', [], "Line 2: Invalid due_date 'tomorrow'."),
+    ('{}\n[1]\n', ['--format', 'ndjson'], 'Line 1: A name of'),
+    ('\n[1]\n', ['--format', 'ndjson'], 'Line 2: Expected an object.'),
+    (json.dumps({'name': 'Write', 'group': 'Work' * 64}), ['--format', 'ndjson'], 'Line 1: Group names have at most'),
+    ('', ['--user', 'Nobody'], "User 'Nobody' not found."),
+))
+def test_load_tasks_errors(tmp_path, user, content, arguments, message):  # pylint: disable=redefined-outer-name
+    """Loads stop at the first invalid or conflicting task, keeping the batches loaded before."""
+    path = tmp_path / 'tasks.csv'
+    path.write_text(content, encoding='utf-8')
+    with pytest.raises(CommandError) as error:
+        call_command('load_tasks', str(path), '--user', user.username, *arguments, stdout=io.StringIO())
+    assert str(error.value).startswith(message)
+    assert not Task.objects.exists()
+    with pytest.raises(CommandError, match='Unknown file extension'):
+        call_command('load_tasks', str(tmp_path / 'tasks'), '--user', user.username)
+    with pytest.raises(CommandError, match='No such file'):
+        call_command('load_tasks', str(tmp_path / 'missing.csv'), '--user', user.username)
+
+
+def test_task_group_stats(authenticated_client, user, task_group):  # pylint: disable=redefined-outer-name
+    """Stats count open, done and overdue tasks per group with the same queries whatever the number of tasks."""
+    today = utc_now().date()
+    Task.objects.create(name='Overdue', user=user, group=task_group, due_date=today - timedelta(days=1))
+    Task.objects.create(name='Due today', user=user, due_date=today)
+    Task.objects.create(name='Done', user=user, group=task_group, finished_at=utc_now(), due_date=date(2020, 1, 1))
+    Task.objects.create(name='Not mine', user=create_user('Someone else'), due_date=date(2020, 1, 1))
+    authenticated_client.get('/api/')
+    with CaptureQueriesContext(connection) as queries:
+        response = authenticated_client.get('/api/task-groups/stats/')
+    assert response.status_code == 200
+    assert response.data == {
+        'total': {'open': 2, 'done': 1, 'overdue': 1},
+        'groups': [
+            {'id': None, 'name': None, 'open': 1, 'done': 0, 'overdue': 0},
+            {'id': task_group.id, 'name': task_group.name, 'open': 1, 'done': 1, 'overdue': 1},
+        ],
+    }
+    Task.objects.bulk_create(Task(name=f'Task {i}', user=user, group=task_group) for i in range(10))
+    with CaptureQueriesContext(connection) as more_tasks_queries:
+        authenticated_client.get('/api/task-groups/stats/')
+    assert len(more_tasks_queries.captured_queries) == len(queries.captured_queries)
+    response = authenticated_client.get('/api/task-groups/stats/', {'today': str(today + timedelta(days=1))})
+    assert response.data['total']['overdue'] == 2
+    for invalid in ('tomorrow', '2021-02-30'):
+        response = authenticated_client.get('/api/task-groups/stats/', {'today': invalid})
+        assert response.status_code == 400
+        assert 'today' in response.data
+
+
+def test_task_group_board(authenticated_client, user, task_group, monkeypatch):  # pylint: disable=redefined-outer-name
+    """
+    The board lists every group with its newest open tasks in two queries, linking to the rest of each group's open
+    tasks by cursor, which lists the same tasks as filtering by group.
+    """
+    other_group = create_task_group(user, 'Empty group')
+    Task.objects.bulk_create(
+        [Task(name=f'Grouped {i}', user=user, group=task_group) for i in range(5)]
+        + [Task(name=f'Loose {i}', user=user) for i in range(3)]
+        + [Task(name='Done', user=user, group=task_group, finished_at=utc_now())]
+        + [Task(name='Not mine', user=create_user('Someone else'))]
+    )
+    authenticated_client.get('/api/')
+    with CaptureQueriesContext(connection) as queries:
+        response = authenticated_client.get('/api/task-groups/board/', {'limit': 2})
+    assert response.status_code == 200
+    assert len(queries.captured_queries) == 2
+    columns = response.json()['groups']
+    assert [(column['name'], [task['name'] for task in column['tasks']]) for column in columns] == [
+        (None, ['Loose 2', 'Loose 1']), (task_group.name, ['Grouped 4', 'Grouped 3']), (other_group.name, []),
+    ]
+    listed = authenticated_client.get('/api/tasks/', {'group': task_group.id, 'finished': 'false'}).json()['results']
+    assert columns[1]['tasks'] == listed[:2]
+    assert columns[2]['next'] is None
+    rest = authenticated_client.get(columns[1]['next']).json()
+    assert [task['name'] for task in rest['results']] == ['Grouped 2', 'Grouped 1', 'Grouped 0']
+    rest = authenticated_client.get(columns[0]['next']).json()
+    assert [task['name'] for task in rest['results']] == ['Loose 0']
+    response = authenticated_client.get('/api/task-groups/board/', {'fields': 'name'})
+    assert response.json()['groups'][0] == {
+        'name': None, 'tasks': [{'name': f'Loose {i}'} for i in (2, 1, 0)], 'next': None
+    }
+    monkeypatch.setattr('taskinator.views.compile_row_encoder', lambda serializer: None)
+    assert authenticated_client.get('/api/task-groups/board/', {'limit': 2}).json()['groups'] == columns
+    for limit in (0, 101, 'all'):
+        response = authenticated_client.get('/api/task-groups/board/', {'limit': limit})
+        assert response.status_code == 400
+        assert 'limit' in response.data
+
+
+def test_tasks_group_filter(authenticated_client, task, task_group):  # pylint: disable=redefined-outer-name
+    """Tasks are filtered by the id of their group, by having none, or not at all for other values."""
+    grouped = create_task(task.user, task_name='Grouped')
+    grouped.group = task_group
+    grouped.save()
+    for group, names in (
+        (task_group.id, ['Grouped']), ('none', [task.name]), ('x', ['Grouped', task.name]),
+        ('²', ['Grouped', task.name]), ('9' * 23, ['Grouped', task.name]),
+    ):
+        response = authenticated_client.get('/api/tasks/', {'group': group})
+        assert response.status_code == 200
+        assert [result['name'] for result in response.data['results']] == names
+
+
+@pytest.mark.usefixtures('no_list_cache')
+def test_tasks_list_constant_queries(authenticated_client, task, task_group):  # pylint: disable=redefined-outer-name
+    """
+    Listing tasks with their nested group takes the same queries for a single task as for a full page, but the one
+    counting them when there's a next page.
+    """
+    task.group = task_group
+    task.save()
+    single_task_queries, listed = count_list_queries(authenticated_client, '/api/tasks/')
+    assert listed == 1
+    other_group = create_task_group(task.user, 'Other task group')
+    Task.objects.bulk_create(
+        Task(name=f'Task {i}', user=task.user, group=(task_group, other_group, None)[i % 3]) for i in range(60)
+    )
+    full_page_queries, listed = count_list_queries(authenticated_client, '/api/tasks/')
+    assert listed == 50
+    assert full_page_queries == single_task_queries + 1
+
+
+@pytest.mark.usefixtures('no_list_cache')
+def test_task_groups_list_constant_queries(authenticated_client, task_group):  # pylint: disable=redefined-outer-name
+    """Listing task groups takes the same queries for a single group as for a full page, but the one counting them."""
+    single_group_queries, _ = count_list_queries(authenticated_client, '/api/task-groups/')
+    TaskGroup.objects.bulk_create(TaskGroup(name=f'Group {i}', user=task_group.user) for i in range(60))
+    full_page_queries, listed = count_list_queries(authenticated_client, '/api/task-groups/')
+    assert listed == 50
+    assert full_page_queries == single_group_queries + 1
+
+
+def test_tasks_sparse_fieldsets(authenticated_client, task, task_group):  # pylint: disable=redefined-outer-name
+    """Only the requested fields are rendered and selected, relations are nested only when expanded."""
+    task.group = task_group
+    task.save()
+    with CaptureQueriesContext(connection) as queries:
+        response = authenticated_client.get('/api/tasks/', data={'fields': 'id,name,finished_at'})
+    assert response.data['results'] == [{'id': task.id, 'name': task.name, 'finished_at': None}]
+    task_query = next(query['sql'] for query in queries.captured_queries if 'FROM "taskinator_task"' in query['sql'])
+    assert 'description' not in task_query
+    assert 'JOIN' not in task_query
+    response = authenticated_client.get('/api/tasks/', data={'fields': 'name,group'})
+    assert response.data['results'] == [{'name': task.name, 'group': task_group.id}]
+    response = authenticated_client.get('/api/tasks/', data={'fields': 'name,group', 'expand': 'group'})
+    assert response.data['results'][0]['group']['name'] == task_group.name
+    response = authenticated_client.get('/api/tasks/', data={'expand': ''})
+    assert response.data['results'][0]['group'] == task_group.id
+    assert response.data['results'][0]['url'].endswith(f'/api/tasks/{task.id}/')
+    response = authenticated_client.patch(f'/api/tasks/{task.id}/?fields=name', data={'description': 'Written'})
+    assert response.status_code == 200
+    assert 'description' in response.data
+
+
+def test_task_groups_sparse_fieldsets(authenticated_client, task_group):  # pylint: disable=redefined-outer-name
+    """Task groups support sparse fieldsets as well."""
+    response = authenticated_client.get('/api/task-groups/', data={'fields': 'id,name'})
+    assert response.data['results'] == [{'id': task_group.id, 'name': task_group.name}]
+
+
+@pytest.mark.parametrize('url', [
+    '/api/tasks/', '/api/tasks/?page=2', '/api/tasks/?pagination=cursor', '/api/tasks/?search=task&search__rank=true',
+    '/api/tasks/?fields=id,name,group', '/api/tasks/?fields=url,group&expand=group', '/api/task-groups/',
+    '/api/task-groups/?fields=id,name', '/api/tasks/?fields=name&pagination=cursor',
+    '/api/task-groups/?fields=name&pagination=cursor',
+])
+@pytest.mark.usefixtures('no_list_cache')
+def test_fast_list_rendering(authenticated_client, task, task_group, monkeypatch, url):
+    # pylint: disable=redefined-outer-name,too-many-arguments
+    """Lists rendered from values_list() rows are byte-identical to the ones rendered by the serializers."""
+    Task.objects.bulk_create(
+        Task(
+            name=f'Task   ñ {i}', user=task.user, group=task_group if i % 2 else None,
+            description='Some "description"' if i % 3 else None, due_date=date(2021, 9, i % 28 + 1) if i % 4 else None,
+            finished_at=utc_now() - timedelta(days=i, microseconds=i) if i % 5 else None,
+        ) for i in range(60)
+    )
+    fast_response = authenticated_client.get(url)
+    monkeypatch.setattr(TaskViewSet, 'fast_list_rendering', False)
+    monkeypatch.setattr(TaskGroupViewSet, 'fast_list_rendering', False)
+    response = authenticated_client.get(url)
+    assert fast_response.status_code == response.status_code == 200
+    assert fast_response.content == response.content
+    assert response.data['results']
+
+
+def test_fast_list_rendering_browsable_api(authenticated_client, task):  # pylint: disable=redefined-outer-name
+    """The browsable API uses the regular list action."""
+    response = authenticated_client.get('/api/tasks/', HTTP_ACCEPT='text/html')
+    assert task.name in response.content.decode()
+
+
+@pytest.mark.usefixtures('no_list_cache')
+def test_fast_list_rendering_unpaginated(authenticated_client, task, monkeypatch):
+    # pylint: disable=redefined-outer-name
+    """Unpaginated lists are rendered from rows as well."""
+    monkeypatch.setattr(TaskViewSet, 'pagination_class', None)
+    fast_response = authenticated_client.get('/api/tasks/')
+    monkeypatch.setattr(TaskViewSet, 'fast_list_rendering', False)
+    response = authenticated_client.get('/api/tasks/')
+    assert fast_response.content == response.content
+    assert response.data[0]['name'] == task.name
+
+
+def test_export(authenticated_client, task, task_group, monkeypatch):  # pylint: disable=redefined-outer-name
+    """Exports stream every task of the user, filtered like the list, as NDJSON or CSV."""
+    Task.objects.create(name='Grouped, "quoted" task', user=task.user, group=task_group)
+    create_task(create_user('Someone else'), 'Not mine')
+    monkeypatch.setattr(TaskViewSet, 'export_chunk_size', 1)
+    listed = authenticated_client.get('/api/tasks/', data={'pagination': 'cursor'}).json()['results']
+    response = authenticated_client.get('/api/tasks/export/')
+    assert response.streaming
+    assert response['Content-Type'] == 'application/x-ndjson'
+    assert response['Content-Disposition'] == 'attachment; filename="tasks.ndjson"'
+    assert [json.loads(line) for line in b''.join(response.streaming_content).splitlines()] == listed
+    response = authenticated_client.get('/api/tasks/export/', data={'finished': 'false'}, HTTP_ACCEPT='text/csv')
+    assert response['Content-Type'] == 'text/csv; charset=utf-8'
+    rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+    assert [row['name'] for row in rows] == [listed_task['name'] for listed_task in listed]
+    assert rows[0]['group.name'] == task_group.name
+    assert rows[1]['group.name'] == ''
+    response = authenticated_client.get('/api/tasks/export.csv', data={'fields': 'id', 'search': 'quoted'})
+    grouped_task = Task.objects.get(group=task_group)
+    assert b''.join(response.streaming_content).decode().split() == ['id', str(grouped_task.id)]
+
+
+@pytest.fixture
+def replica(settings, tmp_path):
+    """Add a SQLite file as the only replica. Call the result to copy the primary into it, else it lags behind."""
+    connections.databases['replica'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(tmp_path / 'replica.db')}
+    settings.DATABASE_ROUTING = {**settings.DATABASE_ROUTING, 'REPLICAS': ['replica']}
+
+    def replicate():
+        connections['replica'].close()
+        connection.ensure_connection()
+        with sqlite3.connect(connections.databases['replica']['NAME']) as target:
+            connection.connection.backup(target)
+
+    yield replicate
+    connections['replica'].close()
+    del connections['replica']
+    del connections.databases['replica']
+
+
+def get_task_names(client, url, **data):  # pylint: disable=redefined-outer-name
+    """Names of the tasks the list at the url gets."""
+    return [listed_task['name'] for listed_task in client.get(url, data=data).json()['results']]
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.usefixtures('no_list_cache')
+def test_replica_reads(authenticated_client, task, replica):  # pylint: disable=redefined-outer-name
+    """Safe requests read from the replica, unless the user wrote recently. Writes and syncs go to the primary."""
+    replica()
+    Task.objects.filter(pk=task.pk).update(name='Not replicated yet')
+    assert authenticated_client.get(f'/api/tasks/{task.pk}/').json()['name'] == 'Test task'
+    assert get_task_names(authenticated_client, '/api/tasks/') == ['Test task']
+    export = authenticated_client.get('/api/tasks/export/')
+    assert json.loads(b''.join(export.streaming_content))['name'] == 'Test task'
+    assert [item['name'] for item in authenticated_client.get('/api/tasks/sync/').json()['changed']] == [
+        'Not replicated yet'
+    ]
+    response = authenticated_client.post('/api/task-groups/', {'name': 'New group'})
+    assert response.status_code == 201
+    assert authenticated_client.get(response.json()['url']).json()['name'] == 'New group'
+    assert get_task_names(authenticated_client, '/api/tasks/') == ['Not replicated yet']
+    assert authenticated_client.post('/api/task-groups/', {}).status_code == 400
+    cache.delete(f'replica-pin:{task.user_id}')
+    assert get_task_names(authenticated_client, '/api/tasks/') == ['Test task']
+    assert authenticated_client.post('/api/task-groups/', {}).status_code == 400
+    assert get_task_names(authenticated_client, '/api/tasks/') == ['Test task']
+    replica()
+    assert get_task_names(authenticated_client, '/api/tasks/') == ['Not replicated yet']
+
+
+@pytest.mark.usefixtures('no_list_cache')
+def test_request_metrics(authenticated_client, task, settings, caplog):  # pylint: disable=redefined-outer-name
+    """Requests are measured into the histograms at /metrics and Server-Timing, logging those making many queries."""
+    settings.METRICS = {**settings.METRICS, 'QUERY_COUNT_WARNING': 1}
+    get_bucketed_registry.cache_clear()
+    with CaptureQueriesContext(connection) as queries:
+        response = authenticated_client.get('/api/tasks/')
+    assert 'db;dur=' in response['Server-Timing']
+    assert f'desc="{len(queries)} queries"' in response['Server-Timing']
+    assert [record.getMessage().split(':')[0] for record in caplog.records] == [
+        f'GET /api/tasks/ (TaskViewSet.list) made {len(queries)} queries in '
+        f'{response["Server-Timing"].split("db;dur=")[1].split(";")[0]}ms, this one 1 times'
+    ]
+    authenticated_client.get(f'/api/tasks/{task.pk}/')
+    authenticated_client.get('/api/')
+    authenticated_client.get('/missing/')
+    settings.METRICS = {**settings.METRICS, 'SERVER_TIMING': False}
+    response = authenticated_client.get(f'/api/tasks/{task.pk}/')
+    assert 'Server-Timing' not in response
+    settings.METRICS = {**settings.METRICS, 'TOKEN': 'scraper'}
+    response = APIClient().get('/metrics', HTTP_AUTHORIZATION='Bearer scraper')
+    assert response['Content-Type'] == 'text/plain; version=0.0.4; charset=utf-8'
+    values = {
+        key: float(value) for key, value in (
+            line.rsplit(' ', 1) for line in response.content.decode().splitlines() if not line.startswith('#')
+        )
+    }
+    retrieve = '{view="TaskViewSet",action="retrieve",method="GET"}'
+    assert values[f'http_request_queries_count{retrieve}'] == 2
+    assert values[f'http_request_serialize_seconds_sum{retrieve}'] > 0
+    assert values[f'http_request_render_seconds_sum{retrieve}'] > 0
+    assert values[f'http_request_db_seconds_bucket{retrieve[:-1]},le="+Inf"}}'] == 2
+    assert values['http_request_duration_seconds_count{view="api-root",action="get",method="GET"}'] == 1
+    assert values['http_request_duration_seconds_count{view="unmatched",action="get",method="GET"}'] == 1
+
+
+def test_metrics_access(client, user, settings):  # pylint: disable=redefined-outer-name
+    """Only staff users, scrapers with the token and allowed addresses get the metrics."""
+    assert client.get('/metrics').status_code == 403
+    settings.METRICS = {**settings.METRICS, 'TOKEN': 'scraper'}
+    assert client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code == 403
+    assert client.get('/metrics', HTTP_AUTHORIZATION='Bearer scraper').status_code == 200
+    client.force_login(user)
+    assert client.get('/metrics').status_code == 403
+    user.is_staff = True
+    user.save()
+    assert client.get('/metrics').status_code == 200
+    client.logout()
+    settings.METRICS = {**settings.METRICS, 'ALLOWED_IPS': ['127.0.0.1']}
+    assert client.get('/metrics').status_code == 200
+
+
+def test_export_without_row_encoder(authenticated_client, task, monkeypatch):  # pylint: disable=redefined-outer-name
+    """Serializers which can't be compiled into a row encoder export model instances."""
+    expected = authenticated_client.get('/api/tasks/export/')
+    monkeypatch.setattr('utils.viewsets.compile_row_encoder', lambda serializer: None)
+    response = authenticated_client.get('/api/tasks/export/')
+    content = b''.join(response.streaming_content)
+    assert content == b''.join(expected.streaming_content)
+    assert json.loads(content)['name'] == task.name
+
+
+def test_cached_token_authentication(authenticated_client, token, user):  # pylint: disable=redefined-outer-name
+    """The token is only looked up in the database until it's cached, and forgotten once deleted or deactivated."""
+    def count_queries():
+        with CaptureQueriesContext(connection) as queries:
+            status_code = authenticated_client.get('/api/').status_code
+        return status_code, len(queries.captured_queries)
+
+    assert count_queries() == (200, 1)
+    assert count_queries() == (200, 0)
+    user.is_active = False
+    user.save()
+    assert count_queries() == (401, 1)
+    user.is_active = True
+    user.save()
+    assert count_queries() == (200, 1)
+    Token.objects.filter(key=token.key).delete()
+    assert count_queries() == (401, 1)
+
+
+def test_list_cache(authenticated_client, task, task_group):  # pylint: disable=redefined-outer-name
+    """Lists are served from the cache with a strong ETag until the user writes tasks or task groups."""
+    def get(url='/api/tasks/', **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = authenticated_client.get(url, **headers)
+        return response, len(queries.captured_queries)
+
+    response, _ = get()
+    etag = response['ETag']
+    assert etag.startswith('"') and response.data['count'] == 1
+    cached_response, queries = get()
+    assert (cached_response.content, cached_response['ETag'], queries) == (response.content, etag, 0)
+    assert cached_response['Content-Type'] == response['Content-Type']
+    not_modified, queries = get(HTTP_IF_NONE_MATCH=f'"other", {etag}')
+    assert (not_modified.status_code, not_modified['ETag'], not_modified.content, queries) == (304, etag, b'', 0)
+    assert get('/api/tasks/?page=1')[1] > 0
+    assert get(HTTP_ACCEPT='text/html')[1] > 0
+    authenticated_client.post(f'/api/tasks/{task.id}/complete/')
+    response, _ = get()
+    assert response['ETag'] != etag and response.data['results'][0]['finished_at'] is not None
+    authenticated_client.patch(f'/api/task-groups/{task_group.id}/', data={'name': 'Renamed'})
+    assert get()[1] > 0
+    task_group.task_set.add(task)
+    etag = get('/api/task-groups/')[0]['ETag']
+    cache.clear()
+    not_modified, _ = get('/api/task-groups/', HTTP_IF_NONE_MATCH=etag)
+    assert (not_modified.status_code, not_modified['ETag']) == (304, etag)
+    task_group.delete()
+    assert get()[0].json()['count'] == 0
+    other_client = APIClient()
+    other_client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=create_user("Other")).key}')
+    create_task(task.user)
+    assert other_client.get('/api/tasks/').json()['count'] == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_views(authenticated_client, task):  # pylint: disable=redefined-outer-name
+    """The async views behave exactly like their sync counterparts."""
+    for url in ('/api/tasks/?fields=id,name', f'/api/tasks/{task.id}/', '/api/task-groups/'):
+        assert authenticated_client.get(f'/api/async{url[4:]}').content == authenticated_client.get(url).content
+    response = authenticated_client.post('/api/async/tasks/', data={'name': 'Async task'})
+    assert response.status_code == 201
+    assert Task.objects.get(name='Async task').user == task.user
+    response = authenticated_client.post(f'/api/async/tasks/{task.id}/complete/')
+    assert response.data['finished_at'] is not None
+    assert authenticated_client.get('/api/async/tasks/', data={'finished': 'false'}).data['count'] == 1
+    # Queries made in the thread pool are measured too
+    assert 'desc="1 queries"' in authenticated_client.get(f'/api/async/tasks/{task.id}/')['Server-Timing']
+
+
+@pytest.mark.django_db(transaction=True)
+def test_change_feed(authenticated_client, token, task, task_group):  # pylint: disable=redefined-outer-name
+    """Changes to the user's tasks and task groups are pushed as Server-Sent Events, from every kind of write."""
+    def make_scope(query_string=b'', headers=()):
+        return {
+            'type': 'http', 'method': 'GET', 'path': '/api/events/', 'query_string': query_string,
+            'headers': [(b'host', b'testserver'), *headers],
+        }
+
+    async def receive_change(communicator):
+        body = (await communicator.receive_output(1))['body'].decode()
+        event_id, event_type, data = body.splitlines()[:3]
+        assert event_type == 'event: change'
+        return int(event_id[4:]), json.loads(data[6:])
+
+    async def follow_changes():
+        communicator = ApplicationCommunicator(
+            application, make_scope(headers=[(b'authorization', f'Token {token.key}'.encode())])
+        )
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        assert (await communicator.receive_output(1))['status'] == 200
+        assert (await communicator.receive_output(1))['body'] == b': connected\n\n'
+        post = sync_to_async(authenticated_client.post)
+        await post(f'/api/tasks/{task.id}/complete/')
+        first_sequence, change = await receive_change(communicator)
+        assert change == {'model': 'task', 'action': 'completed', 'ids': [task.id]}
+        await sync_to_async(authenticated_client.patch)(f'/api/tasks/{task.id}/', data={'name': 'Renamed'})
+        assert (await receive_change(communicator))[1] == {'model': 'task', 'action': 'updated', 'ids': [task.id]}
+        await post('/api/tasks/bulk/', data=[{'name': 'Bulk'}], format='json')
+        assert (await receive_change(communicator))[1] == {'model': 'task', 'action': 'created', 'ids': None}
+        bulk_task = await sync_to_async(Task.objects.get)(name='Bulk')
+        await sync_to_async(authenticated_client.patch)(
+            '/api/tasks/bulk/', data=[{'id': bulk_task.id, 'group': None, 'name': 'Renamed'}], format='json'
+        )
+        assert (await receive_change(communicator))[1] == {'model': 'task', 'action': 'updated', 'ids': [bulk_task.id]}
+        await post('/api/tasks/bulk/complete/', data=[bulk_task.id], format='json')
+        assert (await receive_change(communicator))[1]['action'] == 'completed'
+        task_group_id = task_group.id
+        await sync_to_async(task_group.delete)()
+        assert (await receive_change(communicator))[1] == {
+            'model': 'taskgroup', 'action': 'deleted', 'ids': [task_group_id]
+        }
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(1)
+
+        communicator = ApplicationCommunicator(
+            application, make_scope(f'token={token.key}'.encode(), [(b'last-event-id', str(first_sequence).encode())])
+        )
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        assert (await communicator.receive_output(1))['status'] == 200
+        await communicator.receive_output(1)
+        assert (await receive_change(communicator))[1]['action'] == 'updated'
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(1)
+
+        for query_string, headers in ((b'token=invalid', ()), (b'', [(b'authorization', b'Bearer invalid')])):
+            communicator = ApplicationCommunicator(application, make_scope(query_string, headers))
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            assert (await communicator.receive_output(1))['status'] == 401
+
+    async_to_sync(follow_changes)()
@@ -1,38 +1,278 @@
 """
 API Endpoints for the TODO list.
 """
+from urllib.parse import urlencode
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from rest_framework import viewsets
+from django.utils.dateparse import parse_date
+from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import IntegerField
+from rest_framework.pagination import Cursor
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 
-from taskinator.models import Task, TaskGroup
+from taskinator.models import ArchivedTask, Task, TaskCounter, TaskGroup, TaskTombstone
 from taskinator.serializers import TaskSerializer, TaskGroupSerializer
-from utils.viewsets import CheckNoneFilter, DateFilter, FilterableViewSetMixin, OwnedObjectMixin, TextFilter
+from taskinator.signals import objects_changed
+from utils.viewsets import (
+    BulkModelMixin, CheckNoneFilter, DateFilter, EagerLoadingMixin, ExportMixin, FastListMixin, FilterableViewSetMixin,
+    ForeignKeyFilter, ListCacheMixin, MetricsMixin, OwnedObjectMixin, ReplicaReadsMixin, SyncMixin, TextFilter
+)
 from utils.datetime import utc_now
+from utils.db.queries import first_of_each
+from utils.idempotency import IdempotencyMixin
+from utils.metrics import measured
+from utils.pagination import KeysetPagination
+from utils.search import RANK_ANNOTATION, DatabaseSearchBackend
+from utils.serializers import compile_row_encoder
 
 
-class TaskGroupViewSet(OwnedObjectMixin, viewsets.ModelViewSet):  # pylint: disable=too-many-ancestors
+class TaskGroupViewSet(
+    MetricsMixin, ReplicaReadsMixin, ListCacheMixin, FastListMixin, EagerLoadingMixin, OwnedObjectMixin,
+    viewsets.ModelViewSet
+):
+    # pylint: disable=too-many-ancestors
     """CRUD for TaskGroup model."""
+    fast_list_rendering = True
     serializer_class = TaskGroupSerializer
     queryset = TaskGroup.objects.all()
+    board_limit = IntegerField(min_value=1, max_value=100, default=20)
+
+    @action(detail=False, methods=['GET'])
+    def stats(self, request):
+        """
+        Number of open, done and overdue tasks of each group (id null for tasks without group) and in total. Open and
+        done are read from TaskCounter and overdue from an indexed range query on the due_date of open tasks, so
+        it costs the same whatever the number of tasks. Tasks are overdue from ?today=YYYY-MM-DD, or today in UTC.
+        """
+        today = None
+        if 'today' in request.query_params:
+            try:
+                # None when it isn't formatted as a date, ValueError when it is but it's not a valid one
+                today = parse_date(request.query_params['today'])
+            except ValueError:
+                pass
+            if today is None:
+                raise ValidationError({'today': ['Date has wrong format. Use YYYY-MM-DD.']})
+        counts = {None: {'id': None, 'name': None, 'open': 0, 'done': 0, 'overdue': 0}}
+        for group_id, name in self.get_queryset().order_by('id').values_list('id', 'name'):
+            counts[group_id] = {'id': group_id, 'name': name, 'open': 0, 'done': 0, 'overdue': 0}
+        counters = TaskCounter.objects.filter(user=request.user).values_list('group_id', 'open_count', 'done_count')
+        for group_id, open_count, done_count in counters:
+            counts[group_id].update(open=open_count, done=done_count)
+        overdue = Task.objects.filter(
+            user=request.user, finished_at__isnull=True, due_date__lt=today or utc_now().date()
+        ).order_by().values_list('group_id').annotate(count=Count('pk'))
+        for group_id, count in overdue:
+            counts[group_id]['overdue'] = count
+        total = {key: sum(group[key] for group in counts.values()) for key in ('open', 'done', 'overdue')}
+        return Response({'total': total, 'groups': list(counts.values())})
+
+    @staticmethod
+    def get_board_tasks(tasks, serializer):
+        """(group id, task id, representation) of the tasks, ordered by group and newest first."""
+        tasks = tasks.order_by('group_id', '-id')
+        row_encoder = compile_row_encoder(serializer)
+        if row_encoder is None:
+            to_representation = measured('serialize', serializer.to_representation)
+            return [(task.group_id, task.pk, to_representation(task)) for task in tasks.select_related('group')]
+        paths, encode = row_encoder
+        encode = measured('serialize', encode)
+        # Read after the serializer's paths, so the encoder's indexes don't move
+        rows = tasks.values_list(*paths, 'group_id', 'id')
+        return [(row[-2], row[-1], encode(row)) for row in rows]
+
+    def get_board_next_link(self, group_id, position):
+        """Link to the open tasks of a group after the one with id position, as listed by cursor."""
+        paginator = KeysetPagination()
+        query = urlencode({'finished': 'false', 'group': 'none' if group_id is None else group_id})
+        paginator.base_url = f'{reverse("task-list", request=self.request)}?{query}'
+        return paginator.encode_cursor(Cursor(offset=0, reverse=False, position=str(position)))
 
+    @action(detail=False, methods=['GET'])
+    def board(self, request):
+        """
+        Every group (the one with url null holds the tasks without group) with its first ?limit= open tasks, newest
+        first, so a board is loaded in a single request. The tasks of all groups are read with a single query, ranking
+        them within their group with a window function. next links to the rest of a group's open tasks, by cursor.
+        """
+        try:
+            limit = self.board_limit.run_validation(request.query_params.get('limit', self.board_limit.default))
+        except ValidationError as error:
+            raise ValidationError({'limit': error.detail}) from error
+        groups = list(self.get_queryset().order_by('id'))
+        serializer = self.get_serializer(groups, many=True)
+        columns = {None: {**dict.fromkeys(serializer.child.fields), 'tasks': [], 'next': None}}
+        for group, data in zip(groups, serializer.data):
+            columns[group.pk] = {**data, 'tasks': [], 'next': None}
+        # One more task than shown tells whether a group has more
+        tasks = first_of_each(
+            Task.objects.filter(user=request.user, finished_at__isnull=True), [F('group_id')], F('id').desc(), limit + 1
+        )
+        last_ids = {}
+        task_serializer = TaskSerializer(context=self.get_serializer_context())
+        for group_id, task_id, data in self.get_board_tasks(tasks, task_serializer):
+            column = columns[group_id]
+            if len(column['tasks']) < limit:
+                column['tasks'].append(data)
+            else:
+                column['next'] = self.get_board_next_link(group_id, last_ids[group_id])
+            last_ids[group_id] = task_id
+        return Response({'groups': list(columns.values())})
 
-class TaskViewSet(FilterableViewSetMixin, OwnedObjectMixin, viewsets.ModelViewSet):
+
+class TaskViewSet(
+    MetricsMixin, ReplicaReadsMixin, IdempotencyMixin, ListCacheMixin, FastListMixin, ExportMixin, SyncMixin,
+    EagerLoadingMixin, FilterableViewSetMixin, OwnedObjectMixin, BulkModelMixin, viewsets.ModelViewSet
+):
     # pylint: disable=too-many-ancestors
     """CRUD for Task model."""
+    fast_list_rendering = True
     serializer_class = TaskSerializer
     queryset = Task.objects.all()
+    group_filter = ForeignKeyFilter({'group': 'group'})
     filters = (
         DateFilter({'date': 'created_at', 'finished_at': 'finished_at'}),
         CheckNoneFilter({'finished': 'finished_at'}),
-        TextFilter({'search': {'name', 'description'}})
+        group_filter,
+        TextFilter({'search': {'name', 'description'}}, backend=DatabaseSearchBackend()),
     )
+    # A replica lagging behind more than sync_margin would make clients skip changes for good
+    primary_actions = ('sync',)
+    # Retried by clients on flaky networks
+    idempotent_actions = ('create', 'mark_as_completed')
+    archived_queryset = ArchivedTask.objects.all()
+    include_archived_query_param = 'include_archived'
+    # Actions reading archived tasks along with the others when asked to
+    archive_actions = ('list', 'export')
+
+    def includes_archived(self):
+        """Check whether the client asked for archived tasks as well, and the action can read them."""
+        value = self.request.query_params.get(self.include_archived_query_param, '')
+        return self.action in self.archive_actions and value.lower() == 'true'
+
+    def get_queryset(self):
+        """
+        Tasks, along with the archived ones when asked for. The archive is filtered exactly like tasks, then both are
+        read as one with a UNION, as the archive has the same columns. Unions can't be filtered any further, so they
+        can't be paginated by cursor nor ranked by relevance.
+        """
+        queryset = super().get_queryset()
+        if not self.includes_archived():
+            return queryset
+        if self.paginator is not None and self.paginator.is_cursor_mode(self.request):
+            raise ValidationError({self.include_archived_query_param: ['Cursor pagination does not include them.']})
+        if RANK_ANNOTATION in queryset.query.annotations:
+            raise ValidationError({self.include_archived_query_param: ['Ranked results do not include them.']})
+        # The same mixins build the archived queryset, from the archive
+        self.queryset, tasks = self.archived_queryset, self.queryset
+        try:
+            archived = super().get_queryset()
+        finally:
+            self.queryset = tasks
+        return queryset.order_by().union(archived.order_by(), all=True).order_by('-id')
+
+    def get_object(self):
+        """The task, or the archived one when retrieving it, as archived tasks are listed with their url as well."""
+        try:
+            return super().get_object()
+        except Http404:
+            if self.action != 'retrieve':
+                raise
+        archived = get_object_or_404(self.archived_queryset, user=self.request.user, pk=self.kwargs[self.lookup_field])
+        fields = ArchivedTask._meta.concrete_fields  # pylint: disable=protected-access
+        return Task(**{field.attname: getattr(archived, field.attname) for field in fields})
+
+    def get_count_estimate(self, queryset):  # pylint: disable=unused-argument
+        """
+        Count of the tasks listed from their TaskCounter when they're filtered by nothing but finished and group,
+        which costs the same whatever the number of tasks. None (so the planner estimates it) for other filters.
+        Archived tasks are still counted as done by the counters, so they're discounted unless they're included.
+        """
+        parameter_names = self.get_filter_parameter_names()
+        if not parameter_names <= {'finished', 'group'}:
+            return None
+        counters = self.group_filter(TaskCounter.objects.filter(user=self.request.user), self.request)
+        counts = counters.aggregate(open=Sum('open_count'), done=Sum('done_count'), archived=Sum('archived_count'))
+        if not self.includes_archived():
+            counts['done'] = (counts['done'] or 0) - (counts['archived'] or 0)
+        # Values which aren't keywords don't filter, see CheckNoneFilter
+        finished = self.request.query_params.get('finished')
+        is_empty = CheckNoneFilter.is_empty(finished) if finished is not None else None
+        return sum(counts[key] or 0 for key, empty in (('open', True), ('done', False)) if is_empty in (None, empty))
+
+    def get_deleted_ids(self, since):
+        return TaskTombstone.objects.filter(user=self.request.user, deleted_at__gt=since).values_list(
+            'task_id', flat=True
+        )
+
+    @property
+    def sync_retention(self):
+        """Tasks deletions are tracked while their tombstones are kept."""
+        return TaskTombstone.retention()
+
+    def perform_bulk_create(self, objects):
+        super().perform_bulk_create(objects)
+        TaskCounter.apply(self.request.user.pk, added=[task.counter_key for task in objects])
+
+    def perform_bulk_update(self, instances, fields):
+        previous = []
+        if {'group', 'finished_at'} & set(fields):
+            rows = Task.objects.filter(pk__in=[task.pk for task in instances]).values_list('group_id', 'finished_at')
+            previous = [(group_id, finished_at is not None) for group_id, finished_at in rows]
+        super().perform_bulk_update(instances, fields)
+        if previous:
+            TaskCounter.apply(self.request.user.pk, removed=previous, added=[task.counter_key for task in instances])
+
+    def complete_tasks(self, tasks):
+        """
+        Mark the open tasks of the queryset as done with a single UPDATE, and count them as done in the same
+        transaction. Their groups are read (and locked) first, so tasks already done take that query only. Returns how
+        many were completed.
+        """
+        now = utc_now()
+        open_tasks = tasks.filter(finished_at__isnull=True)
+        with transaction.atomic():
+            group_ids = list(open_tasks.select_for_update().values_list('group_id', flat=True))
+            if not group_ids:
+                return 0
+            completed = open_tasks.update(finished_at=now, updated_at=now)
+            TaskCounter.apply(
+                self.request.user.pk, removed=[(group_id, False) for group_id in group_ids],
+                added=[(group_id, True) for group_id in group_ids]
+            )
+        return completed
+
+    def bulk_changed(self, change, ids):
+        objects_changed(Task, change, self.request.user.pk, ids)
 
     @action(detail=True, methods=['POST', 'PATCH'], url_path='complete')
     def mark_as_completed(self, request, pk=None):  # pylint: disable=invalid-name
-        """Shortcut to mark a task as done, preferred to using Update endpoint to set finished_at."""
-        task = get_object_or_404(Task, pk=pk)
-        task.finished_at = utc_now()
-        task.save()
-        return Response(self.serializer_class(instance=task, context={'request': request}).data)
+        """
+        Shortcut to mark a task as done, preferred to using Update endpoint to set finished_at.
+        A single conditional UPDATE writes finished_at (and updated_at) only, so a task already done keeps its original
+        value. Send ?return=minimal to get an empty 204 response instead of the task.
+        """
+        tasks = self.get_queryset().filter(pk=pk)
+        completed = self.complete_tasks(tasks)
+        if completed:
+            objects_changed(Task, 'completed', request.user.pk, [int(pk)])
+        if request.query_params.get('return') == 'minimal':
+            if not completed and not tasks.exists():
+                raise Http404
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(self.get_serializer(get_object_or_404(tasks)).data)
+
+    @action(detail=False, methods=['POST', 'PATCH'], url_path='bulk/complete')
+    def bulk_complete(self, request):
+        """Mark every task whose id is in the list as done with a single UPDATE. Tasks already done are left as is."""
+        ids = self.get_bulk_ids(self.get_bulk_items(request))
+        completed = self.bulk_write(lambda: self.complete_tasks(self.get_queryset().filter(pk__in=ids)))
+        if completed:
+            objects_changed(Task, 'completed', request.user.pk, ids)
+        return Response({'count': completed})
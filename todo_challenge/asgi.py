@@ -13,4 +13,12 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'todo_challenge.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up by get_asgi_application
+# pylint: disable=wrong-import-position
+from taskinator.events import change_feed  # noqa: E402
+from utils.asgi import PathRouter  # noqa: E402
+
+# Server-Sent Events are served outside Django, whose ASGI handler can't wait for events without blocking a thread
+application = PathRouter({'/api/events/': change_feed}, django_application)
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'utils.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -130,11 +131,55 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication'
+        'utils.authentication.CachedTokenAuthentication'
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated'
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'utils.pagination.PageOrCursorPagination',
     'PAGE_SIZE': 50,
 }
+
+# In-process cache of authenticated tokens, see utils.authentication.DEFAULT_TOKEN_AUTH_CACHE
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 30,
+    'SHARED_CACHE': None,
+}
+
+# Responses replayed to retries sending an Idempotency-Key header, see utils.idempotency.DEFAULT_IDEMPOTENCY
+IDEMPOTENCY = {
+    'MAX_SIZE': 10000,
+    'TTL': 3600,
+    'IN_PROGRESS_TTL': 60,
+    'SHARED_CACHE': None,
+}
+
+# Broker of the change feed, see utils.pubsub. The in-process broker only reaches clients of the same process.
+PUBSUB = {
+    'BROKER': 'utils.pubsub.InProcessBroker',
+    'OPTIONS': {'history': 1000},
+}
+
+# Days deleted tasks are remembered for clients syncing their tasks, see taskinator.models.TaskTombstone
+TOMBSTONE_RETENTION_DAYS = 30
+# Days finished tasks stay in the task table before archive_tasks moves them to the archive
+ARCHIVE_AFTER_DAYS = 90
+
+# Reads of safe requests go to a random replica, and everything else to the primary, see utils.db.routers
+DATABASE_ROUTERS = ['utils.db.routers.ReplicaRouter']
+
+DATABASE_ROUTING = {
+    'PRIMARY': 'default',
+    'REPLICAS': [],
+    'PIN_SECONDS': 5,
+    'PIN_CACHE': 'default',
+}
+
+# Request metrics exposed at /metrics and in Server-Timing headers, see utils.metrics.DEFAULT_METRICS
+METRICS = {
+    'SERVER_TIMING': True,
+    'QUERY_COUNT_WARNING': None,
+    'TOKEN': None,
+    'ALLOWED_IPS': (),
+}
@@ -0,0 +1,122 @@
+"""
+Production settings for todo_challenge project, configured by environment variables. Use them by setting
+DJANGO_SETTINGS_MODULE=todo_challenge.settings_production.
+
+* DJANGO_SECRET_KEY: Required.
+* DJANGO_ALLOWED_HOSTS: Comma separated host names the site is served at.
+* DATABASE_ENGINE: Django database backend. Defaults to SQLite, tuned for a single node deployment (see SQLITE_PRAGMAS).
+* DATABASE_NAME, DATABASE_USER, DATABASE_PASSWORD, DATABASE_HOST, DATABASE_PORT: Where to connect.
+* DATABASE_POOL_SIZE: Most connections each process keeps open in its pool, 10 by default. Requests take a connection
+  from the pool and give it back when they finish. Set 0 to disable the pool and keep a persistent connection per
+  thread for DATABASE_CONN_MAX_AGE seconds (600 by default) instead.
+* DATABASE_POOL_TIMEOUT, DATABASE_POOL_MAX_AGE, DATABASE_POOL_CHECK_AFTER: See utils.db.pool.DEFAULT_POOL.
+* DATABASE_REPLICA_HOSTS: Comma separated hosts of read replicas, configured as the primary otherwise. Reads of safe
+  requests go to them, except for users who wrote in the last DATABASE_PIN_SECONDS (5 by default).
+* CACHE_BACKEND, CACHE_LOCATION: Required. Django cache shared by every process, e.g.
+  django.core.cache.backends.memcached.PyMemcacheCache at memcached:11211, or django_redis.cache.RedisCache at
+  redis://redis:6379/0. The pins of DATABASE_ROUTING and the generations of cached lists are kept there, so each
+  process would serve stale reads and lists with its own. Authenticated tokens and idempotent responses are shared
+  through it as well. Set django.core.cache.backends.locmem.LocMemCache explicitly when running a single process.
+* METRICS_QUERY_COUNT_WARNING: Log a warning for requests making more queries than this, 20 by default.
+* METRICS_TOKEN: Bearer token scrapers send to get /metrics.
+* METRICS_ALLOWED_IPS: Comma separated addresses allowed to get /metrics without a token. Staff users logged in to the
+  admin are allowed as well, anyone else is refused.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from todo_challenge.settings import *  # noqa: F401,F403 pylint: disable=wildcard-import,unused-wildcard-import
+from todo_challenge.settings import BASE_DIR, IDEMPOTENCY, TOKEN_AUTH_CACHE
+
+
+SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+
+DEBUG = False
+
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
+
+
+# Database
+
+SQLITE_PRAGMAS = {
+    # Readers don't block the writer nor the other way around, and commits only append to the log
+    'journal_mode': 'wal',
+    # Durable across application crashes. A power loss may lose the last commits, but never corrupts the database
+    'synchronous': 'normal',
+    # Read through memory mapping instead of system calls, up to 256 MiB
+    'mmap_size': 256 * 1024 * 1024,
+    # Wait up to 5 seconds for the write lock instead of failing right away
+    'busy_timeout': 5000,
+}
+
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'utils.db.sqlite3')
+DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', '10'))
+
+DATABASES = {
+    'default': {
+        'ENGINE': DATABASE_ENGINE,
+        'NAME': os.environ.get('DATABASE_NAME', str(BASE_DIR / 'db.sqlite3')),
+        'USER': os.environ.get('DATABASE_USER', ''),
+        'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+        'HOST': os.environ.get('DATABASE_HOST', ''),
+        'PORT': os.environ.get('DATABASE_PORT', ''),
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', '600')),
+        'OPTIONS': {'pragmas': SQLITE_PRAGMAS} if DATABASE_ENGINE == 'utils.db.sqlite3' else {},
+    },
+}
+
+if DATABASE_POOL_SIZE:
+    DATABASES['default'].update({
+        'ENGINE': 'utils.db.pooled',
+        # Connections go back to the pool at the end of every request, which keeps them open
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'BACKEND': DATABASE_ENGINE,
+            'MAX_SIZE': DATABASE_POOL_SIZE,
+            'TIMEOUT': float(os.environ.get('DATABASE_POOL_TIMEOUT', '30')),
+            'MAX_AGE': float(os.environ.get('DATABASE_POOL_MAX_AGE', '3600')),
+            'CHECK_AFTER': float(os.environ.get('DATABASE_POOL_CHECK_AFTER', '30')),
+        },
+    })
+
+DATABASE_REPLICA_HOSTS = [host for host in os.environ.get('DATABASE_REPLICA_HOSTS', '').split(',') if host]
+
+for index, replica_host in enumerate(DATABASE_REPLICA_HOSTS):
+    DATABASES[f'replica_{index}'] = {**DATABASES['default'], 'HOST': replica_host, 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTING = {
+    'PRIMARY': 'default',
+    'REPLICAS': [f'replica_{index}' for index in range(len(DATABASE_REPLICA_HOSTS))],
+    'PIN_SECONDS': float(os.environ.get('DATABASE_PIN_SECONDS', '5')),
+    'PIN_CACHE': 'default',
+}
+
+
+# Cache
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', '')
+if not CACHE_BACKEND:
+    raise ImproperlyConfigured(
+        'Set CACHE_BACKEND (and CACHE_LOCATION) to a cache shared by every process, or to '
+        'django.core.cache.backends.locmem.LocMemCache when running a single process.'
+    )
+IN_PROCESS_CACHE_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache', )
+
+CACHES = {
+    'default': {'BACKEND': CACHE_BACKEND, 'LOCATION': os.environ.get('CACHE_LOCATION', '')},
+}
+
+if CACHE_BACKEND not in IN_PROCESS_CACHE_BACKENDS:
+    TOKEN_AUTH_CACHE = {**TOKEN_AUTH_CACHE, 'SHARED_CACHE': 'default'}
+    IDEMPOTENCY = {**IDEMPOTENCY, 'SHARED_CACHE': 'default'}
+
+
+# Metrics
+
+METRICS = {
+    'SERVER_TIMING': True,
+    'QUERY_COUNT_WARNING': int(os.environ.get('METRICS_QUERY_COUNT_WARNING', '20')),
+    'TOKEN': os.environ.get('METRICS_TOKEN') or None,
+    'ALLOWED_IPS': [address for address in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if address],
+}
@@ -18,14 +18,33 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from taskinator.views import TaskViewSet, TaskGroupViewSet
+from utils.asgi import async_view
+from utils.metrics import metrics_view
 
 
 router = DefaultRouter()
 router.register('task-groups', TaskGroupViewSet, basename='taskgroup')
 router.register('tasks', TaskViewSet, basename='task')
 
+# The most frequent actions again, as async views for ASGI servers (see utils.asgi.async_view)
+async_urlpatterns = [
+    path('task-groups/', async_view(TaskGroupViewSet.as_view(
+        {'get': 'list', 'post': 'create'}, basename='taskgroup', detail=False
+    ))),
+    path('task-groups/<int:pk>/', async_view(TaskGroupViewSet.as_view(
+        {'get': 'retrieve'}, basename='taskgroup', detail=True
+    ))),
+    path('tasks/', async_view(TaskViewSet.as_view({'get': 'list', 'post': 'create'}, basename='task', detail=False))),
+    path('tasks/<int:pk>/', async_view(TaskViewSet.as_view({'get': 'retrieve'}, basename='task', detail=True))),
+    path('tasks/<int:pk>/complete/', async_view(TaskViewSet.as_view(
+        {'post': 'mark_as_completed', 'patch': 'mark_as_completed'}, basename='task', detail=True
+    ))),
+]
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include(router.urls)),
+    path('api/async/', include(async_urlpatterns)),
+    path('metrics', metrics_view),
 ]
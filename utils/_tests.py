@@ -1,17 +1,63 @@
 """
 Tests for reusable common utils.
 """
+import asyncio
+import threading
+import time
 from datetime import datetime
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.paginator import EmptyPage, PageNotAnInteger
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, OperationalError, connection
+from django.db.models import F, Q, QuerySet
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.template import engines
+from django.template.response import SimpleTemplateResponse
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 
 import pytest
 import pytz
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.authtoken.models import Token
 
 from conftest import create_user, create_task
-from taskinator.models import Task
-from utils.datetime import utc_now
-from utils.viewsets import CheckNoneFilter, DateFilter, Filter, FilterableViewSetMixin, OwnedObjectMixin, TextFilter
+from taskinator.models import Task, TaskGroup
+from taskinator.serializers import TaskSerializer
+from utils.asgi import PathRouter, ServerSentEventsApp, async_view, mark_coroutine_function
+from utils.authentication import TOKEN_AUTH_CACHE_SETTING, CachedTokenAuthentication, get_token_cache
+from utils.cache import GenerationalCache, LRUCache, TieredCache
+from utils.db.queries import first_of_each
+from utils.db.pool import ConnectionPool, PoolTimeout, close_pools
+from utils.db.routers import ReplicaRouter, get_read_alias, is_pinned, pick_replica, pin, read_from
+from utils.datetime import from_microseconds, to_microseconds, utc_now
+from utils.idempotency import IN_PROGRESS, ResponseStore, get_response_store
+from utils.metrics import (
+    Histogram, MetricsMiddleware, RequestMetrics, get_request_metrics, label_request, measured, record_query
+)
+from utils.pagination import (
+    EstimatedCountPagination, EstimatedCountPaginator, get_planner_estimate, get_postgres_row_estimate
+)
+from utils.pubsub import Broker, InProcessBroker, Subscription, get_broker
+from utils.renderers import CSVRenderer, NDJSONRenderer
+from utils.search import (
+    RANK_ANNOTATION, ContainsSearchBackend, DatabaseSearchBackend, PostgresSearchBackend, SQLiteFTSSearchBackend,
+    install_sqlite_fts, uninstall_sqlite_fts
+)
+from utils.serializers import (
+    compile_row_encoder, compile_source, get_converter, get_flat_field_names, get_loaded_fields
+)
+from utils.viewsets import (
+    BulkModelMixin, CheckNoneFilter, DateFilter, EagerLoadingMixin, Filter, FilterableViewSetMixin, OwnedObjectMixin,
+    SyncMixin, TextFilter, compile_lookup_query, get_eager_loading, get_lookup_terms
+)
 
 
 # Allow db usage for all tests within this module
@@ -64,6 +110,21 @@ def test_utc_now():
     assert aware_datetime.tzinfo == pytz.UTC
 
 
+def test_microseconds():
+    """Datetimes go to microseconds since the epoch and back exactly."""
+    now = utc_now()
+    assert from_microseconds(to_microseconds(now)) == now
+    assert to_microseconds(from_microseconds(1)) == 1
+
+
+def test_sync_tokens():
+    """Sync tokens round trip. Deletions aren't tracked by default."""
+    now = utc_now()
+    assert SyncMixin.decode_sync_token(SyncMixin.encode_sync_token((now, 3), now)) == ((now, 3), now)
+    assert SyncMixin.decode_sync_token(SyncMixin.encode_sync_token(None, now)) == (None, now)
+    assert not SyncMixin().get_deleted_ids(now)
+
+
 def test_filter_is_abstract():
     """Ensures Filter class must be subclassed and __call__ method implemented."""
     with pytest.raises(TypeError):
@@ -145,6 +206,40 @@ def test_date_filter(user, task):
     ExampleViewSet.filters = []
 
 
+def test_date_filter_ranges(user, task):
+    """Relative values are combined into ranges, looked up with both bounds in the index."""
+    second_task = create_task(user, 'Other task')
+    third_task = create_task(user, 'Another task')
+    ExampleViewSet.filters = [DateFilter({'date': 'created_at'})]
+    queryset = ExampleViewSet(
+        user=user, date__gt=task.created_at, date__lte=second_task.created_at, unrelated='ignored'
+    ).get_queryset()
+    assert list(queryset) == [second_task]
+    assert 'created_at>? AND created_at<?' in queryset.explain()
+    queryset = ExampleViewSet(user=user, date=third_task.created_at, date__lt=third_task.created_at).get_queryset()
+    assert not queryset.exists()
+    ExampleViewSet.filters = []
+
+
+def test_lookup_filters_compiled(user):
+    """Lookup filters are merged into a single Q, compiled once per set of params sent whatever their values."""
+    filters = (DateFilter({'date': 'created_at'}), CheckNoneFilter({'finished': 'finished_at'}))
+    get_lookup_terms.cache_clear()
+    query = compile_lookup_query(filters, {'finished': 'TRUE', 'date__gte': '2021-01-01', 'page': '2'})
+    assert query == Q(('created_at__gte', '2021-01-01'), ('finished_at__isnull', False))
+    query = compile_lookup_query(filters, {'finished': 'whatever', 'date__gte': '2022-01-01'})
+    assert query == Q(('created_at__gte', '2022-01-01'))
+    assert get_lookup_terms.cache_info()[:2] == (1, 1)  # pylint: disable=no-value-for-parameter
+    assert not compile_lookup_query(filters, {})
+    ExampleViewSet.filters = list(filters)
+    with patch.object(QuerySet, 'filter', autospec=True, side_effect=QuerySet.filter) as queryset_filter:
+        ExampleViewSet(user=user, finished='false', date__lt='2021-01-01T00:00Z').get_queryset()
+    assert queryset_filter.call_count == 2
+    ExampleViewSet.filters = []
+    queryset = Task.objects.all()
+    assert filters[1](queryset, FakeRequest(user=user)) is queryset
+
+
 def test_check_none_filter(user, task):
     """Ensures CheckNoneFilter works."""
     second_task = create_task(user, 'Other task')
@@ -167,3 +262,671 @@ def test_text_filter(user, task):
     queryset = ExampleViewSet(user=user, search='FINDME').get_queryset()
     assert task not in queryset
     assert second_task in queryset
+
+
+def test_text_filter_backend(user, task):
+    """Ensures TextFilter delegates to its search backend and asks for ranking when requested."""
+    backend = Mock()
+    ExampleViewSet.filters = [TextFilter({'search': ['name']}, backend=backend)]
+    ExampleViewSet(user=user, search='Test', search__rank='TRUE').get_queryset()
+    backend.search.assert_called_once()
+    assert backend.search.call_args[0][1:] == (['name'], 'test')
+    assert backend.search.call_args[1] == {'rank': True}
+    ExampleViewSet.filters = []
+    assert isinstance(TextFilter({'search': ['name']}).backend, ContainsSearchBackend)
+    assert task in ContainsSearchBackend().search(Task.objects.all(), ['name', 'description'], 'test', rank=True)
+
+
+def test_sqlite_fts_search(user, task):
+    """The FTS5 index matches substrings in any of the fields and is kept in sync by the table triggers."""
+    backend = SQLiteFTSSearchBackend()
+    fields = ['name', 'description']
+    second_task = create_task(user, 'Other')
+    assert list(backend.search(Task.objects.all(), fields, 'st ta')) == [task]
+    second_task.description = 'This one is a TEST too'
+    second_task.save()
+    assert set(backend.search(Task.objects.all(), fields, 'test')) == {task, second_task}
+    assert list(backend.search(Task.objects.all(), ['name'], 'test')) == [task]
+    Task.objects.filter(id=second_task.id).update(name='Renamed "quoted" test test')
+    ranked = list(backend.search(Task.objects.all(), fields, 'test', rank=True))
+    assert set(ranked) == {task, second_task}
+    assert getattr(ranked[0], RANK_ANNOTATION) >= getattr(ranked[1], RANK_ANNOTATION)
+    assert list(backend.search(Task.objects.all(), fields, '"quoted"')) == [second_task]
+    second_task.delete()
+    assert list(backend.search(Task.objects.all(), fields, 'test')) == [task]
+
+
+def test_sqlite_fts_search_fallback(task):
+    """Texts shorter than a trigram and models without an index fall back to a substring match."""
+    fallback = Mock()
+    backend = SQLiteFTSSearchBackend(fallback=fallback)
+    backend.search(Task.objects.all(), ['name'], 'te')
+    backend.search(User.objects.all(), ['username'], 'test')
+    assert fallback.search.call_count == 2
+    assert list(SQLiteFTSSearchBackend().search(Task.objects.all(), ['name'], 'te')) == [task]
+
+
+def test_sqlite_fts_install(task):
+    """The FTS5 index can be dropped and rebuilt from the table, and is skipped when SQLite can't support it."""
+    def execute(sql, params):  # pylint: disable=unused-argument
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+    schema_editor = Mock(connection=connection, execute=execute)
+    uninstall_sqlite_fts(schema_editor, Task)
+    assert not SQLiteFTSSearchBackend().indexed_columns('default', 'taskinator_task_fts')
+    install_sqlite_fts(schema_editor, Task, ['name', 'description'])
+    assert list(SQLiteFTSSearchBackend().search(Task.objects.all(), ['name'], 'test')) == [task]
+    schema_editor = Mock(connection=connection)
+    with patch.object(connection.Database, 'sqlite_version_info', (3, 33, 0)):
+        install_sqlite_fts(schema_editor, Task, ['name', 'description'])
+    schema_editor.execute.assert_not_called()
+
+
+def test_postgres_search_backend():
+    """The Postgres backend filters and ranks with the same tsvector expression its GIN index is built on."""
+    backend = PostgresSearchBackend()
+    sql = str(backend.search(Task.objects.all(), {'name', 'description'}, 'test', rank=True).query)
+    assert '@@ plainto_tsquery(simple, test)' in sql
+    assert 'ts_rank(to_tsvector(simple, (COALESCE' in sql
+    assert sql.endswith(f'ORDER BY "{RANK_ANNOTATION}" DESC, "taskinator_task"."id" ASC')
+    index = backend.document_index({'name', 'description'}, 'search_idx')
+    assert index.name == 'search_idx'
+    assert str(index.expressions[0]) == str(backend.document({'name', 'description'}))
+
+
+def test_database_search_backend(task):
+    """The database backend dispatches on the vendor of the queryset's database."""
+    sqlite_backend = Mock()
+    default_backend = Mock()
+    DatabaseSearchBackend({'sqlite': sqlite_backend}, default_backend).search(Task.objects.all(), ['name'], 'test')
+    sqlite_backend.search.assert_called_once()
+    DatabaseSearchBackend({}, default_backend).search(Task.objects.all(), ['name'], 'test')
+    default_backend.search.assert_called_once()
+    assert list(DatabaseSearchBackend().search(Task.objects.all(), ['name'], 'test')) == [task]
+
+
+class GroupWithTasksSerializer(serializers.ModelSerializer):  # pylint: disable=too-few-public-methods
+    """Serializer nesting many objects, which in turn nest single objects."""
+    tasks = TaskSerializer(source='task_set', many=True, read_only=True)
+    owner = serializers.CharField(source='user.username')
+
+    class Meta:
+        model = TaskGroup
+        fields = ('name', 'tasks', 'owner')
+        depth = 1
+
+
+def test_get_eager_loading():
+    """Ensures relations nested by serializers are loaded with select_related or prefetch_related as needed."""
+    assert get_eager_loading(TaskSerializer()) == (['group'], [])
+    assert get_eager_loading(GroupWithTasksSerializer()) == ([], ['task_set', 'task_set__group'])
+
+
+def test_eager_loading_mixin():
+    """Makes sure the viewset queryset follows the relations nested by its serializer."""
+    class EagerViewSet(EagerLoadingMixin, FakeViewSet):  # pylint: disable=too-few-public-methods
+        """ViewSet with a serializer nesting relations."""
+        queryset = TaskGroup.objects.all()
+
+        def get_serializer(self):
+            """Get a serializer nesting tasks."""
+            return GroupWithTasksSerializer()
+
+    queryset = EagerViewSet().get_queryset()
+    assert queryset._prefetch_related_lookups == ('task_set', 'task_set__group')  # pylint: disable=protected-access
+    assert not queryset.query.select_related
+
+
+def test_get_loaded_fields():
+    """Ensures the model fields read by serializers are found, unless they can't be told."""
+    class TaskIdsSerializer(serializers.ModelSerializer):  # pylint: disable=too-few-public-methods
+        """Serializer with a reverse relation."""
+        task_ids = serializers.PrimaryKeyRelatedField(source='task_set', many=True, read_only=True)
+
+        class Meta:
+            model = TaskGroup
+            fields = ('name', 'task_ids')
+
+    class PropertySerializer(serializers.ModelSerializer):  # pylint: disable=too-few-public-methods
+        """Serializer reading something which isn't a model field."""
+        label = serializers.CharField(source='get_label')
+
+        class Meta:
+            model = TaskGroup
+            fields = ('label', )
+
+    class NestedPropertySerializer(serializers.ModelSerializer):  # pylint: disable=too-few-public-methods
+        """Serializer nesting a serializer which reads something which isn't a model field."""
+        group = PropertySerializer()
+
+        class Meta:
+            model = Task
+            fields = ('group', )
+
+    assert set(get_loaded_fields(TaskSerializer())) == {
+        'id', 'name', 'description', 'due_date', 'created_at', 'finished_at', 'updated_at', 'user',
+        'group', 'group__id', 'group__name', 'group__user',
+    }
+    assert get_loaded_fields(TaskIdsSerializer()) == ['id', 'name']
+    assert get_loaded_fields(GroupWithTasksSerializer()) is None
+    assert get_loaded_fields(PropertySerializer()) is None
+    assert get_loaded_fields(NestedPropertySerializer()) is None
+
+
+def test_get_converter():
+    """Ensures converters render database values exactly like the fields do."""
+    aware_datetime = utc_now()
+    naive_datetime = datetime(2021, 9, 25, 15, 10)
+    for field, value in (
+        (serializers.DateTimeField(), aware_datetime),
+        (serializers.DateTimeField(), naive_datetime),
+        (serializers.DateTimeField(format='%Y'), aware_datetime),
+        (serializers.DateField(), aware_datetime.date()),
+        (serializers.IntegerField(), 1),
+        (serializers.CharField(), 'Text'),
+        (serializers.BooleanField(), True),
+        (serializers.PrimaryKeyRelatedField(read_only=True, pk_field=serializers.CharField()), 1),
+    ):
+        converter = get_converter(field)
+        expected = field.to_representation(value) if not isinstance(field, serializers.RelatedField) else '1'
+        assert converter(value) == expected
+    assert get_converter(serializers.ReadOnlyField()) is None
+    assert get_converter(serializers.PrimaryKeyRelatedField(read_only=True)) is None
+
+
+def test_compile_row_encoder(user, task_group, settings):
+    """Ensures rows are rendered like the serializer renders instances, unless it reads what a row can't have."""
+    class RowSerializer(serializers.ModelSerializer):  # pylint: disable=too-few-public-methods
+        """Serializer with a write only field and a nested serializer."""
+        secret = serializers.CharField(write_only=True)
+        group = serializers.PrimaryKeyRelatedField(read_only=True)
+
+        class Meta:
+            model = Task
+            fields = ('id', 'name', 'secret', 'group')
+
+    class GroupLabelSerializer(serializers.ModelSerializer):  # pylint: disable=too-few-public-methods
+        """Serializer reading something which isn't a model field."""
+        label = serializers.CharField(source='get_label')
+
+        class Meta:
+            model = TaskGroup
+            fields = ('label', )
+
+    task = Task.objects.create(name='Row', user=user, group=task_group)
+    paths, encode = compile_row_encoder(RowSerializer())
+    assert paths == ['id', 'name', 'group_id']
+    assert encode(Task.objects.values_list(*paths).get(id=task.id)) == RowSerializer(task).data
+    for field in (
+        serializers.HyperlinkedIdentityField(view_name='task-detail', lookup_field='name'),
+        serializers.SerializerMethodField(),
+        serializers.CharField(source='group.name'),
+        serializers.CharField(source='get_label'),
+        serializers.IntegerField(source='taskgroup'),
+        serializers.SlugRelatedField(source='user', slug_field='username', read_only=True),
+        serializers.PrimaryKeyRelatedField(source='user.groups', many=True, read_only=True),
+        GroupLabelSerializer(source='group'),
+    ):
+        serializer = RowSerializer(context={'request': None})
+        serializer.fields['extra'] = field
+        assert compile_row_encoder(serializer) is None
+    serializer = RowSerializer(context={'request': None})
+    serializer.fields['extra'] = serializers.HyperlinkedIdentityField(view_name='task-detail')
+    assert compile_row_encoder(serializer) is not None
+    with patch.object(serializers.HyperlinkedIdentityField, 'get_url', return_value=None):
+        assert compile_row_encoder(serializer) is None
+    compile_source.cache_clear()
+    settings.ALLOWED_HOSTS = ['.example.com']
+    for host in ('one.example.com', 'two.example.com'):
+        serializer = RowSerializer(context={'request': RequestFactory().get('/', HTTP_HOST=host)})
+        serializer.fields['url'] = serializers.HyperlinkedIdentityField(view_name='task-detail')
+        paths, encode = compile_row_encoder(serializer)
+        assert encode(Task.objects.values_list(*paths).get(id=task.id))['url'].startswith(f'http://{host}/')
+    # The host isn't part of the code compiled, so requests sent to any host don't grow the cache
+    assert compile_source.cache_info().currsize == 1
+    group_serializer = GroupLabelSerializer()
+    group_serializer.fields['label'] = serializers.IntegerField(source='task')
+    assert compile_row_encoder(group_serializer) is None
+
+
+def test_streaming_renderers():
+    """Streaming renderers render the header before any row, and render regular data at once as well."""
+    rows = [{'id': 1, 'group': {'name': 'Some, group'}, 'tags': [1, 2]}, {'id': 2, 'group': None, 'tags': []}]
+    columns = ['id', 'group.name', 'tags']
+    chunks = list(CSVRenderer().stream(iter(rows), columns, 1))
+    assert chunks == [b'id,group.name,tags\r\n', b'1,"Some, group","[1, 2]"\r\n', b'2,,[]\r\n']
+    assert list(NDJSONRenderer().stream([], columns, 1)) == [b'']
+    assert NDJSONRenderer().render([{'id': 1}, {'id': 2}]) == b'{"id":1}\n{"id":2}\n'
+    assert CSVRenderer().render({'detail': 'Not found.'}) == b'detail\r\nNot found.\r\n'
+    assert CSVRenderer().render(None) == b''
+    serializer = TaskSerializer()
+    serializer.fields['secret'] = serializers.CharField(write_only=True)
+    assert get_flat_field_names(serializer) == [
+        'url', 'user_id', 'group.url', 'group.user_id', 'group.name', 'name', 'description', 'due_date', 'created_at',
+        'finished_at', 'updated_at',
+    ]
+
+
+def test_lru_cache():
+    """Entries expire after the TTL and the least recently used ones are evicted first."""
+    now = [0]
+    cache = LRUCache(max_size=2, ttl=10, timer=lambda: now[0])
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert (cache.get('a'), cache.get('b', 'missing'), cache.get('c')) == (1, 'missing', 3)
+    now[0] = 10
+    assert cache.get('a') is None
+    assert len(cache) == 1
+    cache.delete('c')
+    cache.delete('c')
+    assert cache.add('d', 4)
+    assert not cache.add('d', 5)
+    assert cache.get('d') == 4
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_connection_pool():
+    """Connections are reused, checked after being idle, replaced when old and capped in number."""
+    now = [0]
+    pool = ConnectionPool(max_size=2, timeout=0, max_age=100, check_after=10, timer=lambda: now[0])
+    first = pool.acquire(Mock)
+    pool.release(first)
+    assert pool.acquire(Mock) is first
+    second = pool.acquire(Mock)
+    assert second is not first
+    with pytest.raises(PoolTimeout):
+        pool.acquire(Mock)
+    pool.release(second, reusable=False)
+    second.close.assert_called_once()
+    pool.release(first)
+    now[0] = 20
+    assert pool.acquire(Mock) is first
+    first.cursor.return_value.execute.assert_called_once_with('SELECT 1')
+    pool.release(first)
+    now[0] = 40
+    first.cursor.side_effect = Exception('Connection lost')
+    third = pool.acquire(Mock)
+    assert third is not first
+    first.close.assert_called_once()
+    pool.release(third)
+    now[0] = 240
+    fourth = pool.acquire(Mock)
+    assert fourth is not third
+    third.close.assert_called_once()
+    with pytest.raises(ValueError):
+        pool.acquire(Mock(side_effect=ValueError))
+    assert pool.size == 1
+    unknown = Mock()
+    pool.release(unknown)
+    unknown.close.assert_called_once()
+
+
+def test_connection_pool_release():
+    """Connections which can't roll back are discarded, waiting threads get released ones, close closes idle ones."""
+    pool = ConnectionPool(max_size=1, timeout=5)
+    broken = pool.acquire(Mock)
+    broken.rollback.side_effect = broken.close.side_effect = Exception('Connection lost')
+    pool.release(broken)
+    assert pool.size == 0
+    first = pool.acquire(Mock)
+    releaser = threading.Timer(0.05, pool.release, (first,))
+    releaser.start()
+    assert pool.acquire(Mock) is first
+    releaser.join()
+    pool.release(first)
+    pool.close()
+    assert (len(pool), pool.size) == (0, 0)
+    first.close.assert_called_once()
+
+
+def test_pooled_database_backend(tmp_path):
+    """The pooled backend reuses the connections of another backend. The SQLite one sets the configured pragmas."""
+    settings_dict = {
+        'ENGINE': 'utils.db.pooled', 'NAME': str(tmp_path / 'db.sqlite3'),
+        'OPTIONS': {'pragmas': {'journal_mode': 'wal', 'synchronous': 'normal'}},
+        'POOL': {'BACKEND': 'utils.db.sqlite3', 'MAX_SIZE': 1, 'TIMEOUT': 0},
+    }
+    database = ConnectionHandler({'default': settings_dict})['default']
+    assert database.vendor == 'sqlite'
+    with database.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        assert cursor.fetchone() == ('wal',)
+    raw_connection = database.connection
+    database.close()
+    database.connect()
+    assert database.connection is raw_connection
+    with pytest.raises(OperationalError):
+        ConnectionHandler({'default': settings_dict})['default'].ensure_connection()
+    database.errors_occurred = True
+    database.close()
+    database.connect()
+    assert database.connection is raw_connection
+    # As if it was closed in the middle of a transaction
+    database.in_atomic_block = True
+    database.close()
+    database.connect()
+    assert database.connection is not raw_connection
+    database.close()
+    close_pools()
+    invalid = {**settings_dict, 'OPTIONS': {'pragmas': {'journal_mode = off; --': 'wal'}}}
+    with pytest.raises(ImproperlyConfigured):
+        ConnectionHandler({'default': invalid})['default'].ensure_connection()
+
+
+def test_replica_router(task):  # pylint: disable=redefined-outer-name
+    """Reads go to the alias of the context or of their instance, writes to the primary, migrations skip replicas."""
+    router = ReplicaRouter()
+    assert pick_replica() is None
+    with override_settings(DATABASE_ROUTING={'PRIMARY': 'primary', 'REPLICAS': ['replica']}):
+        assert (get_read_alias(), pick_replica()) == ('primary', 'replica')
+        with read_from('replica'):
+            assert router.db_for_read(Task) == 'replica'
+            with read_from(None):
+                assert router.db_for_read(Task) == 'primary'
+            assert router.db_for_read(Task, instance=task) == 'default'
+            assert router.db_for_write(Task, instance=task) == 'primary'
+        assert router.db_for_read(Task) == 'primary'
+        assert router.allow_relation(task, task.user)
+        assert (router.allow_migrate('primary', 'taskinator'), router.allow_migrate('replica', 'taskinator')) == (
+            True, False
+        )
+
+
+def test_replica_pins(user):  # pylint: disable=redefined-outer-name
+    """Users are pinned to the primary for PIN_SECONDS after writing."""
+    assert not is_pinned(user.pk)
+    pin(user.pk)
+    assert is_pinned(user.pk)
+    with override_settings(DATABASE_ROUTING={'PIN_SECONDS': 0}):
+        other_user = create_user('Other')
+        pin(other_user.pk)
+        assert not is_pinned(other_user.pk)
+
+
+def test_first_of_each(user):  # pylint: disable=redefined-outer-name
+    """Only the first rows of each partition are kept, in a single query."""
+    Task.objects.bulk_create(Task(name=f'Task {i}', user=user, due_date=datetime(2021, 1, i % 3 + 1)) for i in range(9))
+    tasks = first_of_each(Task.objects.filter(user=user), [F('due_date')], F('id').asc(), 2)
+    with CaptureQueriesContext(connection) as queries:
+        names = list(tasks.order_by('id').values_list('name', flat=True))
+    assert names == [f'Task {i}' for i in range(6)]
+    assert len(queries) == 1 and 'ROW_NUMBER() OVER (PARTITION BY' in queries[0]['sql']
+
+
+def test_planner_estimate(task):  # pylint: disable=redefined-outer-name
+    """Planners are asked for their estimate on PostgreSQL only, from its JSON plan."""
+    assert get_planner_estimate(Task.objects.all()) is None
+    with patch.object(QuerySet, 'explain', return_value='[{"Plan": {"Node Type": "Seq Scan", "Plan Rows": 42}}]'):
+        assert get_postgres_row_estimate(Task.objects.filter(user=task.user)) == 42
+    with patch.dict('utils.pagination.ROW_ESTIMATORS', {'sqlite': lambda queryset: 7}):
+        assert get_planner_estimate(Task.objects.all()) == 7
+
+
+def test_estimated_count_paginator():
+    """
+    Pages are read with one extra row, and counted exactly but on the last page, unless there's an estimate, which
+    may be unknown.
+    """
+    estimate = Mock(return_value=None)
+    paginator = EstimatedCountPaginator(list(range(5)), 2, estimate_count=estimate)
+    page = paginator.page(2.0)
+    assert (list(page), page.has_next(), paginator.total, paginator.is_exact) == ([2, 3], True, None, False)
+    estimate.assert_called_once_with()
+    page = EstimatedCountPaginator(list(range(5)), 2, estimate_count=lambda: 1).page(1)
+    assert (page.has_next(), page.paginator.total, page.paginator.is_exact) == (True, 3, False)
+    paginator = EstimatedCountPaginator(list(range(5)), 2)
+    assert (paginator.page(1).has_next(), paginator.total, paginator.is_exact) == (True, 5, True)
+    paginator = EstimatedCountPaginator(list(range(5)), 2, estimate_count=estimate)
+    assert (paginator.page(3).has_next(), paginator.total, paginator.is_exact) == (False, 5, True)
+    assert estimate.call_count == 1
+    assert not list(EstimatedCountPaginator([], 2).page(1))
+    for number, error in ((1.5, PageNotAnInteger), ('x', PageNotAnInteger), (0, EmptyPage), (4, EmptyPage)):
+        with pytest.raises(error):
+            EstimatedCountPaginator(list(range(5)), 2).page(number)
+    with pytest.raises(EmptyPage):
+        EstimatedCountPaginator([], 2, allow_empty_first_page=False).page(1)
+    schema = EstimatedCountPagination().get_paginated_response_schema({'type': 'array'})
+    assert schema['properties']['count']['nullable'] and schema['properties']['count_exact']['type'] == 'boolean'
+
+
+def test_histogram():
+    """Histograms count values in cumulative buckets per labels, escaping label values."""
+    histogram = Histogram('test_seconds', 'Test.', (1, 0.5))
+    histogram.observe((('view', 'a"b'), ), 0.5)
+    histogram.observe((('view', 'a"b'), ), 2)
+    histogram.observe((('view', 'c\\d\n'), ), 0.1)
+    assert histogram.render() == [
+        '# HELP test_seconds Test.', '# TYPE test_seconds histogram',
+        'test_seconds_bucket{view="a\\"b",le="0.5"} 1', 'test_seconds_bucket{view="a\\"b",le="1"} 1',
+        'test_seconds_bucket{view="a\\"b",le="+Inf"} 2', 'test_seconds_sum{view="a\\"b"} 2.5',
+        'test_seconds_count{view="a\\"b"} 2',
+        'test_seconds_bucket{view="c\\\\d\\n",le="0.5"} 1', 'test_seconds_bucket{view="c\\\\d\\n",le="1"} 1',
+        'test_seconds_bucket{view="c\\\\d\\n",le="+Inf"} 1', 'test_seconds_sum{view="c\\\\d\\n"} 0.1',
+        'test_seconds_count{view="c\\\\d\\n"} 1',
+    ]
+
+
+def test_request_metrics():
+    """Timings leave out the queries made meanwhile. Outside of requests nothing is measured."""
+    ticks = iter(range(100))
+    metrics = RequestMetrics('GET', record_statements=True, timer=lambda: next(ticks))
+
+    def serialize():
+        record_query(lambda *args: None, 'SELECT 1', (), False, {})
+        return 'serialized'
+
+    assert measured('serialize', serialize)() == 'serialized'
+    label_request('View', 'action')
+    assert (get_request_metrics(), metrics.queries, metrics.view) == (None, 0, None)
+    with patch('utils.metrics._request_metrics') as request_metrics:
+        request_metrics.get.return_value = metrics
+        assert measured('serialize', serialize)() == 'serialized'
+    assert (metrics.queries, metrics.db_time, metrics.timings['serialize']) == (1, 1, 2)
+    assert metrics.statements == {'SELECT 1': 1}
+
+
+def test_token_cache_shared_tier(user):
+    """Tokens are shared between processes through the shared cache, which is invalidated as well."""
+    shared_settings = {
+        'CACHES': {
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'tokens': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tokens'},
+        },
+        TOKEN_AUTH_CACHE_SETTING: {'SHARED_CACHE': 'tokens'},
+    }
+    with override_settings(**shared_settings):
+        token_cache = get_token_cache()
+        token = Token.objects.create(user=user)
+        assert CachedTokenAuthentication().authenticate_credentials(token.key) == (user, token)
+        token_cache.local.clear()
+        assert token_cache.get(token.key) == (user, token)
+        assert token_cache.local.get(token.key) == (user, token)
+        assert caches['tokens'].get(f'token-auth:{token.key}') == (user, token)
+        key = token.key
+        token.delete()
+        token_cache.local.clear()
+        assert token_cache.get(key) is None
+    assert get_token_cache() is not token_cache
+    assert get_token_cache().shared is None
+
+
+def test_tiered_cache_add(settings):
+    """Adding a key cached by another process only, through the shared cache, fails."""
+    settings.CACHES = {'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tiered'}}
+    first, second = TieredCache(10, 10, 'shared'), TieredCache(10, 10, 'shared')
+    assert first.add('key', 'first')
+    assert not second.add('key', 'second')
+    assert (second.get('key'), len(second.local)) == ('first', 1)
+    second.delete('key')
+    assert second.add('key', 'second')
+    assert not second.add('key', 'third')
+    settings.IDEMPOTENCY = {'SHARED_CACHE': 'shared'}
+    assert get_response_store().shared is caches['shared']
+
+
+def test_response_store_in_progress_ttl():
+    """The marker of keys being handled expires after its own TTL, in every tier, and responses after theirs."""
+    now = [0]
+    store = ResponseStore(10, 3600, in_progress_ttl=60)
+    store.local.timer = lambda: now[0]
+    store.shared = Mock()
+    assert store.add('pending', IN_PROGRESS)
+    store.shared.add.assert_called_once_with('idempotency:pending', IN_PROGRESS, 60)
+    store.set('done', ('fingerprint', 201, {}, {}))
+    store.shared.set.assert_called_once_with('idempotency:done', ('fingerprint', 201, {}, {}), 3600)
+    now[0] = 60
+    assert store.add('pending', IN_PROGRESS)
+    assert store.get('done') == ('fingerprint', 201, {}, {})
+    assert ResponseStore(10, 3600).in_progress_ttl == 3600
+
+
+def test_bulk_write_conflict_message():
+    """Constraint violations of models without unique together fields get a generic message, without SQL."""
+    view = BulkModelMixin()
+    view.get_queryset = Mock(return_value=Token.objects.all())
+    with pytest.raises(ValidationError) as error:
+        view.bulk_write(Mock(side_effect=IntegrityError('UNIQUE constraint failed: authtoken_token.user_id')))
+    assert error.value.detail == {'non_field_errors': ['The items conflict with existing objects or with each other.']}
+
+
+def test_generational_cache():
+    """Bumping a scope invalidates its entries only, even when its generation was evicted."""
+    generational_cache = GenerationalCache('test')
+    generation = generational_cache.get_generation(1)
+    generational_cache.set(1, generation, 'key', 'value')
+    generational_cache.set(2, generational_cache.get_generation(2), 'key', 'other value')
+    assert generational_cache.get(1, generation, 'key') == 'value'
+    generational_cache.bump(1)
+    assert generational_cache.get(1, generational_cache.get_generation(1), 'key') is None
+    assert generational_cache.get(2, generational_cache.get_generation(2), 'key') == 'other value'
+    generational_cache.cache.delete(generational_cache.generation_key(2))
+    generational_cache.bump(2)
+    assert generational_cache.get(2, generational_cache.get_generation(2), 'key') is None
+
+
+def test_async_view():
+    """Async views run their sync view in the thread pool, so concurrent requests don't wait for each other."""
+    def view(request, *args, **kwargs):  # pylint: disable=unused-argument
+        time.sleep(0.1)
+        return SimpleTemplateResponse(engines['django'].from_string('{{ thread }}'), {'thread': threading.get_ident()})
+
+    async def run_concurrently():
+        handler = async_view(view)
+        return await asyncio.gather(*(handler(FakeRequest()) for _ in range(4)))
+
+    start = time.perf_counter()
+    responses = async_to_sync(run_concurrently)()
+    assert time.perf_counter() - start < 0.3
+    assert all(response.is_rendered for response in responses)
+    assert len({response.content for response in responses}) == 4
+    assert asyncio.iscoroutinefunction(async_view(view))
+
+
+def test_async_metrics_middleware():
+    """Under ASGI the middleware chain stays async, and requests are measured all the same."""
+    handler = ASGIHandler()
+    handler.load_middleware(is_async=True)
+    assert asyncio.iscoroutinefunction(handler._middleware_chain)  # pylint: disable=protected-access
+
+    async def get_response(request):  # pylint: disable=unused-argument
+        get_request_metrics().timings['render'] = 0.001
+        return HttpResponse()
+
+    middleware = MetricsMiddleware(get_response)
+    assert asyncio.iscoroutinefunction(middleware)
+    response = async_to_sync(middleware)(RequestFactory().get('/'))
+    assert 'render;dur=1.0' in response['Server-Timing']
+    assert get_request_metrics() is None
+    assert asyncio.iscoroutinefunction(mark_coroutine_function(Mock()))
+
+
+def test_in_process_broker():
+    """Subscribers get the events published from any thread, and may resume from a sequence number."""
+    broker = InProcessBroker(history=3)
+
+    async def subscribe_and_publish():
+        async with broker.subscribe('channel') as subscription:
+            await asyncio.get_event_loop().run_in_executor(None, broker.publish, 'channel', 'first')
+            sequence, data = await subscription.get()
+            assert data == 'first' and not subscription.reset
+        assert not broker.get_channel_state('channel').subscribers
+        for data in ('second', 'third', 'fourth'):
+            last_sequence = broker.publish('channel', data)
+        async with broker.subscribe('channel', after=sequence + 1) as subscription:
+            assert [await subscription.get() for _ in range(2)] == [
+                (last_sequence - 1, 'third'), (last_sequence, 'fourth')
+            ]
+            broker.publish('channel', 'fifth')
+            assert await subscription.get() == (last_sequence + 1, 'fifth')
+        for after in (sequence, last_sequence + 2):
+            subscription = broker.subscribe('channel', after=after)
+            assert subscription.reset and not subscription.backlog
+            subscription.close()
+            subscription.close()
+        assert not broker.subscribe('channel', after=last_sequence + 1).reset
+
+    async_to_sync(subscribe_and_publish)()
+    assert Subscription(asyncio.Queue(), [(1, 'old'), (2, 'new')], after=1).backlog
+    with pytest.raises(TypeError):
+        Broker()  # pylint: disable=abstract-class-instantiated
+
+
+def test_get_broker():
+    """The broker is built from the PUBSUB setting, again whenever it changes."""
+    assert isinstance(get_broker(), InProcessBroker)
+    with override_settings(PUBSUB={'OPTIONS': {'history': 5}}):
+        assert get_broker().history == 5
+    assert get_broker().history == 1000
+
+
+def test_server_sent_events_app():
+    """The app streams the events of the channel get_channel returns, rejecting requests without one."""
+    broker = InProcessBroker()
+
+    async def get_channel(scope):
+        return dict(scope['headers']).get(b'channel', b'').decode() or None
+
+    app = PathRouter({'/events/': ServerSentEventsApp(get_channel, broker, keepalive=0.05)}, None)
+
+    def make_scope(method='GET', query_string=b'', **headers):
+        return {
+            'type': 'http', 'method': method, 'path': '/events/', 'query_string': query_string,
+            'headers': [(name.encode(), value.encode()) for name, value in headers.items()],
+        }
+
+    async def request(scope):
+        communicator = ApplicationCommunicator(app, scope)
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        start = await communicator.receive_output(1)
+        return communicator, start, (await communicator.receive_output(1))['body']
+
+    async def stream():
+        assert (await request(make_scope(method='POST')))[1]['status'] == 405
+        _, start, body = await request(make_scope())
+        assert (start['status'], body) == (401, b'{"detail":"Invalid token."}')
+        communicator, start, body = await request(make_scope(channel='user:1'))
+        assert (start['status'], body) == (200, b': connected\n\n')
+        assert (b'content-type', b'text/event-stream') in start['headers']
+        sequence = broker.publish('user:1', {'id': 1})
+        event = f'id: {sequence}\nevent: change\ndata: {{"id":1}}\n\n'.encode()
+        assert (await communicator.receive_output(1))['body'] == event
+        assert (await communicator.receive_output(1))['body'] == b': keepalive\n\n'
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        await communicator.send_input({'type': 'http.disconnect'})
+        assert await communicator.receive_output(1) == {'type': 'http.response.body', 'body': b''}
+        await communicator.wait(1)
+        broker.publish('user:1', {'id': 2})
+        communicator, _, body = await request(make_scope(channel='user:1', query_string=f'after={sequence}'.encode()))
+        assert body == b': connected\n\n'
+        assert (await communicator.receive_output(1))['body'].startswith(f'id: {sequence + 1}\n'.encode())
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(1)
+        communicator, _, body = await request(make_scope(channel='user:1', **{'last-event-id': '1'}))
+        assert body == b'event: reset\ndata: {}\n\n'
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(1)
+
+    async_to_sync(stream)()
@@ -0,0 +1,153 @@
+"""
+ASGI helpers isolated for reusability.
+"""
+import asyncio
+import functools
+import json
+from urllib.parse import parse_qs
+
+from asgiref import sync
+from asgiref.sync import SyncToAsync
+from django.db import close_old_connections
+
+from utils.pubsub import get_broker
+
+
+def mark_coroutine_function(function):
+    """
+    Mark a callable (e.g. a middleware instance with an async __call__) as a coroutine function for
+    asyncio.iscoroutinefunction, which Django uses to tell async middleware and views apart.
+    """
+    function._is_coroutine = asyncio.coroutines._is_coroutine  # pylint: disable=protected-access
+    return function
+
+
+# asgiref has its own since 3.6, which marks them for inspect.iscoroutinefunction too
+markcoroutinefunction = getattr(sync, 'markcoroutinefunction', mark_coroutine_function)
+
+
+class DatabaseSyncToAsync(SyncToAsync):  # pylint: disable=too-few-public-methods
+    """
+    SyncToAsync for code using the database. Under ASGI, Django runs sync views in a single thread, one request at a
+    time. This runs them in the thread pool instead, so requests waiting on the database don't queue up behind each
+    other. Each thread has its own connections, closed afterwards as Django does when a request finishes.
+    """
+    def __init__(self, func):
+        super().__init__(func, thread_sensitive=False)
+
+    def thread_handler(self, loop, *args, **kwargs):  # pylint: disable=arguments-differ
+        close_old_connections()
+        try:
+            return super().thread_handler(loop, *args, **kwargs)
+        finally:
+            close_old_connections()
+
+
+def async_view(view):
+    """
+    Async version of a sync view (e.g. a DRF viewset's as_view()). The view runs, and its response is rendered, in a
+    single hop to the thread pool (see DatabaseSyncToAsync), leaving the event loop free for other connections.
+    """
+    def render_view(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if callable(getattr(response, 'render', None)):
+            response.render()
+        return response
+
+    render_view_in_thread_pool = DatabaseSyncToAsync(render_view)
+
+    @functools.wraps(view)
+    async def async_wrapper(request, *args, **kwargs):
+        return await render_view_in_thread_pool(request, *args, **kwargs)
+
+    return async_wrapper
+
+
+class ServerSentEventsApp:
+    """
+    ASGI application streaming the events of a Broker channel as Server-Sent Events. get_channel is an async function
+    taking the scope and returning the channel to stream, or None to reject the request with a 401. Clients resume from
+    the last event they got with the Last-Event-ID header (EventSource sends it when reconnecting) or ?after=. When
+    events were missed, a reset event is sent first: the client should reload what it derives from the events.
+    """
+    def __init__(self, get_channel, broker=None, keepalive=15):
+        self.get_channel = get_channel
+        self.broker = broker
+        self.keepalive = keepalive
+
+    @staticmethod
+    async def send_response(send, status, body, content_type=b'application/json'):
+        """Send a whole response."""
+        await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', content_type)]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    def get_after(scope):
+        """Sequence number of the last event the client got, or None."""
+        headers = dict(scope['headers'])
+        query = parse_qs(scope.get('query_string', b'').decode())
+        value = headers.get(b'last-event-id', b'').decode() or query.get('after', [''])[0]
+        return int(value) if value.isdigit() else None
+
+    @staticmethod
+    async def wait_for_disconnect(receive):
+        """Wait until the client goes away."""
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    @staticmethod
+    def format_event(event_type, data, sequence=None):
+        """Encode an event in the text/event-stream format."""
+        event_id = '' if sequence is None else f'id: {sequence}\n'
+        return f'{event_id}event: {event_type}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'.encode()
+
+    async def stream(self, subscription, send, disconnected):
+        """Send the events of the subscription until the client disconnects, with comments to keep it alive."""
+        async with subscription:
+            first_message = self.format_event('reset', {}) if subscription.reset else b': connected\n\n'
+            await send({'type': 'http.response.body', 'body': first_message, 'more_body': True})
+            while not disconnected.done():
+                next_event = asyncio.ensure_future(subscription.get())
+                done, _ = await asyncio.wait(
+                    {next_event, disconnected}, timeout=self.keepalive, return_when=asyncio.FIRST_COMPLETED
+                )
+                if next_event in done:
+                    sequence, data = next_event.result()
+                    await send({
+                        'type': 'http.response.body', 'body': self.format_event('change', data, sequence),
+                        'more_body': True,
+                    })
+                    continue
+                next_event.cancel()
+                if not disconnected.done():
+                    await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] != 'GET':
+            await self.send_response(send, 405, b'{"detail":"Method not allowed."}')
+            return
+        channel = await self.get_channel(scope)
+        if channel is None:
+            await self.send_response(send, 401, b'{"detail":"Invalid token."}')
+            return
+        broker = self.broker if self.broker is not None else get_broker()
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no'),
+        ]})
+        disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        try:
+            await self.stream(broker.subscribe(channel, self.get_after(scope)), send, disconnected)
+        finally:
+            disconnected.cancel()
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+class PathRouter:  # pylint: disable=too-few-public-methods
+    """ASGI application sending requests to the application of their exact path, or to the default one."""
+    def __init__(self, routes, default):
+        self.routes = routes
+        self.default = default
+
+    async def __call__(self, scope, receive, send):
+        application = self.routes.get(scope.get('path'), self.default)
+        await application(scope, receive, send)
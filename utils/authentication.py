@@ -0,0 +1,79 @@
+"""
+DRF authentication classes isolated for reusability.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from utils.cache import TieredCache
+
+
+TOKEN_AUTH_CACHE_SETTING = 'TOKEN_AUTH_CACHE'
+DEFAULT_TOKEN_AUTH_CACHE = {
+    # Tokens kept in each process.
+    'MAX_SIZE': 10000,
+    # Seconds a token is trusted without checking the database. Bounds how long other processes may keep accepting a
+    # token after it's deleted or its user deactivated, as invalidation only reaches this process and the shared cache.
+    'TTL': 30,
+    # Alias of a cache in CACHES shared by every process (e.g. Redis or Memcached), or None to cache in-process only.
+    'SHARED_CACHE': None,
+}
+
+
+class TokenCache(TieredCache):  # pylint: disable=too-few-public-methods
+    """Two tier cache of (user, token) by token key: an in-process LRU in front of an optional shared Django cache."""
+    key_prefix = 'token-auth:'
+
+
+@lru_cache(maxsize=None)
+def get_token_cache():
+    """Get the process wide TokenCache, configured by the TOKEN_AUTH_CACHE setting."""
+    options = {**DEFAULT_TOKEN_AUTH_CACHE, **getattr(settings, TOKEN_AUTH_CACHE_SETTING, {})}
+    return TokenCache(options['MAX_SIZE'], options['TTL'], options['SHARED_CACHE'])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication which looks tokens up in a TokenCache before querying the database. Only valid credentials
+    are cached, and they are invalidated when their token is saved or deleted or their user is saved (e.g.
+    deactivated), see install_token_cache_invalidation. Writes which don't send signals (QuerySet.update) are not
+    noticed until the TTL expires.
+    """
+    def authenticate_credentials(self, key):
+        token_cache = get_token_cache()
+        credentials = token_cache.get(key)
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            token_cache.set(key, credentials)
+        return credentials
+
+
+def invalidate_token(instance, **kwargs):  # pylint: disable=unused-argument
+    """Signal receiver forgetting a token which was saved (e.g. given to another user) or deleted (e.g. rotated)."""
+    get_token_cache().delete(instance.key)
+
+
+def invalidate_user_tokens(instance, **kwargs):  # pylint: disable=unused-argument
+    """Signal receiver forgetting the tokens of a user which was saved, e.g. deactivated."""
+    for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+        get_token_cache().delete(key)
+
+
+def reset_token_cache(setting, **kwargs):  # pylint: disable=unused-argument
+    """Signal receiver building the TokenCache again when its setting changes (e.g. in tests)."""
+    if setting == TOKEN_AUTH_CACHE_SETTING:
+        get_token_cache.cache_clear()
+
+
+def install_token_cache_invalidation():
+    """Connect the receivers keeping the TokenCache up to date. Meant to be called from an AppConfig.ready."""
+    post_save.connect(invalidate_token, sender=Token, dispatch_uid='token_cache_invalidate_saved_token')
+    post_delete.connect(invalidate_token, sender=Token, dispatch_uid='token_cache_invalidate_deleted_token')
+    post_save.connect(
+        invalidate_user_tokens, sender=settings.AUTH_USER_MODEL, dispatch_uid='token_cache_invalidate_saved_user'
+    )
+    setting_changed.connect(reset_token_cache, dispatch_uid='token_cache_reset')
@@ -0,0 +1,172 @@
+"""
+Caching helpers isolated for reusability.
+"""
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+
+
+class LRUCache:
+    """
+    Thread safe in-process cache. Keeps at most max_size entries, evicting the least recently used one first, and
+    expires entries ttl seconds after they were set, unless they were set with a ttl of their own.
+    """
+    def __init__(self, max_size, ttl, timer=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.timer = timer
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Get the value of a key, or default if it's not cached or it expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= self.timer():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value, ttl=None):
+        """Cache a value, evicting the least recently used entries if the cache is full. Needs the lock."""
+        self._entries[key] = (value, self.timer() + (self.ttl if ttl is None else ttl))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def set(self, key, value, ttl=None):
+        """Cache a value, evicting the least recently used entries if the cache is full."""
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        """Cache a value unless the key is cached already. Returns whether it was cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > self.timer():
+                return False
+            self._set(key, value, ttl)
+            return True
+
+    def delete(self, key):
+        """Remove a key, if cached."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove every key."""
+        with self._lock:
+            self._entries.clear()
+
+
+class TieredCache:
+    """
+    Two tier cache: an in-process LRUCache in front of an optional shared Django cache (e.g. Redis or Memcached), so
+    entries set by a process are found by the others too. Both tiers expire entries after get_ttl(value) seconds.
+    """
+    key_prefix = ''
+
+    def __init__(self, max_size, ttl, shared_cache=None):
+        self.ttl = ttl
+        self.local = LRUCache(max_size, ttl)
+        self.shared = None if shared_cache is None else caches[shared_cache]
+
+    def get_ttl(self, value):  # pylint: disable=unused-argument
+        """Seconds a value is cached for, ttl for any of them unless overridden."""
+        return self.ttl
+
+    def shared_key(self, key):
+        """Key in the shared cache."""
+        return self.key_prefix + key
+
+    def get(self, key):
+        """Get the value of a key, or None."""
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(self.shared_key(key))
+            if value is not None:
+                self.local.set(key, value, self.get_ttl(value))
+        return value
+
+    def set(self, key, value):
+        """Cache a value in every tier."""
+        ttl = self.get_ttl(value)
+        self.local.set(key, value, ttl)
+        if self.shared is not None:
+            self.shared.set(self.shared_key(key), value, ttl)
+
+    def add(self, key, value):
+        """Cache a value unless the key is cached already in any tier. Returns whether it was cached."""
+        ttl = self.get_ttl(value)
+        if not self.local.add(key, value, ttl):
+            return False
+        if self.shared is not None and not self.shared.add(self.shared_key(key), value, ttl):
+            self.local.delete(key)
+            return False
+        return True
+
+    def delete(self, key):
+        """Forget a key in every tier."""
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(self.shared_key(key))
+
+
+class GenerationalCache:
+    """
+    Entries grouped by scope (e.g. a user) on top of a Django cache. Bumping the generation of a scope invalidates all
+    of its entries at once, as the generation is part of their keys. Generations start from the current time, so a
+    scope whose generation got evicted doesn't get back to the keys of old entries.
+    """
+    def __init__(self, namespace, alias=DEFAULT_CACHE_ALIAS, timeout=300):
+        self.namespace = namespace
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        """The Django cache entries are stored in."""
+        return caches[self.alias]
+
+    def generation_key(self, scope):
+        """Key of the generation of a scope."""
+        return f'{self.namespace}:generation:{scope}'
+
+    def get_generation(self, scope):
+        """Current generation of a scope."""
+        generation = self.cache.get(self.generation_key(scope))
+        if generation is None:
+            self.cache.add(self.generation_key(scope), int(time.time() * 1e9), None)
+            generation = self.cache.get(self.generation_key(scope))
+        return generation
+
+    def bump(self, scope):
+        """Invalidate every entry of a scope."""
+        try:
+            self.cache.incr(self.generation_key(scope))
+        except ValueError:
+            self.cache.add(self.generation_key(scope), int(time.time() * 1e9), None)
+
+    def make_key(self, scope, generation, key):
+        """Key of an entry of a scope's generation."""
+        return f'{self.namespace}:{scope}:{generation}:{key}'
+
+    def get(self, scope, generation, key, default=None):
+        """Get an entry of a scope's generation."""
+        return self.cache.get(self.make_key(scope, generation, key), default)
+
+    def set(self, scope, generation, key, value):
+        """
+        Set an entry of a scope's generation. Pass the generation read before computing the value, so writes made
+        meanwhile leave it unreachable instead of making it look current.
+        """
+        self.cache.set(self.make_key(scope, generation, key), value, self.timeout)
@@ -0,0 +1,29 @@
+"""
+Context locals isolated for reusability.
+"""
+from asgiref.local import Local
+
+
+class ContextLocal:
+    """
+    Value of the current context, like contextvars.ContextVar (which needs Python 3.7): kept per thread and asyncio
+    task, and seen by the code sync_to_async runs in other threads, as it's an asgiref Local. set returns the previous
+    value, to restore with reset.
+    """
+    def __init__(self, default=None):
+        self.default = default
+        self._local = Local()
+
+    def get(self):
+        """Value of the current context, or the default if it wasn't set."""
+        return getattr(self._local, 'value', self.default)
+
+    def set(self, value):
+        """Set the value of the current context. Returns the previous one, for reset."""
+        previous = self.get()
+        self._local.value = value
+        return previous
+
+    def reset(self, previous):
+        """Restore the value set returned."""
+        self._local.value = previous
@@ -1,11 +1,24 @@
 """
 Datetime related functions isolated for reusability.
 """
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import pytz
 
 
+EPOCH = pytz.utc.localize(datetime(1970, 1, 1))
+
+
 def utc_now():
     """Get current **AWARE** UTC datetime."""
     return pytz.timezone('UTC').localize(datetime.utcnow())
+
+
+def to_microseconds(value):
+    """Microseconds since the epoch of an aware datetime, exactly (unlike timestamp(), which goes through a float)."""
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_microseconds(microseconds):
+    """Aware UTC datetime from microseconds since the epoch."""
+    return EPOCH + timedelta(microseconds=microseconds)
@@ -0,0 +1,186 @@
+"""
+Database connection pooling isolated for reusability.
+"""
+import time
+from threading import Condition, Lock
+
+
+DEFAULT_POOL = {
+    # Most connections open at once, in use or idle.
+    'MAX_SIZE': 10,
+    # Seconds to wait for a connection when all of them are in use.
+    'TIMEOUT': 30,
+    # Seconds after which connections are replaced, or None to keep them as long as they work.
+    'MAX_AGE': 3600,
+    # Connections idle for longer than this many seconds are checked before being reused.
+    'CHECK_AFTER': 30,
+}
+
+
+class PoolTimeout(Exception):
+    """No connection of the pool was released in time."""
+
+
+def is_healthy(connection):
+    """Check whether a DB-API connection still works."""
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+    except Exception:  # pylint: disable=broad-except
+        return False
+    return True
+
+
+def close_quietly(connection):
+    """Close a DB-API connection, which may be broken already."""
+    try:
+        connection.close()
+    except Exception:  # pylint: disable=broad-except
+        pass
+
+
+class ConnectionPool:  # pylint: disable=too-many-instance-attributes
+    """
+    Thread safe pool of DB-API connections, at most max_size of them open at once. The most recently released idle
+    connection is reused first, so the rest can age out. Connections idle for longer than check_after seconds are
+    checked with a query before being reused and the ones older than max_age seconds are replaced. When all of them
+    are in use, acquire waits up to timeout seconds for one to be released.
+    """
+    def __init__(self, max_size=10, timeout=30, max_age=3600, check_after=30, timer=time.monotonic):
+        # pylint: disable=too-many-arguments
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.check_after = check_after
+        self.timer = timer
+        self.size = 0
+        self._idle = []
+        self._created_at = {}
+        self._condition = Condition(Lock())
+
+    def __len__(self):
+        return len(self._idle)
+
+    def reserve(self):
+        """Take an idle connection as (connection, created_at, released_at), or (None, None, None) for a new one."""
+        deadline = self.timer() + self.timeout
+        with self._condition:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self.size < self.max_size:
+                    self.size += 1
+                    return None, None, None
+                remaining = deadline - self.timer()
+                if remaining <= 0:
+                    raise PoolTimeout(f'All {self.max_size} connections are in use.')
+                self._condition.wait(remaining)
+
+    def discard(self, connection):
+        """Close a connection taken from the pool, making room for a new one."""
+        if connection is not None:
+            close_quietly(connection)
+        with self._condition:
+            self.size -= 1
+            self._condition.notify()
+
+    def acquire(self, connect):
+        """Get a connection, reusing an idle one or opening a new one by calling connect."""
+        while True:
+            connection, created_at, released_at = self.reserve()
+            now = self.timer()
+            if connection is None:
+                try:
+                    connection = connect()
+                except BaseException:
+                    self.discard(None)
+                    raise
+                created_at = now
+            elif (self.max_age is not None and now - created_at >= self.max_age) or (
+                now - released_at >= self.check_after and not is_healthy(connection)
+            ):
+                self.discard(connection)
+                continue
+            with self._condition:
+                self._created_at[connection] = created_at
+            return connection
+
+    def release(self, connection, reusable=True):
+        """Give a connection back. Connections which aren't reusable (e.g. closed inside a transaction) are closed."""
+        with self._condition:
+            created_at = self._created_at.pop(connection, None)
+        if created_at is None:
+            close_quietly(connection)
+            return
+        if reusable:
+            try:
+                # End whatever transaction was left open
+                connection.rollback()
+            except Exception:  # pylint: disable=broad-except
+                reusable = False
+        if not reusable:
+            self.discard(connection)
+            return
+        with self._condition:
+            self._idle.append((connection, created_at, self.timer()))
+            self._condition.notify()
+
+    def close(self):
+        """Close the idle connections. Connections in use are closed when released."""
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self.size -= len(idle)
+            self._condition.notify_all()
+        for connection, _, _ in idle:
+            close_quietly(connection)
+
+
+_pools = {}
+_pools_lock = Lock()
+
+
+def get_pool(key, options):
+    """Get the process wide pool of a key (e.g. a database alias and its connection parameters)."""
+    with _pools_lock:
+        if key not in _pools:
+            options = {**DEFAULT_POOL, **options}
+            _pools[key] = ConnectionPool(
+                options['MAX_SIZE'], options['TIMEOUT'], options['MAX_AGE'], options['CHECK_AFTER']
+            )
+        return _pools[key]
+
+
+def close_pools():
+    """Close the idle connections of every pool, e.g. before forking or exiting."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
+
+
+class PooledDatabaseWrapperMixin:  # pylint: disable=too-few-public-methods
+    """
+    Mixin for Django DatabaseWrapper classes taking connections from a ConnectionPool instead of opening them, and
+    giving them back instead of closing them, configured by the POOL of the database settings (see DEFAULT_POOL).
+    Use with CONN_MAX_AGE = 0, so each request takes a connection and gives it back when it finishes: the pool
+    keeps them open and caps how many there are, whatever the number of threads.
+    """
+    pool = None
+
+    def get_new_connection(self, conn_params):
+        """Take a connection from the pool of this database and connection parameters."""
+        self.pool = get_pool((self.alias, repr(sorted(conn_params.items()))), self.settings_dict.get('POOL', {}))
+        connect = super().get_new_connection
+        try:
+            return self.pool.acquire(lambda: connect(conn_params))
+        except PoolTimeout as error:
+            raise self.Database.OperationalError(str(error)) from error
+
+    def _close(self):
+        """Give the connection back, unless it's closed inside a transaction or it stopped working."""
+        reusable = not self.in_atomic_block and (not self.errors_occurred or self.is_usable())
+        with self.wrap_database_errors:
+            self.pool.release(self.connection, reusable)
@@ -0,0 +1,26 @@
+"""
+Database backend pooling the connections of another backend, set as the BACKEND of the POOL of the database settings:
+
+    DATABASES = {'default': {
+        'ENGINE': 'utils.db.pooled', 'POOL': {'BACKEND': 'django.db.backends.postgresql', 'MAX_SIZE': 10}, ...
+    }}
+"""
+from functools import lru_cache
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.utils import load_backend
+
+from utils.db.pool import PooledDatabaseWrapperMixin
+
+
+@lru_cache(maxsize=None)
+def get_wrapper_class(backend):
+    """Pooled version of the DatabaseWrapper of a backend."""
+    wrapper_class = load_backend(backend).DatabaseWrapper
+    return type(f'Pooled{wrapper_class.__name__}', (PooledDatabaseWrapperMixin, wrapper_class), {})
+
+
+class DatabaseWrapper:  # pylint: disable=too-few-public-methods
+    """Builds the pooled DatabaseWrapper of the backend set in the POOL of the database settings."""
+    def __new__(cls, settings_dict, alias=DEFAULT_DB_ALIAS):
+        return get_wrapper_class(settings_dict['POOL']['BACKEND'])(settings_dict, alias)
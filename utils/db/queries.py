@@ -0,0 +1,26 @@
+"""
+Query building isolated for reusability.
+"""
+from django.db import connections
+from django.db.models import Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+
+
+RANK_ALIAS = 'partition_rank'
+
+
+def first_of_each(queryset, partition_by, order_by, count):
+    """
+    Filter a queryset down to the first count rows of each partition (e.g. the first tasks of every group) within a
+    single query: a subquery numbers the rows of each partition with ROW_NUMBER() and keeps the primary keys numbered
+    up to count. The rows of the result still have to be ordered. Needs window functions, SQLite has them since 3.25.
+    """
+    ranked = queryset.order_by().annotate(
+        **{RANK_ALIAS: Window(RowNumber(), partition_by=partition_by, order_by=order_by)}
+    ).values('pk', RANK_ALIAS)
+    sql, params = ranked.query.get_compiler(using=ranked.db).as_sql()
+    quote_name = connections[ranked.db].ops.quote_name
+    pk_column = quote_name(queryset.model._meta.pk.column)  # pylint: disable=protected-access
+    ranked_sql = f'SELECT {pk_column} FROM ({sql}) AS {quote_name("ranked")} WHERE {quote_name(RANK_ALIAS)} <= %s'
+    return queryset.filter(pk__in=RawSQL(ranked_sql, (*params, count)))
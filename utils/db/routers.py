@@ -0,0 +1,114 @@
+"""
+Database routers isolated for reusability.
+"""
+import random
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+
+from utils.context import ContextLocal
+
+
+ROUTING_SETTING = 'DATABASE_ROUTING'
+DEFAULT_ROUTING = {
+    # Alias of the database every write goes to, and reads by default.
+    'PRIMARY': 'default',
+    # Aliases of read-only copies of the primary. Empty to read from the primary only.
+    'REPLICAS': [],
+    # Seconds a user reads from the primary after writing, so they see their own writes despite replication lag.
+    'PIN_SECONDS': 5,
+    # Alias of the cache in CACHES remembering pinned users. Must be shared by every process to pin across them.
+    'PIN_CACHE': 'default',
+}
+
+_read_alias = ContextLocal()
+
+
+@lru_cache(maxsize=None)
+def get_routing():
+    """Get the DATABASE_ROUTING setting merged with its defaults."""
+    return {**DEFAULT_ROUTING, **getattr(settings, ROUTING_SETTING, {})}
+
+
+def reset_routing(setting, **kwargs):  # pylint: disable=unused-argument
+    """Signal receiver reading the routing setting again when it changes (e.g. in tests)."""
+    if setting == ROUTING_SETTING:
+        get_routing.cache_clear()
+
+
+setting_changed.connect(reset_routing, dispatch_uid='routers_reset_routing')
+
+
+def get_read_alias():
+    """Alias reads of the current context go to: the one set by read_from, or the primary."""
+    return _read_alias.get() or get_routing()['PRIMARY']
+
+
+def set_read_alias(alias):
+    """Send reads of the current context to a database, or to the primary if None. Prefer read_from when possible."""
+    _read_alias.set(alias)
+
+
+@contextmanager
+def read_from(alias):
+    """Send reads within the block to a database, or to the primary if None."""
+    previous = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(previous)
+
+
+def pick_replica():
+    """Alias of a random replica, spreading the load among them. None if there are none."""
+    replicas = get_routing()['REPLICAS']
+    return random.choice(replicas) if replicas else None
+
+
+def pin_key(user_id):
+    """Key of a pinned user in the pin cache."""
+    return f'replica-pin:{user_id}'
+
+
+def pin(user_id):
+    """Read from the primary for the user for PIN_SECONDS from now on."""
+    routing = get_routing()
+    caches[routing['PIN_CACHE']].set(pin_key(user_id), True, routing['PIN_SECONDS'])
+
+
+def is_pinned(user_id):
+    """Check whether the user wrote recently, so they must read from the primary."""
+    return caches[get_routing()['PIN_CACHE']].get(pin_key(user_id), False)
+
+
+class ReplicaRouter:
+    """
+    Router sending writes to the primary, and reads to the database chosen for the current context (see read_from) or
+    the primary. Related objects are read from the database their instance came from, as Django does without routers.
+    Replicas are copies of the primary, so migrations only run on the primary.
+    """
+    @staticmethod
+    def db_for_read(model, **hints):  # pylint: disable=unused-argument
+        """Read related objects from the database of their instance, and anything else from the current context's."""
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:  # pylint: disable=protected-access
+            return instance._state.db  # pylint: disable=protected-access
+        return get_read_alias()
+
+    @staticmethod
+    def db_for_write(model, **hints):  # pylint: disable=unused-argument
+        """Always write to the primary."""
+        return get_routing()['PRIMARY']
+
+    @staticmethod
+    def allow_relation(obj1, obj2, **hints):  # pylint: disable=unused-argument
+        """Objects of every database are the same rows."""
+        return True
+
+    @staticmethod
+    def allow_migrate(db, app_label, model_name=None, **hints):  # pylint: disable=unused-argument
+        """Replicas get the schema from the primary."""
+        return db not in get_routing()['REPLICAS']
@@ -0,0 +1,30 @@
+"""
+SQLite database backend running PRAGMA statements on every new connection, set as the pragmas of the database
+OPTIONS. Tuning for a single node deployment:
+
+    'OPTIONS': {'pragmas': {
+        'journal_mode': 'wal', 'synchronous': 'normal', 'mmap_size': 268435456, 'busy_timeout': 5000,
+    }}
+"""
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+
+PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite DatabaseWrapper setting the configured pragmas on its connections."""
+    def get_new_connection(self, conn_params):
+        conn_params = dict(conn_params)
+        pragmas = conn_params.pop('pragmas', {})
+        for name, value in pragmas.items():
+            if not PRAGMA_NAME.match(name) or not PRAGMA_VALUE.match(str(value)):
+                raise ImproperlyConfigured(f'Invalid SQLite pragma: {name} = {value}')
+        connection = super().get_new_connection(conn_params)
+        for name, value in pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
@@ -0,0 +1,137 @@
+"""
+Idempotency keys for DRF viewsets isolated for reusability.
+"""
+import json
+from functools import lru_cache
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from utils.cache import TieredCache
+
+
+IDEMPOTENCY_SETTING = 'IDEMPOTENCY'
+DEFAULT_IDEMPOTENCY = {
+    # Responses kept in each process.
+    'MAX_SIZE': 10000,
+    # Seconds a response is replayed to retries of its request.
+    'TTL': 3600,
+    # Seconds a key is taken by a request being handled at most, so retries of a request whose process died get a 409
+    # for a while only. Keep it above the time the slowest request takes, or its retries would be handled again.
+    'IN_PROGRESS_TTL': 60,
+    # Alias of a cache in CACHES shared by every process, or None to keep responses in-process only, so retries reaching
+    # another process are handled again.
+    'SHARED_CACHE': None,
+}
+# Stored while the first request sending a key is handled
+IN_PROGRESS = 'in progress'
+
+
+class ResponseStore(TieredCache):
+    """
+    Two tier cache of the responses to requests sending an idempotency key, see IdempotencyMixin. The IN_PROGRESS
+    marker of the keys whose request is being handled expires after in_progress_ttl seconds instead.
+    """
+    key_prefix = 'idempotency:'
+
+    def __init__(self, max_size, ttl, shared_cache=None, in_progress_ttl=None):
+        super().__init__(max_size, ttl, shared_cache)
+        self.in_progress_ttl = ttl if in_progress_ttl is None else in_progress_ttl
+
+    def get_ttl(self, value):
+        return self.in_progress_ttl if value == IN_PROGRESS else self.ttl
+
+
+@lru_cache(maxsize=None)
+def get_response_store():
+    """Get the process wide ResponseStore, configured by the IDEMPOTENCY setting."""
+    options = {**DEFAULT_IDEMPOTENCY, **getattr(settings, IDEMPOTENCY_SETTING, {})}
+    return ResponseStore(options['MAX_SIZE'], options['TTL'], options['SHARED_CACHE'], options['IN_PROGRESS_TTL'])
+
+
+def reset_response_store(setting, **kwargs):  # pylint: disable=unused-argument
+    """Signal receiver building the ResponseStore again when its setting changes (e.g. in tests)."""
+    if setting == IDEMPOTENCY_SETTING:
+        get_response_store.cache_clear()
+
+
+setting_changed.connect(reset_response_store, dispatch_uid='idempotency_reset_response_store')
+
+
+class IdempotencyMixin:
+    """
+    Requests to idempotent_actions sending an Idempotency-Key header which the user sent before, to the same path,
+    get the response to the first one again, from the ResponseStore: retries (e.g. of clients on flaky networks)
+    neither write nor query. Only successful responses are stored, so requests which failed can be retried. A key
+    sent with another body or query gets a 422, and a 409 while its first request is being handled.
+    """
+    idempotency_header = 'Idempotency-Key'
+    idempotency_key_max_length = 255
+    idempotent_actions = ('create', )
+
+    def get_idempotency_store_key(self, request, key):
+        """Key of the response in the store, covering the user, method and path."""
+        return sha1(f'{request.user.pk}|{request.method}|{request.path}|{key}'.encode()).hexdigest()
+
+    @staticmethod
+    def get_request_fingerprint(request):
+        """Hash of the body and query of a request, telling retries apart from other requests reusing their key."""
+        data = dict(request.data.lists()) if hasattr(request.data, 'lists') else request.data
+        content = json.dumps([data, sorted(request.query_params.lists())], sort_keys=True, default=str)
+        return sha1(content.encode()).hexdigest()
+
+    def initial(self, request, *args, **kwargs):
+        """Wrap the handler of idempotent actions, once the user is authenticated."""
+        super().initial(request, *args, **kwargs)
+        key = request.headers.get(self.idempotency_header)
+        if key is None or self.action not in self.idempotent_actions:
+            return
+        if not key or len(key) > self.idempotency_key_max_length:
+            raise ValidationError({
+                self.idempotency_header: [f'Send at most {self.idempotency_key_max_length} characters.']
+            })
+        method = request.method.lower()
+        setattr(self, method, self.make_idempotent(getattr(self, method), key))
+
+    def make_idempotent(self, handler, key):
+        """Handler replaying the response stored for the key, or storing the one of the handler if there's none."""
+        def idempotent_handler(request, *args, **kwargs):
+            store = get_response_store()
+            store_key = self.get_idempotency_store_key(request, key)
+            fingerprint = self.get_request_fingerprint(request)
+            stored = store.get(store_key)
+            if stored is None and store.add(store_key, IN_PROGRESS):
+                return self.store_response(store, store_key, fingerprint, lambda: handler(request, *args, **kwargs))
+            if stored is None or stored == IN_PROGRESS:
+                return Response(
+                    {'detail': 'A request with this idempotency key is being handled.'}, status=status.HTTP_409_CONFLICT
+                )
+            stored_fingerprint, status_code, data, headers = stored
+            if stored_fingerprint != fingerprint:
+                return Response(
+                    {'detail': 'This idempotency key was sent with another request.'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            return Response(data, status=status_code, headers={**headers, 'Idempotent-Replayed': 'true'})
+        return idempotent_handler
+
+    @staticmethod
+    def store_response(store, store_key, fingerprint, handle):
+        """Handle the request, storing its response if successful, and forgetting the key otherwise."""
+        stored = None
+        try:
+            response = handle()
+            if status.is_success(response.status_code):
+                # Headers set by the action, such as Location. Replays negotiate the content type again.
+                headers = {name: value for name, value in response.items() if name != 'Content-Type'}
+                stored = (fingerprint, response.status_code, response.data, headers)
+            return response
+        finally:
+            if stored is None:
+                store.delete(store_key)
+            else:
+                store.set(store_key, stored)
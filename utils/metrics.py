@@ -0,0 +1,309 @@
+"""
+Request metrics isolated for reusability.
+"""
+import asyncio
+import functools
+import hmac
+import logging
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from threading import Lock
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+from utils.asgi import markcoroutinefunction
+from utils.context import ContextLocal
+
+
+logger = logging.getLogger(__name__)
+
+METRICS_SETTING = 'METRICS'
+DEFAULT_METRICS = {
+    # Add a Server-Timing header with the database, serializer, render and total times to every response.
+    'SERVER_TIMING': True,
+    # Log a warning for requests making more queries than this, with their most repeated query. None to disable.
+    'QUERY_COUNT_WARNING': None,
+    # Upper bounds of the buckets of the histograms of seconds.
+    'SECONDS_BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    # Upper bounds of the buckets of the histogram of queries.
+    'QUERIES_BUCKETS': (0, 1, 2, 3, 5, 10, 20, 50, 100),
+    # Bearer token scrapers authenticate with at /metrics (e.g. bearer_token in Prometheus), or None.
+    'TOKEN': None,
+    # Addresses (REMOTE_ADDR) allowed to get /metrics without a token. Staff users logged in are allowed too.
+    'ALLOWED_IPS': (),
+}
+
+_request_metrics = ContextLocal()
+
+
+class Histogram:
+    """Thread safe histograms of observed values, one per combination of label values, in the Prometheus format."""
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = Lock()
+
+    def observe(self, labels, value):
+        """Count a value in the histogram of the labels, a tuple of (name, value) pairs."""
+        with self._lock:
+            series = self._series.setdefault(labels, [[0] * (len(self.buckets) + 1), 0])
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    @staticmethod
+    def format_labels(labels):
+        """Labels as in the exposition format, e.g. {view="TaskViewSet",action="list"}."""
+        escaped = (
+            (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in labels
+        )
+        return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+    def render(self):
+        """Lines of the histograms in the Prometheus text exposition format."""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{self.format_labels((*labels, ("le", bound)))} {cumulative}')
+            lines.append(f'{self.name}_sum{self.format_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{self.format_labels(labels)} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """Histograms of the requests handled by the process."""
+    def __init__(self, seconds_buckets, queries_buckets):
+        self.duration = Histogram('http_request_duration_seconds', 'Time to handle requests.', seconds_buckets)
+        self.queries = Histogram('http_request_queries', 'Database queries made by requests.', queries_buckets)
+        self.db = Histogram('http_request_db_seconds', 'Time requests spent in database queries.', seconds_buckets)
+        self.serialize = Histogram(
+            'http_request_serialize_seconds', 'Time requests spent serializing objects.', seconds_buckets
+        )
+        self.render = Histogram(
+            'http_request_render_seconds', 'Time requests spent rendering responses.', seconds_buckets
+        )
+
+    def observe(self, metrics):
+        """Add the metrics of a finished request."""
+        labels = (('view', str(metrics.view)), ('action', str(metrics.action)), ('method', metrics.method))
+        self.duration.observe(labels, metrics.duration)
+        self.queries.observe(labels, metrics.queries)
+        self.db.observe(labels, metrics.db_time)
+        self.serialize.observe(labels, metrics.timings['serialize'])
+        self.render.observe(labels, metrics.timings['render'])
+
+    def render_metrics(self):
+        """All of the histograms in the Prometheus text exposition format."""
+        histograms = (self.duration, self.queries, self.db, self.serialize, self.render)
+        return '\n'.join(line for histogram in histograms for line in histogram.render()) + '\n'
+
+
+@functools.lru_cache(maxsize=None)
+def get_metrics_settings():
+    """Get the METRICS setting merged with its defaults."""
+    return {**DEFAULT_METRICS, **getattr(settings, METRICS_SETTING, {})}
+
+
+@functools.lru_cache(maxsize=None)
+def get_bucketed_registry(seconds_buckets, queries_buckets):
+    """Get the process wide MetricsRegistry with these buckets."""
+    return MetricsRegistry(seconds_buckets, queries_buckets)
+
+
+def get_registry():
+    """Get the process wide MetricsRegistry, with the buckets of the METRICS setting."""
+    options = get_metrics_settings()
+    return get_bucketed_registry(tuple(options['SECONDS_BUCKETS']), tuple(options['QUERIES_BUCKETS']))
+
+
+def reset_metrics(setting, **kwargs):  # pylint: disable=unused-argument
+    """Signal receiver reading the metrics setting again when it changes (e.g. in tests)."""
+    if setting == METRICS_SETTING:
+        get_metrics_settings.cache_clear()
+
+
+setting_changed.connect(reset_metrics, dispatch_uid='metrics_reset_metrics')
+
+
+class RequestMetrics:  # pylint: disable=too-many-instance-attributes
+    """
+    Queries and timings of a request. Serializer and render times don't include the queries made meanwhile, e.g. when
+    serializing a lazy queryset, as the database time is measured apart.
+    """
+    def __init__(self, method, record_statements=False, timer=time.perf_counter):
+        self.timer = timer
+        self.started_at = timer()
+        self.duration = 0.0
+        self.method = method
+        self.view = self.action = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.timings = defaultdict(float)
+        self.statements = Counter() if record_statements else None
+
+    def record_query(self, sql, duration):
+        """Count a query and the time it took."""
+        self.queries += 1
+        self.db_time += duration
+        if self.statements is not None:
+            self.statements[sql] += 1
+
+    def finish(self):
+        """Stop measuring the total duration."""
+        self.duration = self.timer() - self.started_at
+
+    def server_timing(self):
+        """Value for the Server-Timing header, in milliseconds."""
+        return ', '.join((
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'serialize;dur={self.timings["serialize"] * 1000:.1f}',
+            f'render;dur={self.timings["render"] * 1000:.1f}',
+            f'total;dur={self.duration * 1000:.1f}',
+        ))
+
+
+def get_request_metrics():
+    """Metrics of the request being handled, or None outside of requests."""
+    return _request_metrics.get()
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper adding every query to the metrics of the current request, if any."""
+    metrics = _request_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started_at = metrics.timer()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, metrics.timer() - started_at)
+
+
+def instrument_connections():
+    """Add record_query to the connections of this thread, which are per thread (e.g. in the thread pool of ASGI)."""
+    for connection in connections.all():
+        if record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(record_query)
+
+
+def label_request(view, action):
+    """Set the view and action the metrics of the current request are labelled with."""
+    metrics = _request_metrics.get()
+    if metrics is not None:
+        metrics.view, metrics.action = view, action
+        instrument_connections()
+
+
+def measured(name, function):
+    """Wrap a function to add the time spent in it, but in queries, to a timing of the current request."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        metrics = _request_metrics.get()
+        if metrics is None:
+            return function(*args, **kwargs)
+        started_at, db_time = metrics.timer(), metrics.db_time
+        try:
+            return function(*args, **kwargs)
+        finally:
+            metrics.timings[name] += metrics.timer() - started_at - (metrics.db_time - db_time)
+
+    return wrapper
+
+
+class MetricsMiddleware:
+    """
+    Measure the queries, database time and total time of every request, along with the serializer and render times
+    of viewsets using MetricsMixin, which label them with their name and action (other views are labelled with their
+    URL name). They're added to the histograms of get_registry() and, if enabled, to a Server-Timing header. Requests
+    making more queries than QUERY_COUNT_WARNING are logged, to catch N+1 queries. Async capable, so under ASGI async
+    views aren't moved to the single thread sync middleware would run in.
+    """
+    sync_capable = async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def log_queries(request, metrics):
+        """Warn about a request making too many queries."""
+        sql, count = metrics.statements.most_common(1)[0]
+        logger.warning(
+            '%s %s (%s.%s) made %d queries in %.1fms, this one %d times: %s', request.method, request.path,
+            metrics.view, metrics.action, metrics.queries, metrics.db_time * 1000, count, sql,
+        )
+
+    @staticmethod
+    def start(request):
+        """Start measuring a request, getting its metrics."""
+        threshold = get_metrics_settings()['QUERY_COUNT_WARNING']
+        metrics = RequestMetrics(request.method, record_statements=threshold is not None)
+        instrument_connections()
+        return metrics
+
+    def finish(self, request, response, metrics):
+        """Record the metrics of a request once it got its response."""
+        options = get_metrics_settings()
+        metrics.finish()
+        if metrics.view is None:
+            resolver_match = getattr(request, 'resolver_match', None)
+            metrics.view = resolver_match.view_name if resolver_match is not None else 'unmatched'
+            metrics.action = request.method.lower()
+        get_registry().observe(metrics)
+        if options['SERVER_TIMING']:
+            response['Server-Timing'] = metrics.server_timing()
+        threshold = options['QUERY_COUNT_WARNING']
+        if threshold is not None and metrics.queries > threshold:
+            self.log_queries(request, metrics)
+        return response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = self.start(request)
+        previous = _request_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_metrics.reset(previous)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        """Measure a request handled by the async middleware chain of ASGI."""
+        metrics = self.start(request)
+        # Seen by the threads sync views run in too (see ContextLocal), which add to the same metrics
+        previous = _request_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_metrics.reset(previous)
+        return self.finish(request, response, metrics)
+
+
+def can_scrape(request):
+    """Whether a request may get the metrics: by the TOKEN or ALLOWED_IPS of the METRICS setting, or as staff."""
+    options = get_metrics_settings()
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    expected = options['TOKEN']
+    if expected and scheme.lower() == 'bearer' and hmac.compare_digest(token.encode(), expected.encode()):
+        return True
+    user = getattr(request, 'user', None)
+    return request.META.get('REMOTE_ADDR') in options['ALLOWED_IPS'] or bool(user and user.is_staff)
+
+
+def metrics_view(request):
+    """Histograms of the requests handled by this process, for Prometheus to scrape."""
+    if not can_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(get_registry().render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,158 @@
+"""
+Pagination styles for DRF viewsets isolated for reusability.
+"""
+import json
+from functools import partial
+
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import connections
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+def get_postgres_row_estimate(queryset):
+    """Rows the PostgreSQL planner expects the queryset to return."""
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+# Row estimators of the databases whose planner can tell, by vendor
+ROW_ESTIMATORS = {'postgresql': get_postgres_row_estimate}
+
+
+def get_planner_estimate(queryset):
+    """Rows the database planner expects the queryset to return, without running it. None if the database can't tell."""
+    estimator = ROW_ESTIMATORS.get(connections[queryset.db].vendor)
+    return estimator(queryset) if estimator is not None else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator reading a row past the page to know whether there's a next one. The count is exact: free on the last
+    page, and counted otherwise, unless there's an estimate_count(), which is never counted: its estimate is used
+    instead (never less than the rows seen so far). total is the count to show: None if there's no estimate, and
+    is_exact tells whether it's exact.
+    """
+    def __init__(self, object_list, per_page, estimate_count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.estimate_count = estimate_count
+        self.total = None
+        self.is_exact = False
+
+    def validate_number(self, number):
+        """Check the page number is a positive integer. There's no upper bound, as the number of pages isn't known."""
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError) as error:
+            raise PageNotAnInteger('That page number is not an integer') from error
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and (number > 1 or not self.allow_empty_first_page):
+            raise EmptyPage('That page contains no results')
+        seen = bottom + len(rows)
+        # Assigning the cached count of Paginator, so it's never counted
+        if len(rows) <= self.per_page:
+            self.count = seen
+        if len(rows) <= self.per_page or self.estimate_count is None:
+            self.total, self.is_exact = self.count, True
+        else:
+            estimate = self.estimate_count()
+            self.total = None if estimate is None else max(estimate, seen)
+            # Enough pages for the next link, even without an estimate
+            self.count = seen if self.total is None else self.total
+        return self._get_page(rows[:self.per_page], number, self)
+
+
+class EstimatedCountPagination(PageNumberPagination):
+    """
+    Page number pagination which can skip COUNT(*), whose cost grows with the rows filtered (even more with
+    distinct()) and often exceeds the page's. Each page reads one row more than it shows to know whether there's a next
+    one, and count is exact, counted on every page but the last. With ?count=estimate it's estimated instead, by the
+    view's get_count_estimate(queryset) if it has one and returns a number, or else by the database planner, and None
+    when neither can tell. count_exact tells an exact count from an estimated or unknown one.
+    """
+    count_query_param = 'count'
+    estimated_count = 'estimate'
+
+    @staticmethod
+    def estimate_count(queryset, view):
+        """Count estimated by the view, or else by the database planner. None if neither can tell."""
+        estimate = getattr(view, 'get_count_estimate', lambda queryset: None)(queryset)
+        return estimate if estimate is not None else get_planner_estimate(queryset)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # The paginator is built by PageNumberPagination, so it gets its options as a partial
+        estimate = request.query_params.get(self.count_query_param) == self.estimated_count
+        self.django_paginator_class = partial(
+            EstimatedCountPaginator, estimate_count=partial(self.estimate_count, queryset, view) if estimate else None
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.page.paginator.total,
+            'count_exact': self.page.paginator.is_exact,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count']['nullable'] = True
+        response_schema['properties']['count_exact'] = {'type': 'boolean', 'example': True}
+        return response_schema
+
+
+class KeysetPagination(CursorPagination):
+    """Seek on the primary key instead of using OFFSET + COUNT, so every page costs the same however deep it is."""
+    ordering = '-id'
+
+
+class PageOrCursorPagination(EstimatedCountPagination):
+    """
+    Page number pagination, with counts which can be estimated (see EstimatedCountPagination). Switch to keyset
+    pagination with ?pagination=cursor (or a cursor param).
+    """
+    mode_query_param = 'pagination'
+    cursor_mode = 'cursor'
+    cursor_pagination_class = KeysetPagination
+
+    def __init__(self):
+        self.cursor_paginator = None
+
+    def is_cursor_mode(self, request):
+        """Check whether the client asked for keyset pagination."""
+        query_params = request.query_params
+        cursor_query_param = self.cursor_pagination_class.cursor_query_param
+        return query_params.get(self.mode_query_param) == self.cursor_mode or cursor_query_param in query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Delegate to the keyset paginator when requested, otherwise paginate by page number."""
+        if self.is_cursor_mode(request):
+            self.cursor_paginator = self.cursor_pagination_class()
+            page = self.cursor_paginator.paginate_queryset(queryset, request, view)
+            self.display_page_controls = self.cursor_paginator.display_page_controls
+            return page
+        self.cursor_paginator = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        """Build the response for whichever pagination style was used."""
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        """Browsable API controls for whichever pagination style was used."""
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.to_html()
+        return super().to_html()
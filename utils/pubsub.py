@@ -0,0 +1,144 @@
+"""
+Publish/subscribe of events isolated for reusability.
+"""
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from functools import lru_cache
+from threading import Lock
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+
+PUBSUB_SETTING = 'PUBSUB'
+DEFAULT_PUBSUB = {
+    # Dotted path to the Broker class.
+    'BROKER': 'utils.pubsub.InProcessBroker',
+    # Keyword arguments for it.
+    'OPTIONS': {},
+}
+
+
+class Subscription:
+    """
+    Events of a channel published after a sequence number, see Broker.subscribe. Events are (sequence, data) tuples
+    with increasing sequence numbers. reset is True when some events after the requested sequence number are no longer
+    available, so the subscriber should reload whatever it derives from them.
+    """
+    def __init__(self, queue, backlog=(), after=None, reset=False, on_close=None):
+        self.queue = queue
+        self.backlog = deque(backlog)
+        self.last_sequence = after
+        self.reset = reset
+        self.on_close = on_close
+
+    async def get(self):
+        """Wait for the next event. Safe to cancel."""
+        while True:
+            event = self.backlog.popleft() if self.backlog else await self.queue.get()
+            if self.last_sequence is None or event[0] > self.last_sequence:
+                self.last_sequence = event[0]
+                return event
+
+    def close(self):
+        """Stop receiving events."""
+        if self.on_close is not None:
+            self.on_close()
+            self.on_close = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class Broker(ABC):
+    """Base class for brokers, delivering the events published to a channel to the subscribers of the channel."""
+    @abstractmethod
+    def publish(self, channel, data):
+        """Publish an event from any thread, sync or async code. Returns its sequence number."""
+
+    @abstractmethod
+    def subscribe(self, channel, after=None):
+        """
+        Subscription to a channel, from async code. Events published after the given sequence number (or from now on
+        if None) are delivered, as far as the broker keeps them.
+        """
+
+
+class ChannelState:  # pylint: disable=too-few-public-methods
+    """Sequence number, recent events and subscribers of a channel of an InProcessBroker."""
+    def __init__(self, history):
+        # Start from the current time, so sequence numbers keep growing after a restart
+        self.sequence = int(time.time() * 1000000)
+        self.events = deque(maxlen=history)
+        self.subscribers = set()
+
+
+class InProcessBroker(Broker):
+    """
+    Broker within the process: only subscribers in the same process receive the events, so it's meant for a single
+    process deployment (e.g. a single daphne worker) or as a stand-in for a broker shared by every process. Keeps the
+    last history events of each channel for subscribers resuming from a sequence number.
+    """
+    def __init__(self, history=1000):
+        self.history = history
+        self._channels = {}
+        self._lock = Lock()
+
+    def get_channel_state(self, channel):
+        """Get the state of a channel, creating it if it doesn't exist. Call with the lock held."""
+        if channel not in self._channels:
+            self._channels[channel] = ChannelState(self.history)
+        return self._channels[channel]
+
+    def publish(self, channel, data):
+        with self._lock:
+            state = self.get_channel_state(channel)
+            state.sequence += 1
+            event = (state.sequence, data)
+            state.events.append(event)
+            subscribers = list(state.subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+        return event[0]
+
+    def subscribe(self, channel, after=None):
+        subscriber = (asyncio.get_event_loop(), asyncio.Queue())
+        with self._lock:
+            state = self.get_channel_state(channel)
+            state.subscribers.add(subscriber)
+            if after is None:
+                backlog, reset = [], False
+            else:
+                backlog = [event for event in state.events if event[0] > after]
+                oldest_available = backlog[0][0] if backlog else state.sequence + 1
+                reset = after > state.sequence or oldest_available > after + 1
+                if reset:
+                    backlog, after = [], None
+
+        def unsubscribe():
+            with self._lock:
+                state.subscribers.discard(subscriber)
+
+        return Subscription(subscriber[1], backlog, after, reset, unsubscribe)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    """Get the process wide Broker, configured by the PUBSUB setting."""
+    options = {**DEFAULT_PUBSUB, **getattr(settings, PUBSUB_SETTING, {})}
+    return import_string(options['BROKER'])(**options['OPTIONS'])
+
+
+def reset_broker(setting, **kwargs):  # pylint: disable=unused-argument
+    """Signal receiver building the Broker again when its setting changes (e.g. in tests)."""
+    if setting == PUBSUB_SETTING:
+        get_broker.cache_clear()
+
+
+setting_changed.connect(reset_broker, dispatch_uid='pubsub_reset_broker')
@@ -0,0 +1,94 @@
+"""
+Streaming renderers for DRF viewsets isolated for reusability.
+"""
+import csv
+import io
+import json
+from abc import ABC, abstractmethod
+from itertools import islice
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def flatten(data, prefix=''):
+    """Flatten nested objects into a dict with dotted keys, e.g. {'group': {'id': 1}} becomes {'group.id': 1}."""
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+def chunked(iterable, size):
+    """Split an iterable into lists of at most size items, without reading it all at once."""
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+class StreamingRenderer(BaseRenderer, ABC):
+    """
+    Renderer able to render an iterable of objects as a stream of bytes, one chunk of objects at a time, so they never
+    need to be all in memory. render() renders regular data (e.g. errors) at once.
+    """
+    def render_header(self, columns):  # pylint: disable=unused-argument
+        """Bytes preceding the objects. columns are the flattened keys of the objects."""
+        return b''
+
+    @abstractmethod
+    def render_chunk(self, rows, columns):
+        """Render a list of objects."""
+
+    def stream(self, rows, columns, chunk_size):
+        """Iterate over the bytes rendering rows, chunk_size objects at a time. The header goes out before any row."""
+        yield self.render_header(columns)
+        for chunk in chunked(rows, chunk_size):
+            yield self.render_chunk(chunk, columns)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Render an object or a list of them."""
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        columns = list(dict.fromkeys(key for row in rows for key in flatten(row)))
+        return self.render_header(columns) + self.render_chunk(rows, columns)
+
+
+class NDJSONRenderer(StreamingRenderer):
+    """Newline delimited JSON, one object per line."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render_chunk(self, rows, columns):
+        return ''.join(
+            json.dumps(row, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')) + '\n' for row in rows
+        ).encode()
+
+
+class CSVRenderer(StreamingRenderer):
+    """Comma separated values, with a header. Nested objects are flattened into dotted columns, e.g. group.name."""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render_header(self, columns):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(columns)
+        return buffer.getvalue().encode(self.charset)
+
+    def render_chunk(self, rows, columns):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            flat = flatten(row)
+            writer.writerow([
+                json.dumps(value, cls=JSONEncoder) if isinstance(value, list) else value
+                for value in (flat.get(column) for column in columns)
+            ])
+        return buffer.getvalue().encode(self.charset)
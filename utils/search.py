@@ -0,0 +1,159 @@
+"""
+Text search backends for TextFilter isolated for reusability.
+"""
+from abc import ABC, abstractmethod
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Func, Q, TextField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+
+
+RANK_ANNOTATION = 'search_rank'
+
+
+class SearchBackend(ABC):  # pylint: disable=too-few-public-methods
+    """Base class for text search. Backends filter a queryset down to the objects matching a text."""
+    @abstractmethod
+    def search(self, queryset, field_names, text, rank=False):
+        """
+        Return the objects whose fields contain the text. When rank is True, annotate RANK_ANNOTATION and order by it,
+        most relevant first, if the backend is able to rank results.
+        """
+
+
+class ContainsSearchBackend(SearchBackend):  # pylint: disable=too-few-public-methods
+    """Portable fallback. Case insensitive substring match on every field, results are not ranked."""
+    def search(self, queryset, field_names, text, rank=False):
+        query = Q()
+        for field_name in field_names:
+            query |= Q(**{f'{field_name}__icontains': text})
+        return queryset.filter(query)
+
+
+class SQLiteFTSSearchBackend(SearchBackend):
+    """
+    Look up matches in an FTS5 trigram index. Trigrams keep the substring semantics of ContainsSearchBackend, which is
+    used for texts too short to build a trigram or for models without an index (see install_sqlite_fts).
+    """
+    MIN_LENGTH = 3
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback if fallback is not None else ContainsSearchBackend()
+        self._indexed_columns = {}
+
+    @staticmethod
+    def table_name(model):
+        """Name of the FTS5 table indexing the model."""
+        return f'{model._meta.db_table}_fts'  # pylint: disable=protected-access
+
+    def indexed_columns(self, using, table):
+        """Columns of an FTS5 table, empty if it doesn't exist. Cached per connection alias."""
+        if (using, table) not in self._indexed_columns:
+            with connections[using].cursor() as cursor:
+                cursor.execute(f'PRAGMA table_info({table})')
+                self._indexed_columns[(using, table)] = {row[1] for row in cursor.fetchall()}
+        return self._indexed_columns[(using, table)]
+
+    def search(self, queryset, field_names, text, rank=False):
+        table = self.table_name(queryset.model)
+        if len(text) < self.MIN_LENGTH or not set(field_names) <= self.indexed_columns(queryset.db, table):
+            return self.fallback.search(queryset, field_names, text, rank)
+        escaped_text = text.replace('"', '""')
+        match = f'{{{" ".join(sorted(field_names))}}} : "{escaped_text}"'
+        queryset = queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', (match, )))
+        if rank:
+            opts = queryset.model._meta  # pylint: disable=protected-access
+            pk_column = f'{opts.db_table}.{opts.pk.column}'
+            queryset = queryset.annotate(**{RANK_ANNOTATION: RawSQL(
+                f'SELECT -bm25({table}) FROM {table} WHERE {table} MATCH %s AND rowid = {pk_column}', (match, )
+            )}).order_by(f'-{RANK_ANNOTATION}', 'pk')
+        return queryset
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Full text search with tsvector/tsquery. Matches whole words instead of substrings. The tsvector expression is
+    served by the GIN index built by document_index.
+    """
+    config = 'simple'
+
+    def document(self, field_names):
+        """tsvector of the fields, shared by queries and the index so the planner can match them."""
+        text = Func(
+            *(Coalesce(field_name, Value(''), output_field=TextField()) for field_name in sorted(field_names)),
+            template='(%(expressions)s)', arg_joiner=" || ' ' || ", output_field=TextField(),
+        )
+        return Func(Value(self.config), text, function='to_tsvector')
+
+    def document_index(self, field_names, name):
+        """GIN index to be added with a schema editor (expression indexes can't be declared on models portably)."""
+        from django.contrib.postgres.indexes import GinIndex  # pylint: disable=import-outside-toplevel
+        return GinIndex(self.document(field_names), name=name)
+
+    def search(self, queryset, field_names, text, rank=False):
+        document = self.document(field_names)
+        query = Func(Value(self.config), Value(text), function='plainto_tsquery')
+        queryset = queryset.filter(
+            Func(document, query, template='(%(expressions)s)', arg_joiner=' @@ ', output_field=BooleanField())
+        )
+        if rank:
+            queryset = queryset.annotate(**{RANK_ANNOTATION: Func(
+                document, query, function='ts_rank', output_field=FloatField()
+            )}).order_by(f'-{RANK_ANNOTATION}', 'pk')
+        return queryset
+
+
+class DatabaseSearchBackend(SearchBackend):  # pylint: disable=too-few-public-methods
+    """Dispatch to the best backend for the database each queryset is going to be evaluated on."""
+    def __init__(self, backends=None, default=None):
+        self.backends = backends if backends is not None else {
+            'sqlite': SQLiteFTSSearchBackend(),
+            'postgresql': PostgresSearchBackend(),
+        }
+        self.default = default if default is not None else ContainsSearchBackend()
+
+    def search(self, queryset, field_names, text, rank=False):
+        backend = self.backends.get(connections[queryset.db].vendor, self.default)
+        return backend.search(queryset, field_names, text, rank)
+
+
+def install_sqlite_fts(schema_editor, model, field_names):
+    """
+    Create the FTS5 trigram table for SQLiteFTSSearchBackend and the triggers keeping it in sync on every insert,
+    update and delete (including bulk and queryset operations). Idempotent, so it may be run again after a migration
+    rebuilds the model table, which drops its triggers. Does nothing on SQLite builds without trigram support.
+    """
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        compile_options = {row[0] for row in cursor.fetchall()}
+    if connection.Database.sqlite_version_info < (3, 34, 0) or 'ENABLE_FTS5' not in compile_options:
+        return
+    fts_table = SQLiteFTSSearchBackend.table_name(model)
+    table = model._meta.db_table  # pylint: disable=protected-access
+    pk_column = model._meta.pk.column  # pylint: disable=protected-access
+    columns = ', '.join(sorted(field_names))
+    new_values = ', '.join(f'new.{column}' for column in sorted(field_names))
+    old_values = ', '.join(f'old.{column}' for column in sorted(field_names))
+    insert_new = f'INSERT INTO {fts_table}(rowid, {columns}) VALUES (new.{pk_column}, {new_values});'
+    delete_old = (f"INSERT INTO {fts_table}({fts_table}, rowid, {columns}) "
+                  f"VALUES ('delete', old.{pk_column}, {old_values});")
+    for statement in (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+        f"{columns}, content='{table}', content_rowid='{pk_column}', tokenize='trigram')",
+        f'CREATE TRIGGER IF NOT EXISTS {fts_table}_insert AFTER INSERT ON {table} BEGIN {insert_new} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts_table}_delete AFTER DELETE ON {table} BEGIN {delete_old} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts_table}_update AFTER UPDATE OF {columns} ON {table} '
+        f'BEGIN {delete_old} {insert_new} END',
+        f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')",
+    ):
+        schema_editor.execute(statement, params=None)
+
+
+def uninstall_sqlite_fts(schema_editor, model):
+    """Drop what install_sqlite_fts created."""
+    fts_table = SQLiteFTSSearchBackend.table_name(model)
+    for trigger in ('insert', 'delete', 'update'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {fts_table}_{trigger}', params=None)
+    schema_editor.execute(f'DROP TABLE IF EXISTS {fts_table}', params=None)
@@ -0,0 +1,213 @@
+"""
+Extended features for DRF serializers isolated for reusability.
+"""
+from datetime import date
+from functools import lru_cache
+from types import SimpleNamespace
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.utils import timezone
+from rest_framework import ISO_8601
+from rest_framework.fields import CharField, DateField, DateTimeField, IntegerField
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import HyperlinkedIdentityField, ManyRelatedField, PrimaryKeyRelatedField, RelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer, ReadOnlyField
+from rest_framework.settings import api_settings
+
+
+def split_query_param(request, name):
+    """Get a comma separated query param as a set, or None if it wasn't sent."""
+    if name not in request.query_params:
+        return None
+    return {value.strip() for value in request.query_params[name].split(',') if value.strip()}
+
+
+class SparseFieldsetsMixin:
+    """
+    Let clients choose what reads render. ?fields=a,b renders just those fields (id may be asked for as well) and
+    ?expand=relation renders that relation nested. Once any of them is sent, relations which are not expanded are
+    rendered as their primary key, so they need neither a join nor a nested serializer. Only applies to the top level
+    serializer of GET requests, writes always use every field.
+    """
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
+
+    def get_sparse_fieldset(self):
+        """Get the (fields, expand) requested, fields being None if all of them are. None if not a sparse request."""
+        request = self.context.get('request')
+        root = self.parent if isinstance(self.parent, ListSerializer) else self
+        if request is None or request.method not in SAFE_METHODS or root.parent is not None:
+            return None
+        fields = split_query_param(request, self.fields_query_param)
+        expand = split_query_param(request, self.expand_query_param)
+        if fields is None and expand is None:
+            return None
+        return fields, expand or set()
+
+    def get_fields(self):
+        """Drop the fields which were not requested and flatten relations which were not expanded."""
+        fields = super().get_fields()
+        sparse_fieldset = self.get_sparse_fieldset()
+        if sparse_fieldset is None:
+            return fields
+        requested, expand = sparse_fieldset
+        if requested is not None:
+            if 'id' in requested and 'id' not in fields:
+                fields['id'] = ReadOnlyField()
+            for name in list(fields):
+                if name not in requested:
+                    del fields[name]
+        for name, field in fields.items():
+            many = isinstance(field, ListSerializer)
+            if isinstance(field.child if many else field, BaseSerializer) and name not in expand:
+                source = {'source': field.source} if field.source not in (None, name) else {}
+                fields[name] = PrimaryKeyRelatedField(read_only=True, many=many, **source)
+        return fields
+
+
+def get_loaded_fields(serializer, prefix=''):
+    """
+    Model fields a serializer reads, as paths for QuerySet.only(). Nested serializers for single objects are followed,
+    the ones for many objects are left to prefetch_related. None if it can't be told, e.g. because of model properties.
+    """
+    model = serializer.Meta.model
+    loaded = [prefix + model._meta.pk.name]  # pylint: disable=protected-access
+    for field in serializer.fields.values():
+        if field.write_only or isinstance(field, (HyperlinkedIdentityField, ListSerializer, ManyRelatedField)):
+            continue
+        if field.source == '*' or '.' in field.source:
+            return None
+        try:
+            model_field = model._meta.get_field(field.source)  # pylint: disable=protected-access
+        except FieldDoesNotExist:
+            return None
+        loaded.append(prefix + model_field.name)
+        if isinstance(field, BaseSerializer):
+            nested_loaded = get_loaded_fields(field, f'{prefix}{model_field.name}__')
+            if nested_loaded is None:
+                return None
+            loaded += nested_loaded
+    return loaded
+
+
+def get_flat_field_names(serializer, prefix=''):
+    """Names of the fields a serializer renders, nested serializers for single objects flattened as dotted names."""
+    names = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, BaseSerializer) and not isinstance(field, ListSerializer):
+            names += get_flat_field_names(field, f'{prefix}{name}.')
+        else:
+            names.append(prefix + name)
+    return names
+
+
+ROW_PLACEHOLDER = 'ROW-PLACEHOLDER'
+
+
+def get_converter(field):  # pylint: disable=too-many-return-statements
+    """
+    Function producing the same representation as field.to_representation for a value read from the database,
+    with the field's settings resolved once instead of on every value. None means the value is used as is.
+    """
+    field_type = type(field)
+    if isinstance(field, PrimaryKeyRelatedField):
+        return None if field.pk_field is None else field.pk_field.to_representation
+    if field_type is ReadOnlyField:
+        return None
+    if field_type is IntegerField:
+        return int
+    if field_type is CharField:
+        return str
+    if field_type is DateField and str(getattr(field, 'format', api_settings.DATE_FORMAT)).lower() == ISO_8601:
+        return date.isoformat
+    if field_type is DateTimeField and str(getattr(field, 'format', api_settings.DATETIME_FORMAT)).lower() == ISO_8601:
+        field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if field_timezone is not None:
+            def to_iso_8601(value):
+                if not timezone.is_aware(value):
+                    return field.to_representation(value)
+                value = value.astimezone(field_timezone).isoformat()
+                return value[:-6] + 'Z' if value.endswith('+00:00') else value
+            return to_iso_8601
+    return field.to_representation
+
+
+def _compile_column(paths, path):
+    """Expression reading a values_list() path from the row, adding the path if it's not read yet."""
+    if path not in paths:
+        paths.append(path)
+    return f'row[{paths.index(path)}]'
+
+
+def _compile_field(field, model, prefix, paths, namespace):  # pylint: disable=too-many-return-statements
+    """Expression rendering a field from the row, or None if it can't be read from a values_list()."""
+    opts = model._meta  # pylint: disable=protected-access
+    if isinstance(field, HyperlinkedIdentityField):
+        lookup_field = opts.pk if field.lookup_field == 'pk' else opts.get_field(field.lookup_field)
+        if not isinstance(lookup_field, models.IntegerField):
+            return None
+        url = field.to_representation(SimpleNamespace(**{'pk': ROW_PLACEHOLDER, field.lookup_field: ROW_PLACEHOLDER}))
+        url_parts = str(url).split(ROW_PLACEHOLDER)
+        if len(url_parts) != 2:
+            return None
+        column = _compile_column(paths, prefix + lookup_field.attname)
+        # Passed in the namespace, as they hold the host of the request, so the code compiled is the same for any
+        name = f'url_{len(namespace)}'
+        namespace[name] = url_parts
+        return f'{name}[0] + str({column}) + {name}[1]'
+    if isinstance(field, (ListSerializer, ManyRelatedField)) or field.source == '*' or '.' in field.source:
+        return None
+    try:
+        model_field = opts.get_field(field.source)
+    except FieldDoesNotExist:
+        return None
+    if not model_field.concrete:
+        return None
+    column = _compile_column(paths, prefix + model_field.attname)
+    if isinstance(field, BaseSerializer):
+        nested = _compile_serializer(field, f'{prefix}{model_field.name}__', paths, namespace)
+        return None if nested is None else f'(None if {column} is None else {nested})'
+    if isinstance(field, RelatedField) and not isinstance(field, PrimaryKeyRelatedField):
+        return None
+    converter = get_converter(field)
+    if converter is None:
+        return column
+    name = f'convert_{len(namespace)}'
+    namespace[name] = converter
+    return f'(None if {column} is None else {name}({column}))'
+
+
+def _compile_serializer(serializer, prefix, paths, namespace):
+    """Expression rendering a serializer from the row, or None if it can't be read from a values_list()."""
+    items = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        expression = _compile_field(field, serializer.Meta.model, prefix, paths, namespace)
+        if expression is None:
+            return None
+        items.append(f'{name!r}: {expression}')
+    return f'{{{", ".join(items)}}}'
+
+
+@lru_cache(maxsize=256)
+def compile_source(source):
+    """Code of the source of a row encoder, compiled once for every serializer rendered the same way."""
+    return compile(source, '<row encoder>', 'eval')
+
+
+def compile_row_encoder(serializer):
+    """
+    Compile a function rendering rows of QuerySet.values_list(*paths) exactly like the serializer renders model
+    instances, but without building the instances nor going through the fields one call at a time.
+    Returns (paths, encode) or None if the serializer has fields which can't be read from a values_list(), such as
+    properties, method fields or many relations.
+    """
+    paths, namespace = [], {}
+    expression = _compile_serializer(serializer, '', paths, namespace)
+    if expression is None:
+        return None
+    return paths, eval(compile_source(f'lambda row: {expression}'), namespace)  # pylint: disable=eval-used
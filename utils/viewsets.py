@@ -1,9 +1,33 @@
 """
 Extended features for DRF viewsets isolated for reusability.
 """
+import re
 from abc import ABC, abstractmethod
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from datetime import timedelta
+from functools import lru_cache
+from hashlib import sha1
 
+from django.db import IntegrityError, transaction
 from django.db.models import Q
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer, ListSerializer
+from rest_framework.validators import UniqueTogetherValidator
+
+from utils.cache import GenerationalCache
+from utils.datetime import from_microseconds, to_microseconds, utc_now
+from utils.db.routers import is_pinned, pick_replica, pin, read_from, set_read_alias
+from utils.metrics import label_request, measured
+from utils.renderers import CSVRenderer, NDJSONRenderer
+from utils.search import ContainsSearchBackend
+from utils.serializers import compile_row_encoder, get_flat_field_names, get_loaded_fields
 
 
 class Filter(ABC):  # pylint: disable=too-few-public-methods
@@ -21,9 +45,67 @@ class Filter(ABC):  # pylint: disable=too-few-public-methods
                 raise ValueError('Must provide fields mapping for this filter.')
         self.fields_mapping = fields_mapping
 
+    @property
+    def parameter_names(self):
+        """Names of the query params the filter filters by."""
+        return set(self.fields_mapping)
+
+
+class LookupFilter(Filter):
+    """
+    Filter made of field lookups on the values of query params. FilterableViewSetMixin merges the lookups of all of
+    its lookup filters into a single Q, so the queryset is filtered (and cloned) once and the database gets every
+    condition on a field together, e.g. both bounds of a range to look up in an index.
+    """
+    @property
+    @abstractmethod
+    def parameter_names(self):
+        """Names of every query param the filter reads."""
+
+    @abstractmethod
+    def get_terms(self, parameter_names):
+        """
+        Lookups for the query params sent (parameter_names) as (parameter name, lookup, convert) tuples: the value of
+        the param is passed to convert, and the lookup is skipped if it returns None.
+        """
+
+    def __call__(self, queryset, request):
+        query = compile_lookup_query((self, ), request.query_params)
+        return queryset.filter(query) if query else queryset
+
+
+@lru_cache(maxsize=None)
+def get_lookup_parameter_names(lookup_filters):
+    """Names of every query param read by any of the lookup filters."""
+    return frozenset().union(*(lookup_filter.parameter_names for lookup_filter in lookup_filters))
+
+
+@lru_cache(maxsize=1024)
+def get_lookup_terms(lookup_filters, parameter_names):
+    """Terms (see LookupFilter.get_terms) of the lookup filters for a shape of query string: the params sent."""
+    return tuple(term for lookup_filter in lookup_filters for term in lookup_filter.get_terms(parameter_names))
+
+
+def compile_lookup_query(lookup_filters, query_params):
+    """
+    Single Q with the lookups of the lookup filters (a tuple) for the query params. Query strings sending the same
+    params share the terms, so only the values are read from each of them.
+    """
+    known_names = get_lookup_parameter_names(lookup_filters)
+    terms = get_lookup_terms(lookup_filters, frozenset(name for name in query_params if name in known_names))
+    lookups = []
+    for parameter_name, lookup, convert in terms:
+        value = convert(query_params[parameter_name])
+        if value is not None:
+            lookups.append((lookup, value))
+    return Q(*lookups)
+
 
 class FilterableViewSetMixin:
-    """Easily implement dynamic queryset filtering on any viewset by just setting the filters attribute."""
+    """
+    Easily implement dynamic queryset filtering on any viewset by just setting the filters attribute. Lookup filters
+    are merged into a single filter() call (see LookupFilter), then the other ones are applied in order.
+    """
     @property
     @abstractmethod
     def filters(self):
@@ -32,11 +114,340 @@ class FilterableViewSetMixin:
     def get_queryset(self):
         """Apply all filters to queryset and return it."""
         queryset = super().get_queryset()
+        lookup_filters = tuple(
+            queryset_filter for queryset_filter in self.filters if isinstance(queryset_filter, LookupFilter)
+        )
+        if lookup_filters:
+            query = compile_lookup_query(lookup_filters, self.request.query_params)
+            if query:
+                queryset = queryset.filter(query)
         for queryset_filter in self.filters:
-            queryset = queryset_filter(queryset, self.request)
+            if not isinstance(queryset_filter, LookupFilter):
+                queryset = queryset_filter(queryset, self.request)
+        return queryset
+
+    def get_filter_parameter_names(self):
+        """Names of the query params sent in this request which any of the filters filters by."""
+        parameter_names = set().union(*(queryset_filter.parameter_names for queryset_filter in self.filters))
+        return parameter_names & set(self.request.query_params)
+
+
+def get_eager_loading(serializer, prefix=''):
+    """
+    Relations a serializer renders as nested objects, whether declared or built from Meta.depth.
+    Returns the paths to pass to select_related (single objects) and prefetch_related (many objects).
+    """
+    select_related, prefetch_related = [], []
+    for field in serializer.fields.values():
+        many = isinstance(field, ListSerializer)
+        nested = field.child if many else field
+        if field.write_only or field.source == '*' or not isinstance(nested, BaseSerializer):
+            continue
+        path = prefix + field.source.replace('.', '__')
+        nested_select_related, nested_prefetch_related = get_eager_loading(nested, f'{path}__')
+        if many:
+            prefetch_related += [path] + nested_select_related + nested_prefetch_related
+        else:
+            select_related += [path] + nested_select_related
+            prefetch_related += nested_prefetch_related
+    return select_related, prefetch_related
+
+
+class EagerLoadingMixin:  # pylint: disable=too-few-public-methods
+    """
+    Load the relations nested by the serializer along with the queryset, instead of one query per object.
+    When the serializer renders a sparse fieldset (see SparseFieldsetsMixin) only the columns it reads are selected.
+    """
+    def get_queryset(self):
+        """Add select_related, prefetch_related and only for the serializer used in this request."""
+        queryset = super().get_queryset()
+        serializer = self.get_serializer()
+        select_related, prefetch_related = get_eager_loading(serializer)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        if getattr(serializer, 'get_sparse_fieldset', lambda: None)() is not None:
+            loaded_fields = get_loaded_fields(serializer)
+            if loaded_fields is not None:
+                queryset = queryset.only(*loaded_fields)
         return queryset
 
 
+def without_prefetch(queryset):
+    """The queryset without prefetch_related lookups, which combined querysets (e.g. unions) can't have anyway."""
+    return queryset if queryset.query.combinator else queryset.prefetch_related(None)
+
+
+class FastListMixin:
+    """
+    Opt-in (set fast_list_rendering) faster list action. Rows are read with QuerySet.values_list() and rendered by a
+    function compiled from the serializer (see compile_row_encoder), skipping model instances and field by field
+    serialization. The JSON is byte-identical to the serializer's. Other renderers (e.g. the browsable API) and
+    serializers the encoder can't handle use the regular list action.
+    """
+    fast_list_rendering = False
+    # Read from the rows by the paginator besides the serializer's fields, e.g. the position of KeysetPagination cursors
+    pagination_fields = ('id', )
+
+    def get_row_encoder(self):
+        """Get (paths, encode) for the serializer used in this request, or None to use the regular list action."""
+        if not self.fast_list_rendering or self.request.accepted_renderer.format != 'json':
+            return None
+        return compile_row_encoder(self.get_serializer())
+
+    def list(self, request, *args, **kwargs):
+        """List the objects, from values_list() rows when possible."""
+        row_encoder = self.get_row_encoder()
+        if row_encoder is None:
+            return super().list(request, *args, **kwargs)
+        paths, encode = row_encoder
+        # After the serializer's, so the encoder's indexes still match
+        paths = [*paths, *(field for field in self.pagination_fields if field not in paths)]
+        queryset = without_prefetch(self.filter_queryset(self.get_queryset())).values_list(*paths, named=True)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response([encode(row) for row in page])
+        return Response([encode(row) for row in queryset])
+
+
+class ExportMixin:
+    """
+    Export action streaming every object the list action would show, as NDJSON (default) or CSV, picked with the
+    Accept header or ?format=. Objects are read with QuerySet.iterator() and rendered a chunk at a time, so memory use
+    doesn't grow with the number of objects and the response starts before the whole query is read.
+    """
+    export_chunk_size = 2000
+
+    def get_export_rows(self, queryset, serializer):
+        """Iterate over the representation of every object, from values_list() rows when the serializer allows it."""
+        row_encoder = compile_row_encoder(serializer)
+        if row_encoder is None:
+            instances = queryset.iterator(chunk_size=self.export_chunk_size)
+            return (serializer.to_representation(instance) for instance in instances)
+        paths, encode = row_encoder
+        rows = without_prefetch(queryset).values_list(*paths, named=True)
+        return (encode(row) for row in rows.iterator(chunk_size=self.export_chunk_size))
+
+    @action(detail=False, methods=['GET'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request, format=None):  # pylint: disable=redefined-builtin,unused-argument
+        """Stream every object, without pagination."""
+        serializer = self.get_serializer()
+        renderer = request.accepted_renderer
+        rows = self.get_export_rows(self.filter_queryset(self.get_queryset()), serializer)
+        content_type = renderer.media_type
+        if renderer.charset is not None:
+            content_type += f'; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            renderer.stream(rows, get_flat_field_names(serializer), self.export_chunk_size), content_type=content_type
+        )
+        model_name = serializer.Meta.model._meta.model_name  # pylint: disable=protected-access
+        response['Content-Disposition'] = f'attachment; filename="{model_name}s.{renderer.format}"'
+        return response
+
+
+list_cache = GenerationalCache('list')
+
+
+class ListCacheMixin:
+    """
+    Cache the JSON of the list action per scope (the user by default) and request URL, with a strong ETag so clients
+    sending If-None-Match get a 304. A hit takes no queries besides authentication. Every write request to a viewset
+    using the mixin bumps the generation of its scope, invalidating all of its cached lists (so viewsets sharing
+    list_cache and scope invalidate each other's lists). Writes made elsewhere must bump it too, e.g. from signals.
+    """
+    list_cache = list_cache
+    list_cache_key = None
+
+    def get_list_cache_scope(self):
+        """Scope of the cached lists, whose generation is bumped by writes. None to skip caching."""
+        return self.request.user.pk
+
+    def get_list_cache_key(self, request):
+        """Key of the list in its scope's generation. Covers the host, path, query and accepted media type."""
+        url = request.build_absolute_uri(request.path)
+        query = sorted(request.query_params.lists())
+        return sha1(f'{self.basename}|{url}|{query}|{request.accepted_media_type}'.encode()).hexdigest()
+
+    @staticmethod
+    def is_not_modified(request, etag):
+        """Check whether the client has the representation with this ETag already."""
+        etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        return '*' in etags or etag in etags or f'W/{etag}' in etags
+
+    def list(self, request, *args, **kwargs):
+        """Respond from the cache when possible, remembering the key to cache the response otherwise."""
+        scope = self.get_list_cache_scope()
+        if scope is None or request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        generation = self.list_cache.get_generation(scope)
+        key = self.get_list_cache_key(request)
+        cached = self.list_cache.get(scope, generation, key)
+        if cached is None:
+            self.list_cache_key = (scope, generation, key)
+            return super().list(request, *args, **kwargs)
+        etag, content_type, content = cached
+        response = HttpResponseNotModified() if self.is_not_modified(request, etag) else HttpResponse(
+            content, content_type=content_type
+        )
+        response['ETag'] = etag
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Cache the list once rendered, or bump the generation of the scope after writes."""
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in SAFE_METHODS:
+            scope = self.get_list_cache_scope()
+            if scope is not None:
+                self.list_cache.bump(scope)
+        elif self.list_cache_key is not None and response.status_code == status.HTTP_200_OK:
+            response.render()
+            etag = quote_etag(sha1(response.content).hexdigest())
+            self.list_cache.set(*self.list_cache_key, (etag, response['Content-Type'], response.content))
+            response['ETag'] = etag
+            if self.is_not_modified(request, etag):
+                not_modified = HttpResponseNotModified()
+                not_modified['ETag'] = etag
+                return not_modified
+        return response
+
+
+class SyncMixin:
+    """
+    Sync action at <prefix>/sync/ for offline clients. The first request gets every object, later ones send ?since=
+    with the token of the previous response and get the objects changed since then (by sync_updated_field) and the
+    ids of the objects deleted since then (see get_deleted_ids). Objects come sync_page_size at a time, ordered by
+    sync_updated_field and id: keep requesting with the new token while more is true. When reset is true, the client
+    should drop what it has and keep the objects it gets from then on.
+    """
+    sync_updated_field = 'updated_at'
+    sync_page_size = 500
+    # Timestamps are taken before writes commit, so the last sync_margin is sent again by the next sync, which then
+    # gets the writes committed after this one read past their timestamp.
+    sync_margin = timedelta(seconds=5)
+    # How long deletions are tracked, None if forever. Tokens older than this get a reset.
+    sync_retention = None
+
+    def get_deleted_ids(self, since):  # pylint: disable=unused-argument
+        """Ids of the objects deleted after since. Deletions aren't tracked by default."""
+        return []
+
+    @staticmethod
+    def encode_sync_token(cursor, deleted_since):
+        """Opaque token of the last object sent, as (updated, id) or None if none was, and the last deletions check."""
+        updated, last_id = cursor if cursor is not None else (None, 0)
+        values = ('' if updated is None else to_microseconds(updated), last_id, to_microseconds(deleted_since))
+        return urlsafe_b64encode('.'.join(map(str, values)).encode()).decode()
+
+    @staticmethod
+    def decode_sync_token(token):
+        """Get the (cursor, deleted_since) of a token."""
+        try:
+            updated, last_id, deleted_since = urlsafe_b64decode(token.encode()).decode().split('.')
+            cursor = None if not updated else (from_microseconds(int(updated)), int(last_id))
+            return cursor, from_microseconds(int(deleted_since))
+        except (DecodeError, OverflowError, UnicodeError, ValueError) as error:
+            raise ValidationError({'since': ['Invalid token.']}) from error
+
+    @action(detail=False, methods=['GET'])
+    def sync(self, request):
+        """Get the objects changed and deleted since the token, or every object without one."""
+        now = utc_now()
+        horizon = now - self.sync_margin
+        token = request.query_params.get('since')
+        cursor, deleted_since = self.decode_sync_token(token) if token else (None, None)
+        retention = self.sync_retention
+        reset = deleted_since is None or (retention is not None and deleted_since < now - retention)
+        if reset:
+            cursor, deleted = None, []
+        else:
+            deleted = list(self.get_deleted_ids(deleted_since))
+        field = self.sync_updated_field
+        queryset = self.get_queryset().order_by(field, 'pk')
+        if cursor is not None:
+            queryset = queryset.filter(Q(**{f'{field}__gt': cursor[0]}) | Q(**{field: cursor[0], 'pk__gt': cursor[1]}))
+        objects = list(queryset[:self.sync_page_size + 1])
+        more = len(objects) > self.sync_page_size
+        objects = objects[:self.sync_page_size]
+        # Continue after the last object, or from the margin once done
+        cursor = (getattr(objects[-1], field), objects[-1].pk) if more else (horizon, 0)
+        return Response({
+            'changed': self.get_serializer(objects, many=True).data,
+            'deleted': deleted,
+            'since': self.encode_sync_token(cursor, horizon),
+            'more': more,
+            'reset': reset,
+        })
+
+
+class MetricsMixin:
+    """
+    Label the metrics of the request (see utils.metrics.MetricsMiddleware) with the viewset and action, and measure
+    the time spent serializing, including the row encoders of FastListMixin, and rendering.
+    """
+    def initial(self, request, *args, **kwargs):
+        """Label the metrics first, so requests failing authentication or permissions are labelled too."""
+        label_request(type(self).__name__, self.action)
+        super().initial(request, *args, **kwargs)
+
+    def perform_content_negotiation(self, request, force=False):
+        """Measure the rendering of the renderer chosen."""
+        renderer, media_type = super().perform_content_negotiation(request, force)
+        renderer.render = measured('render', renderer.render)
+        return renderer, media_type
+
+    def get_serializer(self, *args, **kwargs):
+        """Measure the serialization of objects."""
+        serializer = super().get_serializer(*args, **kwargs)
+        serializer.to_representation = measured('serialize', serializer.to_representation)
+        return serializer
+
+    def get_row_encoder(self):
+        """Measure the encoding of rows (see FastListMixin)."""
+        row_encoder = super().get_row_encoder()
+        if row_encoder is None:
+            return None
+        paths, encode = row_encoder
+        return paths, measured('serialize', encode)
+
+
+class ReplicaReadsMixin:
+    """
+    Read from a replica (see utils.db.routers) in requests with safe methods, unless the user wrote recently: requests
+    writing successfully pin their user to the primary, so they read their own writes. Actions in primary_actions
+    always read from the primary, e.g. those which can't miss writes the replica is lagging behind on.
+    """
+    primary_actions = ()
+    read_alias = None
+
+    def dispatch(self, request, *args, **kwargs):
+        """Read from the primary unless initial chooses a replica, and only within this request."""
+        with read_from(None):
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        """Choose a replica once the user is authenticated, unless the request must read from the primary."""
+        super().initial(request, *args, **kwargs)
+        if (
+            request.method in SAFE_METHODS and self.action not in self.primary_actions
+            and not is_pinned(request.user.pk)
+        ):
+            self.read_alias = pick_replica()
+            set_read_alias(self.read_alias)
+
+    def get_queryset(self):
+        """Bind the queryset to the chosen replica, so it's read from there even after dispatch, e.g. by exports."""
+        queryset = super().get_queryset()
+        return queryset if self.read_alias is None else queryset.using(self.read_alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Pin the user to the primary after successful writes."""
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in SAFE_METHODS and response.status_code < 400 and request.user.is_authenticated:
+            pin(request.user.pk)
+        return response
+
+
 class OwnedObjectMixin:
     """Viewsets inheriting from this class only display the objects owned by the authenticated user."""
     def get_queryset(self):
@@ -54,51 +465,224 @@ class OwnedObjectMixin:
             request.data._mutable = False  # pylint: disable=protected-access
         return super().create(request, *args, **kwargs)
 
+    def get_bulk_items(self, request):
+        """When writing objects in bulk (see BulkModelMixin), assign the user to all of them."""
+        return [
+            {**item, 'user_id': request.user.id} if isinstance(item, dict) else item
+            for item in super().get_bulk_items(request)
+        ]
+
+
+class BulkModelMixin:
+    """
+    Create, partially update and delete many objects with a single request to <prefix>/bulk/, in a single transaction.
+    Bodies are JSON lists: of objects to create, of objects with their id to update, or of ids to delete.
+    Nothing is written unless every item is valid, otherwise a list with the errors of each item is returned.
+    """
+    bulk_batch_size = 1000
+    bulk_max_items = 10000
+
+    def get_bulk_items(self, request):
+        """Get the list of items sent in the request body."""
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of items.']})
+        if len(request.data) > self.bulk_max_items:
+            raise ValidationError({'non_field_errors': [f'Send at most {self.bulk_max_items} items.']})
+        return request.data
+
+    def get_bulk_ids(self, items, get_id=lambda item: item):
+        """Parse the id of every item, raising a list of errors for items without a valid one."""
+        ids, errors = [], []
+        for item in items:
+            try:
+                ids.append(int(get_id(item)))
+                errors.append({})
+            except (KeyError, TypeError, ValueError):
+                ids.append(None)
+                errors.append({'id': ['A valid integer is required.']})
+        if any(errors):
+            raise ValidationError(errors)
+        return ids
+
+    def bulk_changed(self, change, ids):
+        """
+        Hook called after bulk creates and updates (change is 'created' or 'updated'), which don't send model signals.
+        ids is None when they're not known, e.g. after a bulk_create on databases which don't return them. Deletes
+        send post_delete for every object.
+        """
+
+    def perform_bulk_create(self, objects):
+        """Insert the new objects. Runs in the bulk transaction, so overrides may write what's derived from them too."""
+        self.get_queryset().model.objects.bulk_create(objects, batch_size=self.bulk_batch_size)
+
+    def perform_bulk_update(self, instances, fields):
+        """Write the fields of the updated objects. Runs in the bulk transaction, like perform_bulk_create."""
+        self.get_queryset().model.objects.bulk_update(instances, fields, batch_size=self.bulk_batch_size)
+
+    def get_bulk_conflict_message(self):
+        """
+        Message of the validation error for constraint violations, which each database words its own way (and with
+        SQL details). Like the one of the unique together validator of single object writes, if the model has any.
+        """
+        unique_together = self.get_queryset().model._meta.unique_together  # pylint: disable=protected-access
+        if unique_together:
+            return UniqueTogetherValidator.message.format(field_names=', '.join(unique_together[0]))
+        return 'The items conflict with existing objects or with each other.'
+
+    def bulk_write(self, write):
+        """Run the writes in a single transaction, turning constraint violations into a validation error."""
+        try:
+            with transaction.atomic():
+                return write()
+        except IntegrityError as error:
+            raise ValidationError({'non_field_errors': [self.get_bulk_conflict_message()]}) from error
 
-class DateFilter(Filter):  # pylint: disable=too-few-public-methods
-    """Filter by a list date. Other than exact, relative values (lt, lte, gt, gte) are supported."""
+    @action(detail=False, methods=['POST'])
+    def bulk(self, request):
+        """Create every object in the list."""
+        serializer = self.get_serializer(data=self.get_bulk_items(request), many=True)
+        serializer.is_valid(raise_exception=True)
+        model = self.get_queryset().model
+        objects = [model(**attributes) for attributes in serializer.validated_data]
+        self.bulk_write(lambda: self.perform_bulk_create(objects))
+        ids = [instance.pk for instance in objects]
+        self.bulk_changed('created', None if None in ids else ids)
+        return Response({'count': len(objects)}, status=status.HTTP_201_CREATED)
+
+    @bulk.mapping.patch
+    def bulk_update(self, request):
+        """Partially update every object in the list, identified by its id."""
+        items = self.get_bulk_items(request)
+        ids = self.get_bulk_ids(items, lambda item: item['id'])
+        instances = self.get_queryset().in_bulk(ids)
+        errors, changed_fields = [], set()
+        for object_id, item in zip(ids, items):
+            if object_id not in instances:
+                errors.append({'id': ['Not found.']})
+                continue
+            serializer = self.get_serializer(instances[object_id], data=item, partial=True)
+            if not serializer.is_valid():
+                errors.append(serializer.errors)
+                continue
+            errors.append({})
+            for attribute, value in serializer.validated_data.items():
+                if getattr(instances[object_id], attribute) != value:
+                    setattr(instances[object_id], attribute, value)
+                    changed_fields.add(attribute)
+        if any(errors):
+            raise ValidationError(errors)
+        if changed_fields:
+            # bulk_update() doesn't go through save(), which sets auto_now fields such as updated_at
+            for field in self.get_queryset().model._meta.concrete_fields:  # pylint: disable=protected-access
+                if getattr(field, 'auto_now', False):
+                    for instance in instances.values():
+                        field.pre_save(instance, add=False)
+                    changed_fields.add(field.name)
+            self.bulk_write(lambda: self.perform_bulk_update(list(instances.values()), sorted(changed_fields)))
+            self.bulk_changed('updated', list(instances))
+        return Response({'count': len(instances)})
+
+    @bulk.mapping.delete
+    def bulk_destroy(self, request):
+        """Delete every object whose id is in the list. Ids which don't exist are ignored."""
+        ids = self.get_bulk_ids(self.get_bulk_items(request))
+        queryset = self.get_queryset()
+        _, deleted = self.bulk_write(lambda: queryset.filter(pk__in=ids).delete())
+        return Response({'count': deleted.get(queryset.model._meta.label, 0)})  # pylint: disable=protected-access
+
+
+class DateFilter(LookupFilter):
+    """
+    Filter by a list date. Other than exact, relative values (lt, lte, gt, gte) are supported, and combined into ranges
+    when several of them are sent, e.g. date__gte and date__lt.
+    """
     DEFAULT_FIELDS_MAPPING = {
         'date': 'date'
     }
+    LOOKUPS = ('', '__lt', '__lte', '__gt', '__gte')
 
-    def __call__(self, queryset, request):
-        for parameter_name, field_name in self.fields_mapping.items():
-            if parameter_name in request.query_params:
-                queryset = queryset.filter(**{field_name: request.query_params[parameter_name]})
-            elif f'{parameter_name}__lt' in request.query_params:
-                queryset = queryset.filter(**{f'{field_name}__lt': request.query_params[f'{parameter_name}__lt']})
-            elif f'{parameter_name}__lte' in request.query_params:
-                queryset = queryset.filter(**{f'{field_name}__lte': request.query_params[f'{parameter_name}__lte']})
-            elif f'{parameter_name}__gt' in request.query_params:
-                queryset = queryset.filter(**{f'{field_name}__gt': request.query_params[f'{parameter_name}__gt']})
-            elif f'{parameter_name}__gte' in request.query_params:
-                queryset = queryset.filter(**{f'{field_name}__gte': request.query_params[f'{parameter_name}__gte']})
-        return queryset
+    @property
+    def parameter_names(self):
+        return {f'{parameter_name}{lookup}' for parameter_name in self.fields_mapping for lookup in self.LOOKUPS}
+
+    def get_terms(self, parameter_names):
+        return [
+            (f'{parameter_name}{lookup}', f'{field_name}{lookup}', str)
+            for parameter_name, field_name in self.fields_mapping.items() for lookup in self.LOOKUPS
+            if f'{parameter_name}{lookup}' in parameter_names
+        ]
 
 
-class CheckNoneFilter(Filter):  # pylint: disable=too-few-public-methods
+class CheckNoneFilter(LookupFilter):
     """Allow filtering objects based on whether a field is empty or not."""
     EXISTS_KEYWORDS = {'true', 'exists', 'not none', 'not-none', 'not_none', 'notnone', 'filled', 'populated'}
     EMPTY_KEYWORDS = {'false', 'not exists', 'notexists', 'not-exists', 'not_exists', 'none', 'empty'}
 
-    def __call__(self, queryset, request):
+    @property
+    def parameter_names(self):
+        return set(self.fields_mapping)
+
+    @classmethod
+    def is_empty(cls, value):
+        """Whether the value asks for empty fields, or None if it's not a keyword."""
+        value = value.lower()
+        if value in cls.EXISTS_KEYWORDS:
+            return False
+        if value in cls.EMPTY_KEYWORDS:
+            return True
+        return None
+
+    def get_terms(self, parameter_names):
+        return [
+            (parameter_name, f'{field_name}__isnull', self.is_empty)
+            for parameter_name, field_name in self.fields_mapping.items() if parameter_name in parameter_names
+        ]
+
+
+class ForeignKeyFilter(LookupFilter):
+    """Filter by the id of a related object, or by not having one with none. Other values don't filter."""
+    NONE_KEYWORD = 'none'
+    # ASCII digits only (str.isdigit accepts others int() can't parse), few enough to fit a signed 64 bit integer
+    ID_PATTERN = re.compile(r'[0-9]{1,18}')
+
+    @property
+    def parameter_names(self):
+        return set(self.fields_mapping)
+
+    @classmethod
+    def to_id(cls, value):
+        """The id sent, or None if it's not one."""
+        return int(value) if cls.ID_PATTERN.fullmatch(value) else None
+
+    @classmethod
+    def is_none(cls, value):
+        """True if the value asks for objects without a related one, otherwise None."""
+        return True if value.lower() == cls.NONE_KEYWORD else None
+
+    def get_terms(self, parameter_names):
+        terms = []
         for parameter_name, field_name in self.fields_mapping.items():
-            filter_value = request.query_params.get(parameter_name, '').lower()
-            if filter_value in self.EXISTS_KEYWORDS:
-                queryset = queryset.filter(**{f'{field_name}__isnull': False})
-            elif filter_value in self.EMPTY_KEYWORDS:
-                queryset = queryset.filter(**{f'{field_name}__isnull': True})
-        return queryset
+            if parameter_name in parameter_names:
+                terms += [
+                    (parameter_name, f'{field_name}_id', self.to_id),
+                    (parameter_name, f'{field_name}__isnull', self.is_none),
+                ]
+        return terms
 
 
 class TextFilter(Filter):  # pylint: disable=too-few-public-methods
-    """Check if provided fields contain the provided text."""
+    """
+    Check if provided fields contain the provided text. Matching is delegated to a search backend, which may also rank
+    the results by relevance when <parameter>__rank=true is sent.
+    """
+    def __init__(self, fields_mapping=None, backend=None):
+        super().__init__(fields_mapping)
+        self.backend = backend if backend is not None else ContainsSearchBackend()
+
     def __call__(self, queryset, request):
         for parameter_name, field_names in self.fields_mapping.items():
             filter_value = request.query_params.get(parameter_name, '').lower()
             if filter_value:
-                query = Q()
-                for field_name in field_names:
-                    query |= Q(**{f'{field_name}__icontains': filter_value})
-                queryset = queryset.filter(query).distinct()
+                rank = request.query_params.get(f'{parameter_name}__rank', '').lower() == 'true'
+                queryset = self.backend.search(queryset, field_names, filter_value, rank=rank)
         return queryset